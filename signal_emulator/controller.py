@@ -2,6 +2,8 @@ import csv
 import os
 from collections import defaultdict
 from dataclasses import dataclass, fields
+from functools import lru_cache
+from operator import attrgetter
 from pathlib import Path
 from typing import Optional, List, Union
 
@@ -12,13 +14,44 @@ from signal_emulator.enums import PhaseType, PhaseTermType, PhaseTypeAndTermType
 from signal_emulator.utilities.utility_functions import load_json_to_dict
 
 
+@lru_cache(maxsize=None)
+def get_export_fields(item_class):
+    """
+    Function to get the dataclass fields of an item class that are exported, object references are excluded.
+    The result is cached per item class
+    :param item_class: dataclass
+    :return: tuple of Field
+    """
+    return tuple(field for field in fields(item_class) if field.type not in {object, Optional[object]})
+
+
 class BaseCollection:
     WRITE_TO_DATABASE = False
     TABLE_NAME = None
     ITEM_CLASS = None
+    # collections whose items are referenced by the linked object references of other items
+    INVALIDATES_LINKS = False
+    # field the rows are partitioned by for incremental database writes, the whole table is one partition if None
+    PARTITION_FIELD = "controller_key"
     DATACLASS_TO_SQL_TYPE_MAP = {
         List: sqlalchemy.ARRAY(sqlalchemy.types.String),
         List[str]: sqlalchemy.ARRAY(sqlalchemy.types.String),
+        int: sqlalchemy.types.BigInteger(),
+        Optional[int]: sqlalchemy.types.BigInteger(),
+        float: sqlalchemy.types.Float(precision=53),
+        Optional[float]: sqlalchemy.types.Float(precision=53),
+        bool: sqlalchemy.types.Boolean(),
+        str: sqlalchemy.types.Text(),
+        Optional[str]: sqlalchemy.types.Text(),
+    }
+    DATACLASS_TO_ARROW_TYPE_MAP = {
+        int: "int64",
+        Optional[int]: "int64",
+        float: "float64",
+        Optional[float]: "float64",
+        bool: "bool_",
+        str: "string",
+        Optional[str]: "string",
     }
 
     def __init__(self, item_data=None, signal_emulator=None):
@@ -43,6 +76,7 @@ class BaseCollection:
             else:
                 item = self.ITEM_CLASS(**item_row, signal_emulator=None)
             self.data[item.get_key()] = item
+            self.add_to_index(item)
 
     def __iter__(self):
         return iter(self.data.values())
@@ -56,14 +90,16 @@ class BaseCollection:
 
     def add_item(self, data, signal_emulator=None, valid_only=False):
         item = self.ITEM_CLASS(signal_emulator=signal_emulator, **data)
-        if valid_only and item.is_valid:
-            self.data[item.get_key()] = item
-        elif not valid_only:
-            self.data[item.get_key()] = item
+        if not valid_only or item.is_valid:
+            self.add_instance(item)
 
     def add_instance(self, item):
         if isinstance(item, self.ITEM_CLASS):
+            if item.get_key() in self.data:
+                self.remove_from_index(self.data[item.get_key()])
             self.data[item.get_key()] = item
+            self.add_to_index(item)
+            self.invalidate_links()
         else:
             self.signal_emulator.logger(
                 f"Item: {item} cannot be added to Collection: {self.__class__.__name__} as it is not the correct type"
@@ -93,43 +129,120 @@ class BaseCollection:
 
     def remove_by_key(self, key):
         if key in self.data:
-            del self.data[key]
+            self.remove_from_index(self.data.pop(key))
+            self.invalidate_links()
 
     def key_exists(self, key):
         return key in self.data
 
     def remove_all(self):
+        for item in self:
+            self.remove_from_index(item)
         self.data = {}
+        self.invalidate_links()
 
-    def to_dataframe(self):
-        all_fields = fields(self.ITEM_CLASS)
-        item_data = []
+    def add_to_index(self, item):
+        """
+        Method called when an item is added to the collection, collections with secondary indexes add the item to them
+        :param item: item added
+        :return: None
+        """
+
+    def remove_from_index(self, item):
+        """
+        Method called when an item is removed or replaced in the collection, collections with secondary indexes
+        remove the item from them
+        :param item: item removed
+        :return: None
+        """
+
+    def invalidate_links(self):
+        """
+        Method to invalidate the linked object references of all items when a collection they reference changes
+        :return: None
+        """
+        if self.INVALIDATES_LINKS:
+            self.signal_emulator.link_version += 1
+
+    def link(self):
+        """
+        Method to resolve the linked object references of all items in the collection
+        :return: None
+        """
         for item in self:
-            item_data.append(
-                {
-                    field.name: getattr(item, field.name)
-                    for field in all_fields
-                    if field.type not in {object, Optional[object]}
-                }
-            )
-        df = pd.DataFrame(item_data)
-        return df
+            item.link()
+
+    def get_columns(self):
+        """
+        Function to get the exported field values of all items as columns
+        :return: dict of field name to list of values
+        """
+        items = list(self.data.values())
+        return {
+            field.name: list(map(attrgetter(field.name), items))
+            for field in get_export_fields(self.ITEM_CLASS)
+        }
+
+    def to_dataframe(self):
+        return pd.DataFrame(self.get_columns())
+
+    def to_arrow(self):
+        """
+        Function to get the collection as a pyarrow Table, column types are taken from the dataclass field types
+        where they are known, otherwise they are inferred. pyarrow is an optional dependency
+        :return: pyarrow Table
+        """
+        try:
+            import pyarrow as pa
+        except ImportError as error:
+            raise ImportError("pyarrow is required for Arrow output: pip install pyarrow") from error
+        columns = self.get_columns()
+        arrays = []
+        for field in get_export_fields(self.ITEM_CLASS):
+            arrow_type_name = self.DATACLASS_TO_ARROW_TYPE_MAP.get(field.type)
+            try:
+                arrays.append(
+                    pa.array(
+                        columns[field.name],
+                        type=getattr(pa, arrow_type_name)() if arrow_type_name else None,
+                    )
+                )
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                # field annotations are not enforced, so fall back to inferring the type from the values
+                arrays.append(pa.array(columns[field.name]))
+        return pa.Table.from_arrays(arrays, names=list(columns))
 
     def write_to_csv(self, output_path):
         Path(output_path).parent.mkdir(parents=True, exist_ok=True)
         df = self.to_dataframe()
         df.to_csv(output_path, index=False)
 
-    def write_to_database(self, schema=None):
+    def write_to_database(self, schema=None, cursor=None, incremental=False):
+        """
+        Method to write the collection to its postgres table
+        :param schema: schema name, defaults to the connection schema
+        :param cursor: cursor of an open transaction, the table is written in its own transaction if None
+        :param incremental: bool, only write the partitions of PARTITION_FIELD that changed since the last
+            incremental write, otherwise the table is replaced
+        :return: None
+        """
         df = self.to_dataframe()
         dtypes = self.get_dtypes_from_fields()
+        if incremental:
+            num_partitions = self.signal_emulator.postgres_connection.write_df_to_table_incremental(
+                df, self.TABLE_NAME, schema, dtypes=dtypes, partition_column=self.PARTITION_FIELD, cursor=cursor
+            )
+            self.signal_emulator.logger.info(
+                f"Collection: {self.TABLE_NAME} {num_partitions} changed partitions written to postgres"
+            )
+            return
         self.signal_emulator.postgres_connection.write_df_to_table(
-            df, self.TABLE_NAME, schema, dtypes=dtypes
+            df, self.TABLE_NAME, schema, dtypes=dtypes, cursor=cursor
         )
         self.signal_emulator.logger.info(f"Collection: {self.TABLE_NAME} written to postgres")
 
     def get_dtypes_from_fields(self):
-        all_fields = fields(self.ITEM_CLASS)
+        all_fields = get_export_fields(self.ITEM_CLASS)
         dtypes = {
             f.name: self.DATACLASS_TO_SQL_TYPE_MAP[f.type]
             for f in all_fields
@@ -139,6 +252,11 @@ class BaseCollection:
 
 
 class BaseItem:
+    # names of the properties that hold object references resolved through the signal_emulator collections
+    LINKS = ()
+    # empty so that subclasses declared with slots have no instance __dict__
+    __slots__ = ()
+
     def __init__(self, signal_emulator=None):
         if signal_emulator:
             self.signal_emulator = signal_emulator
@@ -149,6 +267,40 @@ class BaseItem:
     def get_key(self):
         return NotImplementedError
 
+    def get_link(self, name, resolve):
+        """
+        Function to get an object reference. The reference is resolved on first access and held until a collection
+        it is resolved through changes, when the link version of the signal_emulator is incremented
+        :param name: name of the link
+        :param resolve: function to resolve the link
+        :return: linked object or list of objects
+        """
+        link_version = self.signal_emulator.link_version
+        if getattr(self, "_link_version", None) != link_version:
+            self._link_version = link_version
+            self._links = {}
+        if name not in self._links:
+            self._links[name] = resolve()
+        return self._links[name]
+
+    def link(self):
+        """
+        Method to resolve all object references of the item
+        :return: None
+        """
+        for name in self.LINKS:
+            getattr(self, name)
+
+
+class SlottedBaseItem(BaseItem):
+    """
+    Base class for items that are created in large numbers, such as PhaseTimings. Subclasses are dataclasses declared
+    with slots=True, so instances have no __dict__ and any attribute that is not a field must be declared as a field
+    with init=False
+    """
+
+    __slots__ = ("_link_version", "_links")
+
 
 @dataclass(eq=False)
 class Controller(BaseItem):
@@ -164,6 +316,7 @@ class Controller(BaseItem):
     TIMING_SHEET_COLUMN_LOOKUP_PATH = os.path.join(
         os.path.dirname(__file__), "resources/configs/timing_sheet_column_config.json"
     )
+    LINKS = ("streams", "stages", "phases")
 
     def __post_init__(self):
         self.stream_keys = []
@@ -181,6 +334,9 @@ class Controller(BaseItem):
 
     @property
     def streams(self):
+        return self.get_link("streams", self.resolve_streams)
+
+    def resolve_streams(self):
         return [
             self.signal_emulator.streams.get_by_key((self.controller_key, key))
             for key in self.stream_keys
@@ -188,10 +344,16 @@ class Controller(BaseItem):
 
     @property
     def stages(self):
+        return self.get_link("stages", self.resolve_stages)
+
+    def resolve_stages(self):
         return [stage for stream in self.streams for stage in stream.stages_in_stream]
 
     @property
     def phases(self):
+        return self.get_link("phases", self.resolve_phases)
+
+    def resolve_phases(self):
         return [phase for stream in self.streams for phase in stream.phases_in_stream]
 
     @property
@@ -306,6 +468,7 @@ class Controllers(BaseCollection):
     ITEM_CLASS = Controller
     TABLE_NAME = "controllers"
     WRITE_TO_DATABASE = True
+    INVALIDATES_LINKS = True
 
     def __init__(self, item_data, signal_emulator):
         super().__init__(item_data=item_data, signal_emulator=signal_emulator)
@@ -320,6 +483,7 @@ class Stage(BaseItem):
     stream_stage_number: int
     phase_keys_in_stage: List[str]
     signal_emulator: object
+    LINKS = ("stream", "phases_in_stage")
 
     def __post_init__(self):
         self.phase_stage_demand_dependencies = []
@@ -331,6 +495,9 @@ class Stage(BaseItem):
 
     @property
     def stream(self):
+        return self.get_link("stream", self.resolve_stream)
+
+    def resolve_stream(self):
         return self.signal_emulator.streams.get_by_key(self.get_stream_key())
 
     @property
@@ -364,6 +531,9 @@ class Stage(BaseItem):
 
     @property
     def phases_in_stage(self):
+        return self.get_link("phases_in_stage", self.resolve_phases_in_stage)
+
+    def resolve_phases_in_stage(self):
         return [
             self.signal_emulator.phases.get_by_key((self.controller_key, key))
             for key in self.phase_keys_in_stage
@@ -373,12 +543,13 @@ class Stage(BaseItem):
     def stream_number_linsig(self):
         return self.stream_number + 1
 
-    def get_m37(self, site_id):
+    def get_m37(self, site_id, context=None):
+        time_period_id = self.signal_emulator.time_periods.get_period_id(context)
         m37 = self.signal_emulator.m37s.get_by_key(
             (
                 site_id,
                 self.stream_stage_number,
-                self.signal_emulator.time_periods.active_period_id,
+                time_period_id,
             )
         )
         if not m37:
@@ -386,19 +557,20 @@ class Stage(BaseItem):
                 (
                     site_id,
                     self.stream_stage_number,
-                    self.signal_emulator.time_periods.active_period_id,
+                    time_period_id,
                 )
             )
         return m37
 
-    def m37_exists(self, site_id):
+    def m37_exists(self, site_id, context=None):
         # todo fix for parallel streams
         # ped streams has Pxx/xxx site_number format
+        time_period_id = self.signal_emulator.time_periods.get_period_id(context)
         m37 = self.signal_emulator.m37s.get_by_key(
             (
                 site_id,
                 self.stream_stage_number,
-                self.signal_emulator.time_periods.active_period_id,
+                time_period_id,
             )
         )
         if not m37:
@@ -406,7 +578,7 @@ class Stage(BaseItem):
                 (
                     site_id,
                     self.m37_stage_id_ped,
-                    self.signal_emulator.time_periods.active_period_id,
+                    time_period_id,
                 )
             )
         return m37 and m37.total_time > 0
@@ -416,6 +588,7 @@ class Stages(BaseCollection):
     ITEM_CLASS = Stage
     TABLE_NAME = "stages"
     WRITE_TO_DATABASE = True
+    INVALIDATES_LINKS = True
 
     def __init__(self, item_data, signal_emulator):
         super().__init__(item_data=item_data, signal_emulator=signal_emulator)
@@ -424,7 +597,6 @@ class Stages(BaseCollection):
         for stage in self:
             self.data_by_stage_name[stage.get_name_key()] = stage
             self.data_by_stream_number_and_stage_number[stage.get_number_key()] = stage
-        self.active_stage_id = None
 
     def key_exists_by_stage_name(self, stage_name):
         return stage_name in self.data_by_stage_name
@@ -451,6 +623,7 @@ class Stages(BaseCollection):
         self.data[stage.get_key()] = stage
         self.data_by_stream_number_and_stage_number[stage.get_number_key()] = stage
         self.data_by_stage_name[stage.get_name_key()] = stage
+        self.invalidate_links()
 
     def get_stream_stage_number(self, this_stage):
         count = 0
@@ -472,18 +645,6 @@ class Stages(BaseCollection):
         else:
             raise ValueError
 
-    @property
-    def active_stage_id(self):
-        return self._active_stage_id
-
-    @active_stage_id.setter
-    def active_stage_id(self, value):
-        self._active_stage_id = value
-
-    @property
-    def active_stage(self):
-        return self.data[self._active_stage_id]
-
     @staticmethod
     def get_end_phases(current_stage, next_stage):
         return list(set(current_stage.phases_in_stage) - set(next_stage.phases_in_stage))
@@ -504,6 +665,7 @@ class Phase(BaseItem):
     text: str
     associated_phase_ref: str
     signal_emulator: object
+    LINKS = ("associated_phase",)
 
     def __post_init__(self):
         self.indicative_arrow_phase = None
@@ -520,6 +682,9 @@ class Phase(BaseItem):
 
     @property
     def associated_phase(self):
+        return self.get_link("associated_phase", self.resolve_associated_phase)
+
+    def resolve_associated_phase(self):
         return self.signal_emulator.phases.get_by_key(
             (self.controller_key, self.associated_phase_ref)
         )
@@ -544,17 +709,12 @@ class Phase(BaseItem):
     def linsig_phase_type(self):
         return PhaseTypeAndTermTypeToLinsigPhaseType[(self.phase_type, self.termination_type)]
 
-    @property
-    def phase_timings(self):
-        return self.signal_emulator.phase_timings.get_by_controller_key_phase_ref_time_period_id(
-            *self.get_phase_timing_key()
-        )
+    def get_phase_timing_key(self, context):
+        return self.controller_key, self.phase_ref, context.time_period_id
 
-    def get_phase_timing_key(self):
-        return (
-            self.controller_key,
-            self.phase_ref,
-            self.signal_emulator.time_periods.active_period_id,
+    def get_phase_timings(self, context):
+        return self.signal_emulator.phase_timings.get_by_controller_key_phase_ref_time_period_id(
+            *self.get_phase_timing_key(context)
         )
 
     def get_phase_timings_by_time_period_id(self, time_period_id):
@@ -567,6 +727,7 @@ class Phases(BaseCollection):
     ITEM_CLASS = Phase
     TABLE_NAME = "phases"
     WRITE_TO_DATABASE = True
+    INVALIDATES_LINKS = True
 
     def __init__(self, item_data, signal_emulator):
         super().__init__(item_data=item_data, signal_emulator=signal_emulator)
@@ -586,6 +747,7 @@ class Stream(BaseItem):
     signal_emulator: object
     stage_keys_in_stream: Optional[List[int]] = None
     is_pv_px_mode: bool = False
+    LINKS = ("controller", "stages_in_stream", "phase_keys_in_stream", "phases_in_stream")
 
     def __init__(self, controller_key, stream_number, site_number, signal_emulator, stage_keys_in_stream=None, is_pv_px_mode=False):
         super().__init__(signal_emulator=signal_emulator)
@@ -596,7 +758,6 @@ class Stream(BaseItem):
         self.site_number = site_number
         self.stage_keys_in_stream = stage_keys_in_stream
         self.is_pv_px_mode = is_pv_px_mode
-        self._active_stage_key = None
         self.__post_init__()
 
     def __post_init__(self):
@@ -613,23 +774,12 @@ class Stream(BaseItem):
     def get_site_key(self):
         return self.site_number
 
-    @property
-    def active_stage_key(self):
-        return self._active_stage_key
-
-    @active_stage_key.setter
-    def active_stage_key(self, value):
-        if not self.signal_emulator.stages.key_exists(value) and value[1] is not None:
-            raise ValueError(f"Active stage key: {value} does not exist in Stages")
-        self._active_stage_key = value
-
     @property
     def controller(self):
-        return self.signal_emulator.controllers.get_by_key(self.controller_key)
+        return self.get_link("controller", self.resolve_controller)
 
-    @property
-    def active_stage(self):
-        return self.signal_emulator.stages.get_by_key(self.active_stage_key)
+    def resolve_controller(self):
+        return self.signal_emulator.controllers.get_by_key(self.controller_key)
 
     @property
     def stream_number_linsig(self):
@@ -646,6 +796,9 @@ class Stream(BaseItem):
 
     @property
     def stages_in_stream(self):
+        return self.get_link("stages_in_stream", self.resolve_stages_in_stream)
+
+    def resolve_stages_in_stream(self):
         return [
             self.signal_emulator.stages.get_by_key((self.controller_key, key))
             for key in self.stage_keys_in_stream
@@ -661,6 +814,9 @@ class Stream(BaseItem):
 
     @property
     def phase_keys_in_stream(self):
+        return self.get_link("phase_keys_in_stream", self.resolve_phase_keys_in_stream)
+
+    def resolve_phase_keys_in_stream(self):
         return list(
             {
                 phase_key
@@ -681,6 +837,9 @@ class Stream(BaseItem):
 
     @property
     def phases_in_stream(self):
+        return self.get_link("phases_in_stream", self.resolve_phases_in_stream)
+
+    def resolve_phases_in_stream(self):
         return [
             self.signal_emulator.phases.get_by_key((self.controller_key, key))
             for key in self.phase_keys_in_stream
@@ -699,6 +858,7 @@ class Streams(BaseCollection):
     ITEM_CLASS = Stream
     TABLE_NAME = "streams"
     WRITE_TO_DATABASE = True
+    INVALIDATES_LINKS = True
 
     def __init__(self, item_data, signal_emulator):
         super().__init__(item_data=item_data, signal_emulator=signal_emulator)
@@ -710,6 +870,7 @@ class Streams(BaseCollection):
         stream = Stream(**stream_data, signal_emulator=kwargs.get("signal_emulator"))
         self.data[stream.get_key()] = stream
         self.data_by_site_id[stream.get_site_key()] = stream
+        self.invalidate_links()
 
     def get_by_site_id(self, site_number, strict=True):
         if strict:
@@ -721,6 +882,43 @@ class Streams(BaseCollection):
         return site_number in self.data_by_site_id
 
 
+class InterstageTimesMixin:
+    """
+    Mixin for the collections of intergreens and phase delays. The InterstageTables of a controller are invalidated
+    when its items are added or removed, only the table of the time period for modified items
+    """
+
+    def add_to_index(self, item):
+        super().add_to_index(item)
+        self.signal_emulator.interstage_tables.invalidate(*self.get_interstage_table_key(item))
+
+    def remove_from_index(self, item):
+        super().remove_from_index(item)
+        self.signal_emulator.interstage_tables.invalidate(*self.get_interstage_table_key(item))
+
+    @staticmethod
+    def get_interstage_table_key(item):
+        return item.controller_key, getattr(item, "time_period_id", None)
+
+
+class ModifiedInterstageTimesMixin(InterstageTimesMixin):
+    """
+    Mixin for the collections of modified intergreens and phase delays, items are also indexed by controller key and
+    time period id. The index is created before the base constructor, which indexes the initial items
+    """
+
+    def add_to_index(self, item):
+        super().add_to_index(item)
+        self.data_by_controller_key_time_period_id[self.get_interstage_table_key(item)][item.get_key()] = item
+
+    def remove_from_index(self, item):
+        super().remove_from_index(item)
+        del self.data_by_controller_key_time_period_id[self.get_interstage_table_key(item)][item.get_key()]
+
+    def get_by_controller_key_time_period_id(self, controller_key, time_period_id):
+        return list(self.data_by_controller_key_time_period_id[(controller_key, time_period_id)].values())
+
+
 @dataclass(eq=False)
 class BaseIntergreen(BaseItem):
     controller_key: str
@@ -753,22 +951,15 @@ class Intergreen(BaseIntergreen):
     def get_key(self):
         return self.controller_key, self.end_phase_key, self.start_phase_key
 
-    @property
-    def modified_intergreen(self):
-        return self.signal_emulator.modified_intergreens.get_by_key(
-            self.get_key() + (self.signal_emulator.time_periods.active_period_id,)
-        )
+    def get_modified_intergreen(self, context):
+        return self.signal_emulator.modified_intergreens.get_by_key(self.get_key() + (context.time_period_id,))
 
-    @property
-    def modified_intergreen_time(self):
-        return (
-            self.modified_intergreen.intergreen_time
-            if self.modified_intergreen
-            else self.intergreen_time
-        )
+    def get_modified_intergreen_time(self, context):
+        modified_intergreen = self.get_modified_intergreen(context)
+        return modified_intergreen.intergreen_time if modified_intergreen else self.intergreen_time
 
 
-class Intergreens(BaseCollection):
+class Intergreens(InterstageTimesMixin, BaseCollection):
     ITEM_CLASS = Intergreen
     TABLE_NAME = "intergreens"
     WRITE_TO_DATABASE = True
@@ -776,13 +967,12 @@ class Intergreens(BaseCollection):
     def __init__(self, item_data, signal_emulator):
         super().__init__(item_data=item_data, signal_emulator=signal_emulator)
 
-    def get_by_key(self, key, modified=False):
+    def get_by_key(self, key, modified=False, context=None):
+        time_period_id = self.signal_emulator.time_periods.get_period_id(context)
         if modified and self.signal_emulator.modified_intergreens.key_exists(
-            key + (self.signal_emulator.time_periods.active_period_id,)
+            key + (time_period_id,)
         ):
-            return self.signal_emulator.modified_intergreens.get_by_key(
-                key + (self.signal_emulator.time_periods.active_period_id,)
-            )
+            return self.signal_emulator.modified_intergreens.get_by_key(key + (time_period_id,))
         else:
             controller_key, end_phase_key, start_phase_key = key
             return self.data.get(
@@ -796,59 +986,48 @@ class Intergreens(BaseCollection):
                 ),
             )
 
-    def exists_by_phase_keys(self, controller_key, end_phase_key, start_phase_key, modified=False):
+    def exists_by_phase_keys(
+        self, controller_key, end_phase_key, start_phase_key, modified=False, context=None
+    ):
         if modified:
             modified_exists = self.signal_emulator.modified_intergreens.key_exists(
                 (
                     controller_key,
                     end_phase_key,
                     start_phase_key,
-                    self.signal_emulator.time_periods.active_period_id,
+                    self.signal_emulator.time_periods.get_period_id(context),
                 )
             )
         else:
             modified_exists = False
         return (controller_key, end_phase_key, start_phase_key) in self.data or modified_exists
 
-    def get_by_phase_keys(self, controller_key, end_phase_key, start_phase_key, modified=False):
-        if modified and self.signal_emulator.modified_intergreens.key_exists(
-            (
-                controller_key,
-                end_phase_key,
-                start_phase_key,
-                self.signal_emulator.time_periods.active_period_id,
-            )
-        ):
-            return self.signal_emulator.modified_intergreens.get_by_key(
-                (
-                    controller_key,
-                    end_phase_key,
-                    start_phase_key,
-                    self.signal_emulator.time_periods.active_period_id,
-                )
-            )
+    def get_by_phase_keys(
+        self, controller_key, end_phase_key, start_phase_key, modified=False, context=None
+    ):
+        modified_key = (
+            controller_key,
+            end_phase_key,
+            start_phase_key,
+            self.signal_emulator.time_periods.get_period_id(context),
+        )
+        if modified and self.signal_emulator.modified_intergreens.key_exists(modified_key):
+            return self.signal_emulator.modified_intergreens.get_by_key(modified_key)
         else:
             return self.data.get((controller_key, end_phase_key, start_phase_key), None)
 
     def get_intergreen_time_by_phase_keys(
-        self, controller_key, end_phase_key, start_phase_key, modified=False
+        self, controller_key, end_phase_key, start_phase_key, modified=False, context=None
     ):
-        if modified and self.signal_emulator.modified_intergreens.key_exists(
-            (
+        if modified:
+            modified_key = (
                 controller_key,
                 end_phase_key,
                 start_phase_key,
-                self.signal_emulator.time_periods.active_period_id,
+                self.signal_emulator.time_periods.get_period_id(context),
             )
-        ):
-            return self.signal_emulator.modified_intergreens.get_by_key(
-                (
-                    controller_key,
-                    end_phase_key,
-                    start_phase_key,
-                    self.signal_emulator.time_periods.active_period_id,
-                )
-            ).intergreen_time
+            if self.signal_emulator.modified_intergreens.key_exists(modified_key):
+                return self.signal_emulator.modified_intergreens.get_by_key(modified_key).intergreen_time
 
         if not self.key_exists((controller_key, end_phase_key, start_phase_key)):
             return 0
@@ -872,12 +1051,13 @@ class ModifiedIntergreen(BaseIntergreen):
         return self.controller_key, self.end_phase_key, self.start_phase_key, self.time_period_id
 
 
-class ModifiedIntergreens(BaseCollection):
+class ModifiedIntergreens(ModifiedInterstageTimesMixin, BaseCollection):
     ITEM_CLASS = ModifiedIntergreen
     TABLE_NAME = "modified_intergreens"
     WRITE_TO_DATABASE = True
 
     def __init__(self, item_data, signal_emulator):
+        self.data_by_controller_key_time_period_id = defaultdict(dict)
         super().__init__(item_data=item_data, signal_emulator=signal_emulator)
 
 
@@ -937,20 +1117,15 @@ class PhaseDelay(BasePhaseDelay):
             self.phase_ref in self.start_stage.phase_keys_in_stage
         )
 
-    @property
-    def modified_phase_delay(self):
-        return self.signal_emulator.modified_phase_delays.get_by_key(
-            self.get_key() + (self.signal_emulator.time_periods.active_period_id,)
-        )
+    def get_modified_phase_delay(self, context):
+        return self.signal_emulator.modified_phase_delays.get_by_key(self.get_key() + (context.time_period_id,))
 
-    @property
-    def modified_delay_time(self):
-        return (
-            self.modified_phase_delay.delay_time if self.modified_phase_delay else self.delay_time
-        )
+    def get_modified_delay_time(self, context):
+        modified_phase_delay = self.get_modified_phase_delay(context)
+        return modified_phase_delay.delay_time if modified_phase_delay else self.delay_time
 
 
-class PhaseDelays(BaseCollection):
+class PhaseDelays(InterstageTimesMixin, BaseCollection):
     ITEM_CLASS = PhaseDelay
     TABLE_NAME = "phase_delays"
     WRITE_TO_DATABASE = True
@@ -960,13 +1135,12 @@ class PhaseDelays(BaseCollection):
         if remove_invalid:
             self.remove_invalid()
 
-    def get_by_key(self, key, modified=False):
+    def get_by_key(self, key, modified=False, context=None):
+        time_period_id = self.signal_emulator.time_periods.get_period_id(context)
         if modified and self.signal_emulator.modified_phase_delays.key_exists(
-            (key + (self.signal_emulator.time_periods.active_period_id,))
+            key + (time_period_id,)
         ):
-            return self.signal_emulator.modified_phase_delays.get_by_key(
-                (key + (self.signal_emulator.time_periods.active_period_id,))
-            )
+            return self.signal_emulator.modified_phase_delays.get_by_key(key + (time_period_id,))
         else:
             return self.data.get(
                 key,
@@ -991,26 +1165,17 @@ class PhaseDelays(BaseCollection):
                 )
 
     def get_delay_time_by_stage_and_phase_keys(
-        self, controller_key, end_stage_key, start_stage_key, phase_key, modified=False
+        self, controller_key, end_stage_key, start_stage_key, phase_key, modified=False, context=None
     ):
-        if modified and self.signal_emulator.modified_phase_delays.key_exists(
-            (
-                controller_key,
-                end_stage_key,
-                start_stage_key,
-                phase_key,
-                self.signal_emulator.time_periods.active_period_id,
-            )
-        ):
-            return self.signal_emulator.modified_phase_delays.get_by_key(
-                (
-                    controller_key,
-                    end_stage_key,
-                    start_stage_key,
-                    phase_key,
-                    self.signal_emulator.time_periods.active_period_id,
-                )
-            ).delay_time
+        modified_key = (
+            controller_key,
+            end_stage_key,
+            start_stage_key,
+            phase_key,
+            self.signal_emulator.time_periods.get_period_id(context),
+        )
+        if modified and self.signal_emulator.modified_phase_delays.key_exists(modified_key):
+            return self.signal_emulator.modified_phase_delays.get_by_key(modified_key).delay_time
         elif self.key_exists((controller_key, end_stage_key, start_stage_key, phase_key)):
             return self.data.get(
                 (controller_key, end_stage_key, start_stage_key, phase_key)
@@ -1043,12 +1208,16 @@ class ModifiedPhaseDelay(BasePhaseDelay):
         )
 
 
-class ModifiedPhaseDelays(PhaseDelays):
+class ModifiedPhaseDelays(ModifiedInterstageTimesMixin, PhaseDelays):
     ITEM_CLASS = ModifiedPhaseDelay
     TABLE_NAME = "modified_phase_delays"
     WRITE_TO_DATABASE = True
 
-    def get_by_key(self, key, modified=False):
+    def __init__(self, item_data, signal_emulator, remove_invalid=False):
+        self.data_by_controller_key_time_period_id = defaultdict(dict)
+        super().__init__(item_data=item_data, signal_emulator=signal_emulator, remove_invalid=remove_invalid)
+
+    def get_by_key(self, key, modified=False, context=None):
         return self.data.get(key, None)
 
 
@@ -1090,8 +1259,8 @@ class ProhibitedStageMoves(BaseCollection):
         return (controller_key, end_stage_key, start_stage_key) in self.data
 
 
-@dataclass(eq=False)
-class PhaseTiming:
+@dataclass(eq=False, slots=True)
+class PhaseTiming(SlottedBaseItem):
     signal_emulator: object
     controller_key: str
     site_id: str
@@ -1100,6 +1269,7 @@ class PhaseTiming:
     time_period_id: str
     start_time: Optional[int] = None
     end_time: Optional[int] = None
+    LINKS = ("controller", "phase")
 
     def __repr__(self):
         return (
@@ -1127,22 +1297,31 @@ class PhaseTiming:
 
     @property
     def controller(self):
+        return self.get_link("controller", self.resolve_controller)
+
+    def resolve_controller(self):
         return self.signal_emulator.controllers.get_by_key(self.controller_key)
 
     @property
     def phase(self):
+        return self.get_link("phase", self.resolve_phase)
+
+    def resolve_phase(self):
         return self.signal_emulator.phases.get_by_key(self.get_phase_key())
 
+    @property
+    def signal_plan(self):
+        for signal_plan in self.controller.signal_plans:
+            if signal_plan.time_period_id == self.time_period_id:
+                return signal_plan
+        return None
+
     @property
     def green_time(self):
         if self.end_time > self.start_time:
             return self.end_time - self.start_time
         else:
-            return (
-                self.controller.signal_emulator.plans.active_plan.cycle_time
-                - self.start_time
-                + self.end_time
-            )
+            return self.signal_plan.cycle_time - self.start_time + self.end_time
 
     def get_phase_key(self):
         return self.controller_key, self.phase_ref
@@ -1154,27 +1333,18 @@ class PhaseTimings(BaseCollection):
     WRITE_TO_DATABASE = True
 
     def __init__(self, item_data, signal_emulator):
-        super().__init__(item_data=item_data, signal_emulator=signal_emulator)
         self.data_by_controller_key_phase_ref_time_period_id = defaultdict(list)
-        for phase_timing in self:
-            self.data_by_controller_key_phase_ref_time_period_id[
-                phase_timing.get_controller_key_phase_ref_time_period_id()
-            ].append(phase_timing)
+        super().__init__(item_data=item_data, signal_emulator=signal_emulator)
 
-    def remove_all(self):
-        super().remove_all()
-        self.data_by_controller_key_phase_ref_time_period_id = defaultdict(list)
+    def add_to_index(self, item):
+        self.data_by_controller_key_phase_ref_time_period_id[item.get_controller_key_phase_ref_time_period_id()].append(
+            item
+        )
 
-    def add_instance(self, item):
-        if isinstance(item, self.ITEM_CLASS):
-            self.data[item.get_key()] = item
-            self.data_by_controller_key_phase_ref_time_period_id[
-                item.get_controller_key_phase_ref_time_period_id()
-            ].append(item)
-        else:
-            self.signal_emulator.logger(
-                f"Item: {item} cannot be added to Collection: {self.__class__.__name__} as it is not the correct type"
-            )
+    def remove_from_index(self, item):
+        self.data_by_controller_key_phase_ref_time_period_id[
+            item.get_controller_key_phase_ref_time_period_id()
+        ].remove(item)
 
     def get_last(self):
         if len(self.data) == 0:
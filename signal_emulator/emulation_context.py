@@ -0,0 +1,42 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+@dataclass(eq=False)
+class EmulationContext:
+    """
+    Class to hold the state of a single emulation run, the time period being emulated and the active stage of each
+    stream. A context is passed explicitly through plan selection, stage sequencing and emulation, so different time
+    periods and controllers can be emulated concurrently without sharing mutable state
+    """
+
+    time_period_id: str
+    plan_number: Optional[int] = None
+    active_stage_keys: dict = field(default_factory=dict)
+
+    def get_active_stage_key(self, stream):
+        """
+        Function to get the active stage key of a stream
+        :param stream: Stream
+        :return: tuple of controller key and stage number, or None if no stage is active
+        """
+        return self.active_stage_keys.get(stream.get_key())
+
+    def set_active_stage_key(self, stream, value):
+        """
+        Method to set the active stage key of a stream
+        :param stream: Stream
+        :param value: tuple of controller key and stage number
+        :return: None
+        """
+        if not stream.signal_emulator.stages.key_exists(value) and value[1] is not None:
+            raise ValueError(f"Active stage key: {value} does not exist in Stages")
+        self.active_stage_keys[stream.get_key()] = value
+
+    def get_active_stage(self, stream):
+        """
+        Function to get the active stage of a stream
+        :param stream: Stream
+        :return: Stage or None if no stage is active
+        """
+        return stream.signal_emulator.stages.get_by_key(self.get_active_stage_key(stream))
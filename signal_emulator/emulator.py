@@ -16,15 +16,19 @@ from signal_emulator.controller import (
     ModifiedPhaseDelays,
     PhaseStageDemandDependencies
 )
+from signal_emulator.emulation_context import EmulationContext
 from signal_emulator.enums import Cell
 from signal_emulator.file_parsers.plan_parser import PlanParser
 from signal_emulator.file_parsers.connect_plus_plan_parser import ConnectPlusPlanParser
 from signal_emulator.file_parsers.timing_sheet_parser import TimingSheetParser
 from signal_emulator.file_parsers.connect_plus_config_parser import ConnectPlusConfigParser
 from signal_emulator.file_parsers.connect_plus_timetable_parser import ConnectPlusTimetableParser
+from signal_emulator.interstage_table import InterstageTables
 from signal_emulator.linsig import Linsig
 from signal_emulator.m16_average import M16Averages
 from signal_emulator.m37_average import M37Averages
+from signal_emulator.parallel_emulator import ParallelEmulator
+from signal_emulator.parallel_exporter import ParallelExporter
 from signal_emulator.plan import Plans, PlanSequenceItems
 from signal_emulator.plan_timetable import PlanTimetables
 from signal_emulator.saturn_objects import PhaseToSaturnTurns, SaturnSignalGroups
@@ -39,6 +43,31 @@ from signal_emulator.coordinate_transformer import CoordinateTransformer
 class SignalEmulator:
     BASE_DIRECTORY = os.path.dirname(__file__)
     DEFAULT_TIME_PERIODS_PATH = os.path.join(BASE_DIRECTORY, "resources/time_periods/default_time_periods.json")
+    # collections built from their postgres tables when loading from postgres, only these tables are prefetched
+    POSTGRES_COLLECTIONS = (
+        TimePeriods,
+        Controllers,
+        Streams,
+        Stages,
+        Phases,
+        PhaseStageDemandDependencies,
+        Intergreens,
+        ModifiedIntergreens,
+        PhaseDelays,
+        ModifiedPhaseDelays,
+        ProhibitedStageMoves,
+        Plans,
+        PlanSequenceItems,
+        PlanTimetables,
+        M16Averages,
+        M37Averages,
+        SignalPlans,
+        SignalPlanStreams,
+        SignalPlanStages,
+        PhaseTimings,
+        SaturnSignalGroups,
+        PhaseToSaturnTurns,
+    )
 
     def __init__(self, config):
         self.logger = self.setup_logger()
@@ -46,12 +75,22 @@ class SignalEmulator:
         if "postgres_connection" in config:
             self.postgres_connection = PostgresConnection(**config["postgres_connection"])
             self.load_from_postgres = config["load_from_postgres"]
+            if self.load_from_postgres:
+                # the tables are read concurrently up front, the collections below are then built from them in
+                # dependency order: controllers, streams, stages, phases and the items that reference them
+                self.logger.info(f"Reading tables from postgres: {self.postgres_connection}")
+                self.postgres_connection.prefetch_tables(
+                    [collection.TABLE_NAME for collection in self.POSTGRES_COLLECTIONS]
+                )
         else:
             self.postgres_connection = None
             self.load_from_postgres = False
+        self.processes = config.get("processes", 1)
         self.timing_sheet_parser = TimingSheetParser(self)
         self.osgb36_to_wgs84 = CoordinateTransformer(source_epsg_code=27700, target_epsg_code=4326)
         self.plan_parser = PlanParser()
+        # incremented when controllers, streams, stages or phases change, to invalidate linked object references
+        self.link_version = 0
         self.time_periods = TimePeriods(
             config.get(
                 "time_periods",
@@ -65,6 +104,7 @@ class SignalEmulator:
         self.phases = Phases([], self)
         self.phase_stage_demand_dependencies = PhaseStageDemandDependencies([], self)
         self.phases.set_indicative_arrow_phases(self.phases)
+        self.interstage_tables = InterstageTables(self)
         self.intergreens = Intergreens([], self)
         self.modified_intergreens = ModifiedIntergreens([], self)
         self.phase_delays = PhaseDelays([], self)
@@ -120,6 +160,9 @@ class SignalEmulator:
             signal_emulator=self, saturn_lookup_file=config.get("saturn_lookup_file", None)
         )
         self.linsig = Linsig(self, config.get("output_directory_linsig", None))
+        if self.postgres_connection:
+            # release any tables that no collection was built from
+            self.postgres_connection.prefetched_tables.clear()
         self.run_datestamp = f'signal emulator run {datetime.now().strftime("%Y-%m-%d")}'
 
     def find_streams_without_all_red_stage_first(self):
@@ -159,53 +202,85 @@ class SignalEmulator:
         logging.getLogger("").addHandler(console)
         return logging.getLogger(__name__)
 
-    def generate_signal_plans(self, ped_only=False):
+    def generate_signal_plans(self, ped_only=False, processes=None):
         """
         Method to generate signal plans from UTC plans and controller spec definitions
+        :param ped_only: bool, only generate signal plans for pedestrian streams
+        :param processes: number of worker processes, controllers are processed in parallel if greater than 1
         :return: None
         """
+        self.link_objects()
+        processes = processes or self.processes
+        if processes > 1:
+            ParallelEmulator(self, processes).generate_signal_plans(ped_only=ped_only)
+            return
         for controller in self.controllers:
-            self.logger.info(f"Processing Signal Plans for Controller: {controller.controller_key}")
-            if controller.is_parallel():
-                self.logger.info(
-                    f"Site: {controller.controller_key} is Parallel Stage Stream Site, so it is defined in another Site"
-                )
-                continue
-            for signal_plan_number, time_period in enumerate(self.time_periods, start=1):
-                self.time_periods.active_period_id = time_period.get_key()
-                stream_plan_dict = self.get_stream_plan_dict(controller)
-                if any(stream_plan_dict.values()):
-                    if not ped_only or any([s.is_pv_px_mode for s in stream_plan_dict.keys()]):
-                        self.signal_plans.add_from_stream_plan_dict(
-                            stream_plan_dict, time_period, signal_plan_number
-                        )
-                else:
-                    self.logger.warning(
-                        f"Controller: {controller.controller_key} was not processed to signal plans because suitable"
-                        f" plans were not found for any stream"
+            self.generate_controller_signal_plans(controller, ped_only=ped_only)
+
+    def generate_controller_signal_plans(self, controller, ped_only=False):
+        """
+        Method to generate the signal plans of one controller for all time periods
+        :param controller: Controller
+        :param ped_only: bool, only generate signal plans for pedestrian streams
+        :return: None
+        """
+        self.logger.info(f"Processing Signal Plans for Controller: {controller.controller_key}")
+        if controller.is_parallel():
+            self.logger.info(
+                f"Site: {controller.controller_key} is Parallel Stage Stream Site, so it is defined in another Site"
+            )
+            return
+        for signal_plan_number, time_period in enumerate(self.time_periods, start=1):
+            context = EmulationContext(time_period_id=time_period.get_key())
+            stream_plan_dict = self.get_stream_plan_dict(controller, context)
+            if any(stream_plan_dict.values()):
+                if not ped_only or any([s.is_pv_px_mode for s in stream_plan_dict.keys()]):
+                    self.signal_plans.add_from_stream_plan_dict(
+                        stream_plan_dict, time_period, signal_plan_number, context
                     )
+            else:
+                self.logger.warning(
+                    f"Controller: {controller.controller_key} was not processed to signal plans because suitable"
+                    f" plans were not found for any stream"
+                )
+
+    def link_objects(self):
+        """
+        Method to resolve the object references between controllers, streams, stages, phases and signal plans, so
+        that emulation uses attribute access rather than collection lookups. References are resolved again on next
+        access after any of the controllers, streams, stages or phases collections change
+        :return: None
+        """
+        for collection in (
+            self.controllers,
+            self.streams,
+            self.stages,
+            self.phases,
+            self.signal_plan_streams,
+            self.signal_plan_stages,
+        ):
+            collection.link()
 
-    def get_stream_plan_dict(self, controller):
+    def get_stream_plan_dict(self, controller, context):
         stream_plan_dict = {}
         for stream in controller.streams:
             if stream is None:
                 self.logger.info(f"Null stream found in controller: {controller.controller_key}")
                 raise Exception
-            plan = self.get_best_matching_plan(stream)
+            plan = self.get_best_matching_plan(stream, context)
             stream_plan_dict[stream] = plan
             if not plan:
                 self.logger.info(f"No Plan found for stream: {stream.site_number}")
         return stream_plan_dict
 
-    def get_best_matching_plan(self, stream):
+    def get_best_matching_plan(self, stream, context):
         """
         Function to get the best matching plan for a stream
         :param stream: Stream
+        :param context: EmulationContext
         :return: Plan
         """
-        pja = self.plan_timetables.get_by_key(
-            (stream.site_number, self.time_periods.active_period_id)
-        )
+        pja = self.plan_timetables.get_by_key((stream.site_number, context.time_period_id))
         # If Plan exists that is referenced in pJA file then return this Plan
         if pja and pja.control_plan:
             self.logger.info(
@@ -213,11 +288,11 @@ class SignalEmulator:
             )
             return pja.control_plan
         # Else return best matching plan base on plan name, WAT AM for example
-        elif self.get_plan_for_active_period(stream):
-            plan = self.get_plan_for_active_period(stream)
+        elif self.get_plan_for_active_period(stream, context):
+            plan = self.get_plan_for_active_period(stream, context)
             self.logger.info(
                 f"Plan: {plan.plan_number} {plan.name} selected by searching for WAT plan for time period: "
-                f"{self.time_periods.active_period_id}"
+                f"{context.time_period_id}"
             )
             return plan
         # Else return the first available plan
@@ -231,23 +306,24 @@ class SignalEmulator:
         else:
             return None
 
-    def get_plan_for_active_period(self, stream):
+    def get_plan_for_active_period(self, stream, context):
+        time_period = self.time_periods.get_by_key(context.time_period_id)
         for plan in stream.plans:
             if plan.name in {
-                f"WAT {self.time_periods.active_period_id}",
-                f"{self.time_periods.active_period_id}",
+                f"WAT {context.time_period_id}",
+                f"{context.time_period_id}",
             }:
                 return plan
         for plan in stream.plans:
             if "WAT" in plan.name and (
-                self.time_periods.active_period.name in plan.name or
-                self.time_periods.active_period.long_name in plan.name
+                time_period.name in plan.name or
+                time_period.long_name in plan.name
             ):
                 return plan
         for plan in stream.plans:
             if (
-                self.time_periods.active_period.name in plan.name or
-                self.time_periods.active_period.long_name in plan.name
+                time_period.name in plan.name or
+                time_period.long_name in plan.name
             ):
                 return plan
         return None
@@ -283,6 +359,7 @@ class SignalEmulator:
         self.phase_stage_demand_dependencies.add_items(attrs_dict.get("phase_stage_demand_dependencies", []), self)
         controller = self.controllers.get_by_key(attrs_dict["controllers"][0]["controller_key"])
         self.phases.set_indicative_arrow_phases(controller.phases)
+        self.interstage_tables.invalidate(controller.controller_key)
 
     def load_connect_plus_config_pdf(self, pdf_filepath):
         config_type = self.connect_plus_config_parser.get_config_type(pdf_filepath)
@@ -309,6 +386,7 @@ class SignalEmulator:
         self.phase_stage_demand_dependencies.add_items(attrs_dict.get("phase_stage_demand_dependencies", []), self)
         controller = self.controllers.get_by_key(attrs_dict["controllers"][0]["controller_key"])
         self.phases.set_indicative_arrow_phases(controller.phases)
+        self.interstage_tables.invalidate(controller.controller_key)
 
     def load_plans_from_cell_directories(self, base_directory):
         for cell in Cell:
@@ -342,19 +420,52 @@ class SignalEmulator:
             if issubclass(attr.__class__, BaseCollection):
                 yield attr
 
-    def export_to_database(self, schema=None):
+    def export_to_database(self, schema=None, incremental=False):
+        """
+        Method to export the collections to postgres tables
+        :param schema: schema name, defaults to the connection schema
+        :param incremental: bool, only write the rows of controllers that changed since the last incremental export
+            and delete the rows of removed controllers, otherwise all tables are replaced
+        :return: None
+        """
         if not schema:
             schema = self.postgres_connection.schema
             self.postgres_connection.schema = schema
         self.logger.info(f"Exporting signal data to postgres: {self.postgres_connection}")
         self.postgres_connection.create_schema(schema)
-        for collection in self.base_collection_iterator():
-            if collection.WRITE_TO_DATABASE:
-                collection.write_to_database(schema)
+        # all tables are written in a single transaction so the schema is never seen partially written
+        with self.postgres_connection.transaction() as cursor:
+            if not incremental:
+                # fingerprints from earlier incremental exports no longer describe the replaced tables
+                cursor.execute(
+                    f'DROP TABLE IF EXISTS "{schema}"."{self.postgres_connection.FINGERPRINT_TABLE_NAME}"'
+                )
+            for collection in self.base_collection_iterator():
+                if collection.WRITE_TO_DATABASE:
+                    collection.write_to_database(schema, cursor=cursor, incremental=incremental)
 
-    def generate_phase_timings(self, remove_existing=True):
+    def export_to_files(self, processes=None):
+        """
+        Method to export the SATURN RGS files, the VISUM net files and the LinSig files
+        :param processes: number of worker processes, files are rendered in parallel if greater than 1
+        :return: None
+        """
+        ParallelExporter(self, processes).export_all()
+
+    def generate_phase_timings(self, remove_existing=True, processes=None):
+        """
+        Method to emulate the signal plans to generate phase timings
+        :param remove_existing: bool, remove existing phase timings before emulating
+        :param processes: number of worker processes, controllers are emulated in parallel if greater than 1
+        :return: None
+        """
         if remove_existing:
             self.phase_timings.remove_all()
+        self.link_objects()
+        processes = processes or self.processes
+        if processes > 1:
+            ParallelEmulator(self, processes).generate_phase_timings()
+            return
         for signal_plan in self.signal_plans:
             signal_plan.emulate()
 
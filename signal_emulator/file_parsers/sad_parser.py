@@ -1,16 +1,35 @@
 import csv
-import gzip
 import os
 import re
+import time
 from collections import defaultdict
 from dataclasses import dataclass, fields
 from datetime import datetime, timedelta
+from functools import partial
 from itertools import chain
 
 from signal_emulator.enums import Cell
+from signal_emulator.file_parsers.signal_event_parser import (
+    DEFAULT_OUTPUT_FOLDER,
+    SignalEventParser,
+    SignalEventTaskSummary,
+)
+from signal_emulator.utilities.log_file_reader import iter_log_file_lines, iter_log_file_records
 from signal_emulator.utilities.utility_functions import list_to_csv
 
 
+def _process_sad_files_worker(cell, sad_datetime, file_paths, output_folder):
+    """
+    Worker function to process the SAD files of one cell and date with a new SADParser
+    :param cell: UTC Cell
+    :param sad_datetime: date
+    :param file_paths: list of SAD file paths in time order
+    :param output_folder: output folder of the M37 file
+    :return: SignalEventTaskSummary
+    """
+    return SADParser().process_sad_files(cell, sad_datetime, file_paths, output_folder)
+
+
 class SADParser:
     """
     Class to represent SAD file parser. SAD files are read, processed and exported as M37 format
@@ -24,72 +43,85 @@ class SADParser:
         self.controller_events = defaultdict(list)
         self.m37s = []
 
-    def process_zipped_sad_folder(self, sad_folder):
+    def process_zipped_sad_folder(self, sad_folder, output_folder=DEFAULT_OUTPUT_FOLDER, processes=1):
         """
-        Method to process a folder containing SAD files. Folder and sub folders are searched
+        Method to process a folder containing SAD files. Folder and sub folders are searched. The files of each cell
+        and date are processed as an independent task, each writing one M37 csv file, using the task runner of
+        SignalEventParser
         :param sad_folder: SAD folder
-        :return: None
+        :param output_folder: output folder of the M37 csv files
+        :param processes: number of worker processes
+        :return: list of SignalEventTaskSummary, in cell and date order
         """
-        files_by_area = defaultdict(lambda: defaultdict(list))
-        for root, dirs, files in os.walk(sad_folder):
-            for file in files:
-                if file.endswith(".gz"):
-                    area = Cell[file[15:20]]
-                    date = CustomDatetime.strptime(file[:9], "%b%d%Y")
-                    file_path = os.path.join(root, file)
-                    files_by_area[area][date].append(file_path)
-
-        csv_files_by_area = defaultdict(dict)
-        for area, dates in files_by_area.items():
-            for date, files in dates.items():
-                files_by_area[area][date] = sorted(
-                    files, key=lambda s: datetime.strptime(os.path.basename(s)[:14], "%b%d%Y_%H%M")
-                )
-                csv_files_by_area[area][date] = self.get_csv_file_objects_from_paths(files)
+        return SignalEventParser().run_signal_event_tasks(
+            sad_folder,
+            partial(self.process_sad_files, output_folder=output_folder),
+            partial(_process_sad_files_worker, output_folder=output_folder),
+            processes,
+        )
 
-        for area, dates in csv_files_by_area.items():
-            for date, files in dates.items():
-                self.process_sad_file(area, files, date)
+    def process_sad_files(self, cell, sad_datetime, file_paths, output_folder=DEFAULT_OUTPUT_FOLDER):
+        """
+        Method to process the SAD files of one cell and date
+        :param cell: UTC Cell
+        :param sad_datetime: date
+        :param file_paths: list of SAD file paths in time order
+        :param output_folder: output folder of the M37 file
+        :return: SignalEventTaskSummary
+        """
+        start_time = time.perf_counter()
+        num_lines, num_m37s = self.process_sad_file(
+            cell, self.get_csv_file_objects_from_paths(file_paths), sad_datetime, output_folder
+        )
+        return SignalEventTaskSummary(
+            cell=cell,
+            date=sad_datetime,
+            output_path=SignalEventParser.get_output_path(cell, sad_datetime, output_folder),
+            num_files=len(file_paths),
+            num_lines=num_lines,
+            num_m37s=num_m37s,
+            seconds=time.perf_counter() - start_time,
+        )
 
     @staticmethod
     def get_csv_file_objects_from_paths(csv_files_paths):
         """
-        Function to return a list of file objects from csv paths
+        Function to return a list of line iterators from plain, gzip or zstd csv paths. Files are opened when the
+        first line is read and closed after the last, or when the iterator is closed
         :param csv_files_paths: list of csv file paths
-        :return: list file objects
+        :return: list of line iterators
         """
-        csv_file_objects = []
-        for file_path in csv_files_paths:
-            if file_path.endswith(".gz"):
-                csv_file_objects.append(gzip.open(file_path, "rt", encoding="utf-8"))
-            else:
-                csv_file_objects.append(open(file_path, "r", newline=""))
-        return csv_file_objects
+        return [iter_log_file_lines(file_path) for file_path in csv_files_paths]
 
-    def process_zipped_sad_file(self, sad_path):
+    def process_zipped_sad_file(self, sad_path, output_folder=DEFAULT_OUTPUT_FOLDER):
         """
         Method to process a zipped SAD file
         :param sad_path: SAD path
-        :return: None
+        :param output_folder: output folder of the M37 file
+        :return: tuple of the number of lines read and the number of M37s written
         """
         sad_datetime = self.get_datetime_from_sad_path(sad_path)
         cell = self.get_cell_from_sad_path(sad_path)
-        with gzip.open(sad_path, "rt", encoding="utf-8") as gz_file:
-            csv_reader = csv.reader(gz_file)
-            self.process_sad_file(cell, csv_reader, sad_datetime)
+        return self.process_sad_file(cell, [iter_log_file_lines(sad_path)], sad_datetime, output_folder)
 
-    def process_sad_file(self, cell, file_objects, sad_datetime):
+    def process_sad_file(self, cell, file_objects, sad_datetime, output_folder=DEFAULT_OUTPUT_FOLDER):
         """
         Method to process SAD file
         :param cell: UTC Cell
         :param file_objects: list containing file objects for the day
         :param sad_datetime: date
-        :return: None
+        :param output_folder: output folder of the M37 file
+        :return: tuple of the number of lines read and the number of M37s written
         """
-        t3 = datetime.now()
+        # each cell and date is processed with its own state, so events do not leak between them
+        self.site_states = defaultdict(lambda: "PRE")
+        self.controller_events = defaultdict(list)
+        self.m37s = []
+        num_lines = 0
         # chain the csv readers together so that 5 minute chunks of data is read as a continuous stream
         csv_reader = chain(*[csv.reader(file_object) for file_object in file_objects])
         for line in csv_reader:
+            num_lines += 1
             if self.is_data_line(line):
                 stage_id = self.get_stage_id(line[5])
                 site_id = self.get_site_id(line)
@@ -105,16 +137,12 @@ class SADParser:
                         )
                     )
                     self.site_states[site_id] = stage_id
-        t4 = datetime.now()
-        print("processing", t4 - t3)
-        print(len(self.controller_events))
         self.process_controller_events()
-        self.write_m37_to_csv(
-            f"resources/M37/converted_from_sad/M37_{sad_datetime.strftime('%Y%m%d')}_{cell.name}.csv"
-        )
+        self.write_m37_to_csv(SignalEventParser.get_output_path(cell, sad_datetime, output_folder))
         # close the file objects!
         for file_obj in file_objects:
             file_obj.close()
+        return num_lines, len(self.m37s)
 
     @staticmethod
     def is_stage_id_error(stage_string):
@@ -183,15 +211,16 @@ class SADParser:
                     )
                 )
 
-    def process_unzipped_sad_file(self, sad_path):
+    def process_unzipped_sad_file(self, sad_path, output_folder=DEFAULT_OUTPUT_FOLDER):
         """
         Method to process an unzipped SAD file
         :param sad_path: SAD path
-        :return: None
+        :param output_folder: output folder of the M37 file
+        :return: tuple of the number of lines read and the number of M37s written
         """
         sad_datetime = self.get_datetime_from_sad_path(sad_path)
         area = self.get_cell_from_sad_path(sad_path)
-        self.process_sad_file(area, [open(sad_path, "r")], sad_datetime)
+        return self.process_sad_file(area, [iter_log_file_lines(sad_path)], sad_datetime, output_folder)
 
     @staticmethod
     def get_stage_id(stage_string):
@@ -231,21 +260,7 @@ class SADParser:
         :param zip_file_path: zip file path
         :return: list
         """
-        # Open the zip file for reading
-        t5 = datetime.now()
-        with gzip.open(zip_file_path, "rt", encoding="utf-8") as gz_file:
-            csv_reader = csv.reader(gz_file)
-            t6 = datetime.now()
-            # Initialize a list to store the data
-            t7 = datetime.now()
-            data = []
-            # Iterate through the rows in the CSV file and append them to the data list
-            for row in csv_reader:
-                data.append(row)
-            t8 = datetime.now()
-            print("unzip", t6 - t5)
-            print("to list", t8 - t7)
-        return data
+        return list(iter_log_file_records(zip_file_path))
 
     def write_m37_to_csv(self, output_path):
         """
@@ -256,7 +271,7 @@ class SADParser:
         out_data = []
         m37_fields = fields(self.m37s[0])
         out_data.append([field.name for field in m37_fields])
-        sorted_m37s = sorted(self.m37s, key=lambda x: (x.timestamp, x.site_number))
+        sorted_m37s = sorted(self.m37s, key=lambda x: (x.timestamp, x.site_id))
 
         for m37 in sorted_m37s:
             out_data.append([getattr(m37, field.name) for field in m37_fields])
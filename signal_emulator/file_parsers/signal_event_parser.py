@@ -1,14 +1,72 @@
 import csv
-import gzip
+import logging
 import os
 import re
+import time
+from abc import ABC, abstractmethod
+from array import array
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from dataclasses import dataclass, fields
-from datetime import datetime, timedelta
-from itertools import chain
+from datetime import datetime
+from functools import partial
+from itertools import repeat
+from typing import Optional
+
+import numpy as np
+import pandas as pd
 
 from signal_emulator.enums import Cell
-from signal_emulator.utilities.utility_functions import list_to_csv
+from signal_emulator.utilities.log_file_reader import (
+    iter_log_file_lines,
+    iter_log_file_records,
+    strip_compression_suffix,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OUTPUT_FOLDER = "resources/M37/converted_from_sad"
+
+
+def _process_signal_event_files_worker(cell, sad_datetime, file_paths, output_folder, output_format):
+    """
+    Worker function to process the SAD files of one cell and date with a new SignalEventParser
+    :param cell: UTC Cell
+    :param sad_datetime: date
+    :param file_paths: list of SAD file paths in time order
+    :param output_folder: output folder of the M37 file
+    :param output_format: "csv" or "parquet"
+    :return: SignalEventTaskSummary
+    """
+    return SignalEventParser().process_signal_event_files(
+        cell, sad_datetime, file_paths, output_folder, output_format
+    )
+
+
+# M37Averages object owned by each aggregate worker process, set by the pool initializer
+_worker_m37_averages = None
+
+
+def _init_aggregate_worker(m37_averages):
+    """
+    Pool initializer, stores the M37Averages for use by the aggregate worker function. With the fork start method
+    the object is inherited by the worker, otherwise it is pickled once per worker
+    :param m37_averages: M37Averages object
+    :return: None
+    """
+    global _worker_m37_averages
+    _worker_m37_averages = m37_averages
+
+
+def _aggregate_signal_event_files_worker(cell, sad_datetime, file_paths):
+    """
+    Worker function to aggregate the SAD files of one cell and date with a new SignalEventParser
+    :param cell: UTC Cell
+    :param sad_datetime: date
+    :param file_paths: list of SAD file paths in time order
+    :return: SignalEventTaskSummary with stage aggregate
+    """
+    return SignalEventParser().aggregate_signal_event_files(cell, sad_datetime, file_paths, _worker_m37_averages)
 
 
 class SignalEventParser:
@@ -16,144 +74,352 @@ class SignalEventParser:
     Class to represent SAD file parser. SAD files are read, processed and exported as M37 format
     """
 
+    # time in seconds after which a site with no events is restarted
+    SITE_TIMEOUT = 300
+
     def __init__(self):
         """
         Constructor for SADParser
         """
         self.site_states = defaultdict(lambda: "PRE")
-        self.controller_events = defaultdict(list)
         self.m37_time_by_site = defaultdict(lambda: M37Time())
-        self.m37s = []
+        self.previous_event_times = {}
+        self.day_start_times = {}
 
     def process_signal_event_folder(
-        self, signal_event_folder, output_folder="resources/M37/converted_from_sad"
+        self, signal_event_folder, output_folder=DEFAULT_OUTPUT_FOLDER, processes=1, output_format="csv"
     ):
         """
-        Method to process a folder containing SAD files. Folder and sub folders are searched
+        Method to process a folder containing SAD files. Folder and sub folders are searched. The files of each cell
+        and date are processed as an independent task, each writing one M37 csv file. Tasks are run in a process
+        pool if processes is greater than 1, largest first so that the pool is kept busy
         :param signal_event_folder: Signal event folder
-        :return: None
+        :param output_folder: output folder of the M37 csv files
+        :param processes: number of worker processes
+        :param output_format: "csv" or "parquet"
+        :return: list of SignalEventTaskSummary, in cell and date order
+        """
+        return self.run_signal_event_tasks(
+            signal_event_folder,
+            partial(self.process_signal_event_files, output_folder=output_folder, output_format=output_format),
+            partial(_process_signal_event_files_worker, output_folder=output_folder, output_format=output_format),
+            processes,
+        )
+
+    def aggregate_signal_event_folder(self, signal_event_folder, m37_averages, processes=1):
+        """
+        Method to process a folder containing SAD files directly to the M37 stage time totals of M37Averages,
+        without writing M37 files. The files of each cell and date are aggregated as an independent task
+        :param signal_event_folder: Signal event folder
+        :param m37_averages: M37Averages object
+        :param processes: number of worker processes
+        :return: list of SignalEventTaskSummary with stage aggregates, in cell and date order
+        """
+        return self.run_signal_event_tasks(
+            signal_event_folder,
+            partial(self.aggregate_signal_event_files, m37_averages=m37_averages),
+            _aggregate_signal_event_files_worker,
+            processes,
+            initializer=_init_aggregate_worker,
+            initargs=(m37_averages,),
+        )
+
+    def run_signal_event_tasks(
+        self, signal_event_folder, task_function, worker_function, processes=1, initializer=None, initargs=()
+    ):
+        """
+        Method to run a task for the SAD files of each cell and date found in a folder. Tasks are run in a process
+        pool if processes is greater than 1, largest first so that the pool is kept busy
+        :param signal_event_folder: Signal event folder
+        :param task_function: function of cell, date and file paths to run the tasks in this process
+        :param worker_function: module level function of cell, date and file paths to run the tasks in the pool
+        :param processes: number of worker processes
+        :param initializer: pool initializer
+        :param initargs: arguments of the pool initializer
+        :return: list of SignalEventTaskSummary, in cell and date order
+        """
+        tasks = self.get_signal_event_tasks(signal_event_folder)
+        task_order = sorted(
+            tasks, key=lambda task: -sum(os.path.getsize(file_path) for file_path in tasks[task])
+        )
+        summaries = {}
+        if processes <= 1:
+            for cell, date in task_order:
+                summaries[cell, date] = task_function(cell, date, tasks[cell, date])
+                self.log_task_summary(summaries[cell, date])
+        elif tasks:
+            with ProcessPoolExecutor(
+                max_workers=min(processes, len(tasks)), initializer=initializer, initargs=initargs
+            ) as executor:
+                futures = {
+                    executor.submit(worker_function, cell, date, tasks[cell, date]): (cell, date)
+                    for cell, date in task_order
+                }
+                for future in as_completed(futures):
+                    summaries[futures[future]] = future.result()
+                    self.log_task_summary(summaries[futures[future]])
+        return [summaries[task] for task in sorted(tasks)]
+
+    @staticmethod
+    def get_signal_event_tasks(signal_event_folder):
+        """
+        Function to find the SAD files in a folder and group them by cell and date. Folder and sub folders are
+        searched, files are not opened
+        :param signal_event_folder: Signal event folder
+        :return: dict of (Cell, CustomDatetime) to list of file paths in time order
         """
-        files_by_area = defaultdict(lambda: defaultdict(list))
+        files_by_task = defaultdict(list)
         for root, dirs, files in os.walk(signal_event_folder):
             for file in files:
-                if file.endswith(".csv"):
+                if strip_compression_suffix(file).endswith(".csv"):
                     area = Cell[file[15:19]]
                     date = CustomDatetime.strptime(file[:9], "%b%d%Y")
-                    file_path = os.path.join(root, file)
-                    files_by_area[area][date].append(file_path)
-
-        csv_files_by_area = defaultdict(dict)
-        for area, dates in files_by_area.items():
-            for date, files in dates.items():
-                files_by_area[area][date] = sorted(
-                    files, key=lambda s: datetime.strptime(os.path.basename(s)[:14], "%b%d%Y_%H%M")
-                )
-                csv_files_by_area[area][date] = self.get_csv_file_objects_from_paths(files)
+                    files_by_task[area, date].append(os.path.join(root, file))
+        return {
+            task: sorted(
+                file_paths, key=lambda s: datetime.strptime(os.path.basename(s)[:14], "%b%d%Y_%H%M")
+            )
+            for task, file_paths in files_by_task.items()
+        }
 
-        for area, dates in csv_files_by_area.items():
-            for date, files in dates.items():
-                self.process_sad_file(area, files, date, output_folder)
+    def process_signal_event_files(self, cell, sad_datetime, file_paths, output_folder, output_format="csv"):
+        """
+        Method to process the SAD files of one cell and date
+        :param cell: UTC Cell
+        :param sad_datetime: date
+        :param file_paths: list of SAD file paths in time order
+        :param output_folder: output folder of the M37 file
+        :param output_format: "csv" or "parquet"
+        :return: SignalEventTaskSummary
+        """
+        start_time = time.perf_counter()
+        num_lines, num_m37s = self.process_sad_file(
+            cell, self.get_csv_file_objects_from_paths(file_paths), sad_datetime, output_folder, output_format
+        )
+        return SignalEventTaskSummary(
+            cell=cell,
+            date=sad_datetime,
+            output_path=self.get_output_path(cell, sad_datetime, output_folder, output_format),
+            num_files=len(file_paths),
+            num_lines=num_lines,
+            num_m37s=num_m37s,
+            seconds=time.perf_counter() - start_time,
+        )
+
+    def aggregate_signal_event_files(self, cell, sad_datetime, file_paths, m37_averages):
+        """
+        Method to aggregate the SAD files of one cell and date to M37 stage time totals
+        :param cell: UTC Cell
+        :param sad_datetime: date
+        :param file_paths: list of SAD file paths in time order
+        :param m37_averages: M37Averages object
+        :return: SignalEventTaskSummary with stage aggregate
+        """
+        start_time = time.perf_counter()
+        with M37ColumnAggregator(m37_averages) as m37_aggregator:
+            num_lines = self.process_signal_events(self.get_csv_file_objects_from_paths(file_paths), m37_aggregator)
+        return SignalEventTaskSummary(
+            cell=cell,
+            date=sad_datetime,
+            output_path=None,
+            num_files=len(file_paths),
+            num_lines=num_lines,
+            num_m37s=m37_aggregator.num_m37s,
+            seconds=time.perf_counter() - start_time,
+            stage_aggregate=m37_aggregator.get_stage_aggregate(),
+        )
+
+    @staticmethod
+    def log_task_summary(summary):
+        logger.info(
+            f"Converted {summary.num_files} SAD files for {summary.cell.name} {summary.date.strftime('%Y-%m-%d')}: "
+            f"{summary.num_lines} lines to {summary.num_m37s} M37s in {summary.seconds:.1f}s "
+            f"({summary.lines_per_second:.0f} lines/s)"
+        )
+
+    @staticmethod
+    def get_output_path(cell, sad_datetime, output_folder, output_format="csv"):
+        return os.path.join(output_folder, f"M37_{sad_datetime.strftime('%Y%m%d')}_{cell.name}.{output_format}")
 
     @staticmethod
     def get_csv_file_objects_from_paths(csv_files_paths):
         """
-        Function to return a list of file objects from csv paths
+        Function to return a list of line iterators from plain, gzip or zstd csv paths. Files are opened when the
+        first line is read and closed after the last, or when the iterator is closed
         :param csv_files_paths: list of csv file paths
-        :return: list file objects
+        :return: list of line iterators
         """
-        csv_file_objects = []
-        for file_path in csv_files_paths:
-            if file_path.endswith(".gz"):
-                csv_file_objects.append(gzip.open(file_path, "rt", encoding="utf-8"))
-            else:
-                csv_file_objects.append(open(file_path, "r", newline=""))
-        return csv_file_objects
+        return [iter_log_file_lines(file_path) for file_path in csv_files_paths]
 
-    def process_zipped_sad_file(self, sad_path):
+    def process_zipped_sad_file(self, sad_path, output_folder=DEFAULT_OUTPUT_FOLDER, output_format="csv"):
         """
         Method to process a zipped SAD file
         :param sad_path: SAD path
-        :return: None
+        :param output_folder: output folder of the M37 file
+        :param output_format: "csv" or "parquet"
+        :return: tuple of the number of lines read and the number of M37s written
         """
         sad_datetime = self.get_datetime_from_sad_path(sad_path)
         cell = self.get_cell_from_sad_path(sad_path)
-        with gzip.open(sad_path, "rt", encoding="utf-8") as gz_file:
-            csv_reader = csv.reader(gz_file)
-            self.process_sad_file(cell, csv_reader, sad_datetime)
+        return self.process_sad_file(
+            cell, [iter_log_file_lines(sad_path)], sad_datetime, output_folder, output_format
+        )
 
-    def process_sad_file(self, cell, file_objects, sad_datetime, output_folder):
+    def process_sad_file(
+        self, cell, file_objects, sad_datetime, output_folder=DEFAULT_OUTPUT_FOLDER, output_format="csv"
+    ):
         """
-        Method to process SAD file
+        Method to process SAD file. The lines are streamed through a sliding window of the previous, current and next
+        line, and the M37s are written as they are completed, so memory use does not grow with the length of the day.
+        The file objects must be in time order and not overlap in time, as the 5 minute SAD files are
         :param cell: UTC Cell
         :param file_objects: list containing file objects for the day
         :param sad_datetime: date
-        :return: None
+        :param output_folder: output folder of the M37 file
+        :param output_format: "csv" or "parquet"
+        :return: tuple of the number of lines read and the number of M37s written
         """
-        t3 = datetime.now()
-
-        previous_timestamp = defaultdict(lambda: None)
-        # chain the csv readers together so that 5 minute chunks of data is read as a continuous stream
-        csv_reader = chain(*[csv.reader(file_object) for file_object in file_objects])
-        # for line in csv_reader:
-        t55 = datetime.now()
-        all_lines = [line for line in csv_reader]
-        print("to list", datetime.now() - t55)
-        num_lines = len(all_lines)
-        for i in range(num_lines):
-            line = all_lines[i]
-            previous_line = all_lines[i - 1] if i > 0 else None
-            next_line = all_lines[i + 1] if i < num_lines - 1 else None
-            if self.is_data_line(line):
-                if self.line_is_error(line, previous_line, next_line):
-                    continue
-                stage_id = f"G{line[6]}"
-                site_id = line[0]
-                event_time = CustomDatetime.strptime(line[1].strip(), "%Y-%m-%d %H:%M:%S")
-                # print(event_time, site_id, stage_id)
-                if (
-                    previous_timestamp[site_id]
-                    and timedelta(minutes=5) < event_time - previous_timestamp[site_id]
-                ):
-                    self.site_states[site_id] = "PRE"
-                    self.m37_time_by_site[site_id] = M37Time()
-                    aa = 55
-                if self.is_new_state(site_id, stage_id):
-                    if self.site_states[site_id] == "PRE" and stage_id != "G0":
-                        continue
-
-                    # if self.m37_time_by_site[site_id].interstage_time is None:
-                    if self.m37_time_by_site[site_id].interstage_start_time is None:
-                        self.m37_time_by_site[site_id] = M37Time()
-                        self.m37_time_by_site[site_id].node_id = site_id
-                        self.m37_time_by_site[site_id].site_id = site_id
-                        self.m37_time_by_site[site_id].interstage_start_time = event_time
-
-                    elif self.m37_time_by_site[site_id].stage_start_time is None:
-                        self.m37_time_by_site[site_id].stage_start_time = event_time
-                        self.m37_time_by_site[site_id].utc_stage_id = stage_id
-
-                    elif self.m37_time_by_site[site_id].stage_end_time is None:
-                        self.m37_time_by_site[site_id].stage_end_time = event_time
-                        self.m37_time_by_site[site_id].timestamp = event_time
-                        self.controller_events[site_id].append(self.m37_time_by_site[site_id])
-                        self.m37_time_by_site[site_id] = M37Time()
-                        self.m37_time_by_site[site_id].node_id = site_id
-                        self.m37_time_by_site[site_id].site_id = site_id
-                        self.m37_time_by_site[site_id].interstage_start_time = event_time
-
-                    self.site_states[site_id] = stage_id
-
-                previous_timestamp[site_id] = event_time
-        t4 = datetime.now()
-        print("processing", t4 - t3)
-        print(len(self.controller_events))
-        self.process_controller_events()
-        self.write_m37_to_csv(
-            os.path.join(output_folder, f"M37_{sad_datetime.strftime('%Y%m%d')}_{cell.name}.csv")
-        )
-        # close the file objects!
+        with M37ColumnWriter(
+            self.get_output_path(cell, sad_datetime, output_folder, output_format), output_format
+        ) as m37_writer:
+            num_lines = self.process_signal_events(file_objects, m37_writer)
+        return num_lines, m37_writer.num_m37s
+
+    def process_signal_events(self, file_objects, m37_buffer):
+        """
+        Method to process the SAD files of one cell and date and pass the completed M37s to an output. Completed
+        M37s are buffered until no earlier M37 can be completed, so they are output in time order
+        :param file_objects: list containing file objects for the day, in time order
+        :param m37_buffer: M37ColumnBuffer
+        :return: number of lines read
+        """
+        self.site_states = defaultdict(lambda: "PRE")
+        self.m37_time_by_site = defaultdict(lambda: M37Time())
+        self.previous_event_times = {}
+        latest_event_time = None
+        num_lines = 0
+        file_index = None
+        for previous_line, (line_file_index, line), next_line in self.sliding_window(
+            self.iterate_file_lines(file_objects)
+        ):
+            num_lines += 1
+            if line_file_index != file_index:
+                file_index = line_file_index
+                if latest_event_time is not None:
+                    m37_buffer.flush(self.get_completion_time_bound(latest_event_time))
+            if not self.is_data_line(line):
+                continue
+            if self.line_is_error(
+                line,
+                previous_line[1] if previous_line else None,
+                next_line[1] if next_line else None,
+            ):
+                continue
+            event_time = self.get_event_time(line[1].strip())
+            if latest_event_time is None or event_time > latest_event_time:
+                latest_event_time = event_time
+            completed_m37_time = self.process_event(line[0], f"G{line[6]}", event_time)
+            if completed_m37_time is not None:
+                m37_buffer.add_m37_time(completed_m37_time)
         for file_obj in file_objects:
             file_obj.close()
+        return num_lines
+
+    def process_event(self, site_id, stage_id, event_time):
+        """
+        Method to update the state of a site with a SAD event
+        :param site_id: site id
+        :param stage_id: stage id
+        :param event_time: event time in seconds
+        :return: M37Time completed by the event, or None
+        """
+        completed_m37_time = None
+        previous_event_time = self.previous_event_times.get(site_id)
+        if previous_event_time is not None and self.SITE_TIMEOUT < event_time - previous_event_time:
+            self.site_states[site_id] = "PRE"
+            self.m37_time_by_site[site_id] = M37Time()
+        self.previous_event_times[site_id] = event_time
+        if not self.is_new_state(site_id, stage_id):
+            return None
+        if self.site_states[site_id] == "PRE" and stage_id != "G0":
+            return None
+        m37_time = self.m37_time_by_site[site_id]
+        if m37_time.interstage_start_time is None:
+            self.m37_time_by_site[site_id] = M37Time.start(site_id, event_time)
+        elif m37_time.stage_start_time is None:
+            m37_time.stage_start_time = event_time
+            m37_time.utc_stage_id = stage_id
+        elif m37_time.stage_end_time is None:
+            m37_time.stage_end_time = event_time
+            m37_time.timestamp = event_time
+            completed_m37_time = m37_time
+            self.m37_time_by_site[site_id] = M37Time.start(site_id, event_time)
+        self.site_states[site_id] = stage_id
+        return completed_m37_time
+
+    def get_completion_time_bound(self, latest_event_time):
+        """
+        Function to get the time before which no more M37s can be completed. Later events are no earlier than the
+        latest event time, and the M37s of a site in progress are timestamped after its interstage start time,
+        unless the site has timed out and will be restarted
+        :param latest_event_time: latest event time in seconds
+        :return: time in seconds
+        """
+        completion_time_bound = latest_event_time
+        for site_id, m37_time in self.m37_time_by_site.items():
+            if (
+                m37_time.interstage_start_time is not None
+                and latest_event_time - self.previous_event_times[site_id] <= self.SITE_TIMEOUT
+            ):
+                completion_time_bound = min(completion_time_bound, m37_time.interstage_start_time)
+        return completion_time_bound
+
+    @staticmethod
+    def iterate_file_lines(file_objects):
+        """
+        Generator of the lines of the file objects read as a continuous stream
+        :param file_objects: list of file objects or line iterators
+        :return: tuple of file index and line
+        """
+        for file_index, file_object in enumerate(file_objects):
+            for line in csv.reader(file_object):
+                yield file_index, line
+
+    @staticmethod
+    def sliding_window(iterable):
+        """
+        Generator of each item of iterable with the previous and next items, None before the first and after the last
+        :param iterable: iterable
+        :return: tuple of previous item, item and next item
+        """
+        previous_item = None
+        iterator = iter(iterable)
+        item = next(iterator, None)
+        while item is not None:
+            next_item = next(iterator, None)
+            yield previous_item, item, next_item
+            previous_item, item = item, next_item
+
+    def get_event_time(self, timestamp_string):
+        """
+        Function to get the time of a SAD event in seconds from its YYYY-MM-DD HH:MM:SS timestamp. The start time of
+        each date is cached, so only the time of day is parsed for each event
+        :param timestamp_string: timestamp string
+        :return: time in seconds
+        """
+        date_string = timestamp_string[:10]
+        day_start_time = self.day_start_times.get(date_string)
+        if day_start_time is None:
+            day_start_time = int(
+                (CustomDatetime.strptime(date_string, "%Y-%m-%d") - EPOCH).total_seconds()
+            )
+            self.day_start_times[date_string] = day_start_time
+        return (
+            day_start_time
+            + int(timestamp_string[11:13]) * 3600
+            + int(timestamp_string[14:16]) * 60
+            + int(timestamp_string[17:19])
+        )
 
     @staticmethod
     def line_is_error(line, previous_line, next_line):
@@ -202,78 +468,19 @@ class SignalEventParser:
         filename_parts = filename.split(".")
         return Cell[filename_parts[0][-5:]]
 
-    def process_controller_events(self):
-        """
-        Method to process controller events
-        :return: None
-        """
-        for site, m37_times in self.controller_events.items():
-            for m37_time in m37_times:
-                if m37_time.utc_stage_id == "GX":
-                    # The PG stage
-                    self.m37s.append(
-                        M37(
-                            timestamp=m37_time.stage_start_time + timedelta(seconds=1),
-                            message_id="M37",
-                            node_id=m37_time.node_id,
-                            site_id=m37_time.site_id,
-                            utc_stage_id="PG",
-                            length=(
-                                m37_time.stage_start_time - m37_time.interstage_start_time
-                            ).total_seconds(),
-                            green_time=(
-                                m37_time.stage_start_time - m37_time.interstage_start_time
-                            ).total_seconds(),
-                            interstage_time=0,
-                        )
-                    )
-                    # The GX stage
-                    self.m37s.append(
-                        M37(
-                            timestamp=m37_time.timestamp + timedelta(seconds=1),
-                            message_id="M37",
-                            node_id=m37_time.node_id,
-                            site_id=m37_time.site_id,
-                            utc_stage_id="GX",
-                            length=(
-                                m37_time.stage_end_time - m37_time.stage_start_time
-                            ).total_seconds(),
-                            green_time=(
-                                m37_time.stage_end_time - m37_time.stage_start_time
-                            ).total_seconds(),
-                            interstage_time=0,
-                        )
-                    )
-                else:
-                    self.m37s.append(
-                        M37(
-                            timestamp=m37_time.timestamp + timedelta(seconds=1),
-                            message_id="M37",
-                            node_id=m37_time.node_id,
-                            site_id=m37_time.site_id,
-                            utc_stage_id=m37_time.utc_stage_id,
-                            length=(
-                                m37_time.stage_end_time - m37_time.interstage_start_time
-                            ).total_seconds(),
-                            green_time=(
-                                m37_time.stage_end_time - m37_time.stage_start_time
-                            ).total_seconds(),
-                            interstage_time=(
-                                m37_time.stage_start_time - m37_time.interstage_start_time
-                            ).total_seconds(),
-                        )
-                    )
-        self.m37s = sorted(self.m37s, key=lambda x: (x.timestamp, x.site_id))
-
-    def process_unzipped_sad_file(self, sad_path):
+    def process_unzipped_sad_file(self, sad_path, output_folder=DEFAULT_OUTPUT_FOLDER, output_format="csv"):
         """
         Method to process an unzipped SAD file
         :param sad_path: SAD path
-        :return: None
+        :param output_folder: output folder of the M37 file
+        :param output_format: "csv" or "parquet"
+        :return: tuple of the number of lines read and the number of M37s written
         """
         sad_datetime = self.get_datetime_from_sad_path(sad_path)
         area = self.get_cell_from_sad_path(sad_path)
-        self.process_sad_file(area, [open(sad_path, "r")], sad_datetime)
+        return self.process_sad_file(
+            area, [iter_log_file_lines(sad_path)], sad_datetime, output_folder, output_format
+        )
 
     @staticmethod
     def get_stage_id(stage_string):
@@ -313,36 +520,7 @@ class SignalEventParser:
         :param zip_file_path: zip file path
         :return: list
         """
-        # Open the zip file for reading
-        t5 = datetime.now()
-        with gzip.open(zip_file_path, "rt", encoding="utf-8") as gz_file:
-            csv_reader = csv.reader(gz_file)
-            t6 = datetime.now()
-            # Initialize a list to store the data
-            t7 = datetime.now()
-            data = []
-            # Iterate through the rows in the CSV file and append them to the data list
-            for row in csv_reader:
-                data.append(row)
-            t8 = datetime.now()
-            print("unzip", t6 - t5)
-            print("to list", t8 - t7)
-        return data
-
-    def write_m37_to_csv(self, output_path):
-        """
-        Write M37 data to csv file
-        :param output_path: output csv path
-        :return: None
-        """
-        out_data = []
-        m37_fields = fields(self.m37s[0])
-        out_data.append([field.name for field in m37_fields])
-        sorted_m37s = sorted(self.m37s, key=lambda x: (x.timestamp, x.site_id))
-
-        for m37 in sorted_m37s:
-            out_data.append([getattr(m37, field.name) for field in m37_fields])
-        list_to_csv(out_data, output_path)
+        return list(iter_log_file_records(zip_file_path))
 
 
 class CustomDatetime(datetime):
@@ -358,11 +536,256 @@ class CustomDatetime(datetime):
         return self.strftime("%Y-%m-%dT%H:%M:%SZ")
 
 
+EPOCH = CustomDatetime(1970, 1, 1)
+SECONDS_PER_DAY = 86400
+
+
+class M37ColumnBuffer(ABC):
+    """
+    Base class of the outputs of completed M37s. M37s are accumulated in typed column buffers, and each flush sorts
+    the buffered M37s by timestamp and site id with a single argsort and passes them to write_columns
+    """
+
+    def __init__(self):
+        """
+        Constructor for M37ColumnBuffer
+        """
+        self.num_m37s = 0
+        # times are in seconds
+        self.timestamps = array("q")
+        self.site_ids = []
+        self.utc_stage_ids = []
+        self.lengths = array("q")
+        self.green_times = array("q")
+        self.interstage_times = array("q")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add_m37_time(self, m37_time):
+        """
+        Method to add the M37s of a completed M37Time, a GX stage is added as a PG stage and a GX stage
+        :param m37_time: M37Time
+        :return: None
+        """
+        if m37_time.utc_stage_id == "GX":
+            pg_time = m37_time.stage_start_time - m37_time.interstage_start_time
+            gx_time = m37_time.stage_end_time - m37_time.stage_start_time
+            self.add(m37_time.stage_start_time + 1, m37_time.site_id, "PG", pg_time, pg_time, 0)
+            self.add(m37_time.timestamp + 1, m37_time.site_id, "GX", gx_time, gx_time, 0)
+        else:
+            self.add(
+                m37_time.timestamp + 1,
+                m37_time.site_id,
+                m37_time.utc_stage_id,
+                m37_time.stage_end_time - m37_time.interstage_start_time,
+                m37_time.stage_end_time - m37_time.stage_start_time,
+                m37_time.stage_start_time - m37_time.interstage_start_time,
+            )
+
+    def add(self, timestamp, site_id, utc_stage_id, length, green_time, interstage_time):
+        self.timestamps.append(timestamp)
+        self.site_ids.append(site_id)
+        self.utc_stage_ids.append(utc_stage_id)
+        self.lengths.append(length)
+        self.green_times.append(green_time)
+        self.interstage_times.append(interstage_time)
+
+    def flush(self, completion_time_bound=None):
+        """
+        Method to write the buffered M37s in order of timestamp and site id. M37s with equal timestamp and site id
+        are written in the order they were added
+        :param completion_time_bound: M37s are written up to this time in seconds, all are written if None
+        :return: None
+        """
+        timestamps = np.frombuffer(self.timestamps, dtype=np.int64)
+        site_ids = np.array(self.site_ids, dtype=str)
+        int_columns = [
+            np.frombuffer(column, dtype=np.int64) for column in (self.lengths, self.green_times, self.interstage_times)
+        ]
+        utc_stage_ids = np.array(self.utc_stage_ids, dtype=str)
+        if completion_time_bound is None:
+            is_complete = np.ones(len(timestamps), dtype=bool)
+        else:
+            is_complete = timestamps <= completion_time_bound
+        complete_indices = np.flatnonzero(is_complete)
+        # lexsort is stable, the last key is the primary sort key
+        order = complete_indices[np.lexsort((site_ids[complete_indices], timestamps[complete_indices]))]
+        if len(order):
+            self.num_m37s += len(order)
+            self.write_columns(
+                timestamps[order], site_ids[order], utc_stage_ids[order], *(column[order] for column in int_columns)
+            )
+        remaining = np.flatnonzero(~is_complete)
+        self.timestamps = array("q", timestamps[remaining].tobytes())
+        self.site_ids = site_ids[remaining].tolist()
+        self.utc_stage_ids = utc_stage_ids[remaining].tolist()
+        self.lengths, self.green_times, self.interstage_times = (
+            array("q", column[remaining].tobytes()) for column in int_columns
+        )
+
+    @abstractmethod
+    def write_columns(self, timestamps, site_ids, utc_stage_ids, lengths, green_times, interstage_times):
+        """
+        Method to output sorted columns of M37s
+        :param timestamps: numpy array of times in seconds
+        :param site_ids: numpy array of site ids, also used as the node ids
+        :param utc_stage_ids: numpy array of UTC stage ids
+        :param lengths: numpy array of M37 lengths in seconds
+        :param green_times: numpy array of green times in seconds
+        :param interstage_times: numpy array of interstage times in seconds
+        :return: None
+        """
+
+    def close(self):
+        self.flush()
+
+
+class M37ColumnWriter(M37ColumnBuffer):
+    """
+    Class to write M37s to a csv or Parquet file
+    """
+
+    def __init__(self, output_path, output_format="csv"):
+        """
+        Constructor for M37ColumnWriter
+        :param output_path: output file path
+        :param output_format: "csv" or "parquet", pyarrow is required for Parquet output
+        """
+        super().__init__()
+        assert output_format in ("csv", "parquet")
+        self.output_path = output_path
+        self.output_format = output_format
+        self.field_names = [field.name for field in fields(M37)]
+        if output_format == "parquet":
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError as error:
+                raise ImportError("pyarrow is required for Parquet output: pip install pyarrow") from error
+            self.pa = pa
+            self.output_file = None
+            self.parquet_writer = pq.ParquetWriter(
+                output_path,
+                pa.schema(
+                    [
+                        ("timestamp", pa.timestamp("s")),
+                        ("message_id", pa.string()),
+                        ("node_id", pa.string()),
+                        ("site_id", pa.string()),
+                        ("utc_stage_id", pa.string()),
+                        ("length", pa.int32()),
+                        ("green_time", pa.int32()),
+                        ("interstage_time", pa.int32()),
+                    ]
+                ),
+            )
+        else:
+            self.output_file = open(output_path, "w", newline="")
+            self.csv_writer = csv.writer(self.output_file)
+            self.csv_writer.writerow(self.field_names)
+
+    def write_columns(self, timestamps, site_ids, utc_stage_ids, lengths, green_times, interstage_times):
+        timestamps = timestamps.astype("datetime64[s]")
+        if self.output_format == "parquet":
+            pa = self.pa
+            self.parquet_writer.write_table(
+                pa.table(
+                    [
+                        pa.array(timestamps),
+                        pa.array(np.full(len(timestamps), "M37")),
+                        pa.array(site_ids),
+                        pa.array(site_ids),
+                        pa.array(utc_stage_ids),
+                        pa.array(lengths, type=pa.int32()),
+                        pa.array(green_times, type=pa.int32()),
+                        pa.array(interstage_times, type=pa.int32()),
+                    ],
+                    schema=self.parquet_writer.schema,
+                )
+            )
+        else:
+            site_ids = site_ids.tolist()
+            self.csv_writer.writerows(
+                zip(
+                    np.char.add(np.datetime_as_string(timestamps, unit="s"), "Z").tolist(),
+                    repeat("M37"),
+                    site_ids,
+                    site_ids,
+                    utc_stage_ids.tolist(),
+                    lengths.tolist(),
+                    green_times.tolist(),
+                    interstage_times.tolist(),
+                )
+            )
+
+    def close(self):
+        super().close()
+        if self.output_file is None:
+            self.parquet_writer.close()
+        else:
+            self.output_file.close()
+
+
+class M37ColumnAggregator(M37ColumnBuffer):
+    """
+    Class to aggregate M37s to stage time totals by period, node, site and stage with
+    M37Averages.aggregate_stage_times as they are completed, so that raw M37s are never written or read
+    """
+
+    def __init__(self, m37_averages):
+        """
+        Constructor for M37ColumnAggregator
+        :param m37_averages: M37Averages object
+        """
+        super().__init__()
+        self.m37_averages = m37_averages
+        self.stage_aggregates = []
+
+    def write_columns(self, timestamps, site_ids, utc_stage_ids, lengths, green_times, interstage_times):
+        m37_chunk = pd.DataFrame(
+            {
+                "node_id": site_ids,
+                "site_id": site_ids,
+                "utc_stage_id": utc_stage_ids,
+                "intergreen_time": interstage_times,
+                "green_time": green_times,
+            }
+        )
+        time_of_day = (timestamps % SECONDS_PER_DAY).astype("timedelta64[s]").astype("timedelta64[ns]")
+        self.stage_aggregates.append(self.m37_averages.aggregate_stage_times(m37_chunk, time_of_day))
+        if len(self.stage_aggregates) >= self.m37_averages.MAX_PARTIAL_AGGREGATES:
+            self.stage_aggregates = [self.m37_averages.combine_stage_aggregates(self.stage_aggregates)]
+
+    def get_stage_aggregate(self):
+        """
+        Function to get the stage time totals of all M37s
+        :return: DataFrame of stage time totals and counts, or None if there are no M37s
+        """
+        if not self.stage_aggregates:
+            return None
+        return self.m37_averages.combine_stage_aggregates(self.stage_aggregates)
+
+
 class M37Time:
     """
-    Class for an M37 times
+    Class for an M37 times, times are in seconds
     """
 
+    __slots__ = (
+        "timestamp",
+        "message_id",
+        "node_id",
+        "site_id",
+        "utc_stage_id",
+        "interstage_start_time",
+        "stage_start_time",
+        "stage_end_time",
+    )
+
     def __init__(self):
         self.timestamp = None
         self.message_id = "M37"
@@ -373,6 +796,40 @@ class M37Time:
         self.stage_start_time = None
         self.stage_end_time = None
 
+    @classmethod
+    def start(cls, site_id, interstage_start_time):
+        """
+        Function to start the M37Time of a site at the start of an interstage
+        :param site_id: site id
+        :param interstage_start_time: interstage start time in seconds
+        :return: M37Time
+        """
+        m37_time = cls()
+        m37_time.node_id = site_id
+        m37_time.site_id = site_id
+        m37_time.interstage_start_time = interstage_start_time
+        return m37_time
+
+
+@dataclass
+class SignalEventTaskSummary:
+    """
+    Dataclass for the summary of the conversion of the SAD files of one cell and date
+    """
+
+    cell: Cell
+    date: CustomDatetime
+    output_path: str
+    num_files: int
+    num_lines: int
+    num_m37s: int
+    seconds: float
+    stage_aggregate: Optional[object] = None
+
+    @property
+    def lines_per_second(self):
+        return self.num_lines / self.seconds if self.seconds else 0.0
+
 
 @dataclass
 class M37:
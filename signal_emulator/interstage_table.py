@@ -0,0 +1,282 @@
+import numpy as np
+
+
+class InterstageTable:
+    """
+    Class to represent the compiled interstage times of one controller. The intergreen and phase delay times of the
+    controller are held in arrays indexed by stage and phase ordinals, and the max start time of every phase and the
+    interstage time of every stage to stage move are calculated once when the table is built
+    """
+
+    def __init__(self, signal_emulator, controller, time_period_id=None):
+        """
+        Constructor for InterstageTable
+        :param signal_emulator: SignalEmulator object
+        :param controller: Controller
+        :param time_period_id: time period id of the modified intergreens and phase delays to apply,
+            unmodified times are used if None
+        """
+        self.signal_emulator = signal_emulator
+        self.controller_key = controller.controller_key
+        self.time_period_id = time_period_id
+        stages = [stage for stage in controller.stages if stage is not None]
+        phases = [phase for phase in controller.phases if phase is not None]
+        self.stage_index = {stage.stage_number: index for index, stage in enumerate(stages)}
+        self.phase_index = {phase.phase_ref: index for index, phase in enumerate(phases)}
+        self.phases_in_stage = np.zeros((len(stages), len(phases)), dtype=bool)
+        for stage in stages:
+            for phase_ref in stage.phase_keys_in_stage:
+                if phase_ref in self.phase_index:
+                    self.phases_in_stage[self.stage_index[stage.stage_number], self.phase_index[phase_ref]] = True
+        self.intergreen_times = self.get_intergreen_times(controller)
+        self.delay_times = self.get_delay_times(controller)
+        self.max_start_times, self.interstage_times = self.compile()
+
+    def get_intergreen_times(self, controller):
+        """
+        Function to get the intergreen times as an array indexed by end phase and start phase
+        :param controller: Controller
+        :return: numpy array
+        """
+        intergreen_times = np.zeros((len(self.phase_index), len(self.phase_index)), dtype=np.int64)
+        intergreens = [
+            self.signal_emulator.intergreens.get_by_key((self.controller_key,) + intergreen_key)
+            for intergreen_key in controller.intergreen_keys
+        ]
+        if self.time_period_id is not None:
+            intergreens.extend(
+                self.signal_emulator.modified_intergreens.get_by_controller_key_time_period_id(
+                    self.controller_key, self.time_period_id
+                )
+            )
+        for intergreen in intergreens:
+            if intergreen.end_phase_key in self.phase_index and intergreen.start_phase_key in self.phase_index:
+                intergreen_times[
+                    self.phase_index[intergreen.end_phase_key], self.phase_index[intergreen.start_phase_key]
+                ] = intergreen.intergreen_time
+        return intergreen_times
+
+    def get_delay_times(self, controller):
+        """
+        Function to get the phase delay times as an array indexed by end stage, start stage and phase
+        :param controller: Controller
+        :return: numpy array
+        """
+        delay_times = np.zeros(
+            (len(self.stage_index), len(self.stage_index), len(self.phase_index)), dtype=np.int64
+        )
+        phase_delays = [
+            self.signal_emulator.phase_delays.data.get((self.controller_key,) + phase_delay_key)
+            for phase_delay_key in controller.phase_delay_keys
+        ]
+        if self.time_period_id is not None:
+            phase_delays.extend(
+                self.signal_emulator.modified_phase_delays.get_by_controller_key_time_period_id(
+                    self.controller_key, self.time_period_id
+                )
+            )
+        for phase_delay in phase_delays:
+            if (
+                phase_delay is not None
+                and phase_delay.end_stage_key in self.stage_index
+                and phase_delay.start_stage_key in self.stage_index
+                and phase_delay.phase_ref in self.phase_index
+            ):
+                delay_times[
+                    self.stage_index[phase_delay.end_stage_key],
+                    self.stage_index[phase_delay.start_stage_key],
+                    self.phase_index[phase_delay.phase_ref],
+                ] = phase_delay.delay_time
+        return delay_times
+
+    def compile(self):
+        """
+        Function to calculate the max start time of each phase and the interstage time for every stage to stage move.
+        The max start time of a phase is the greatest of the end phase delay plus intergreen over all end phases and
+        its own phase delay, or zero if there are no end phases
+        :return: tuple of max start times array indexed by end stage, start stage and phase,
+            and interstage times array indexed by end stage and start stage
+        """
+        num_stages, num_phases = self.phases_in_stage.shape
+        max_start_times = np.zeros((num_stages, num_stages, num_phases), dtype=np.int64)
+        interstage_times = np.zeros((num_stages, num_stages), dtype=np.int64)
+        if num_stages == 0 or num_phases == 0:
+            return max_start_times, interstage_times
+        for end_stage_index in range(num_stages):
+            in_end_stage = self.phases_in_stage[end_stage_index]
+            end_phases = in_end_stage[None, :] & ~self.phases_in_stage
+            start_phases = ~in_end_stage[None, :] & self.phases_in_stage
+            delay_times = self.delay_times[end_stage_index]
+            end_phase_times = np.where(
+                end_phases[:, :, None],
+                delay_times[:, :, None] + self.intergreen_times[None, :, :],
+                0,
+            ).max(axis=1)
+            max_start_times[end_stage_index] = np.where(
+                end_phases.any(axis=1)[:, None], np.maximum(end_phase_times, delay_times), 0
+            )
+            interstage_times[end_stage_index] = np.where(
+                start_phases, max_start_times[end_stage_index], 0
+            ).max(axis=1)
+        return max_start_times, interstage_times
+
+    def get_interstage_time(self, end_stage_key, start_stage_key):
+        """
+        Function to get the interstage time of a stage to stage move
+        :param end_stage_key: end stage number
+        :param start_stage_key: start stage number
+        :return: interstage time, or None if the stages are not in the table
+        """
+        if end_stage_key not in self.stage_index or start_stage_key not in self.stage_index:
+            return None
+        return int(
+            self.interstage_times[self.stage_index[end_stage_key], self.stage_index[start_stage_key]]
+        )
+
+    def get_max_start_time(self, end_stage_key, start_stage_key, phase_ref):
+        """
+        Function to get the time after the start of a stage to stage move that a phase can start
+        :param end_stage_key: end stage number
+        :param start_stage_key: start stage number
+        :param phase_ref: phase ref of the starting phase
+        :return: max start time, or None if the stages or phase are not in the table
+        """
+        if (
+            end_stage_key not in self.stage_index
+            or start_stage_key not in self.stage_index
+            or phase_ref not in self.phase_index
+        ):
+            return None
+        return int(
+            self.max_start_times[
+                self.stage_index[end_stage_key],
+                self.stage_index[start_stage_key],
+                self.phase_index[phase_ref],
+            ]
+        )
+
+
+class InterstageTables:
+    """
+    Class to hold the InterstageTables of each controller. Tables are built on first use for the unmodified
+    intergreens and phase delays, and for each time period with modifications applied. A time period table is
+    invalidated when a modified intergreen or phase delay of the controller is added or removed, and all of a
+    controller's tables are invalidated when one of its intergreens or phase delays changes or it is reloaded
+    """
+
+    def __init__(self, signal_emulator):
+        """
+        Constructor for InterstageTables
+        :param signal_emulator: SignalEmulator object
+        """
+        self.signal_emulator = signal_emulator
+        self.data = {}
+
+    def __len__(self):
+        return len(self.data)
+
+    def get_table(self, controller_key, modified=True, context=None):
+        """
+        Function to get the InterstageTable of a controller, building it if required
+        :param controller_key: controller key
+        :param modified: bool, apply the modified intergreens and phase delays of the time period
+        :param context: EmulationContext
+        :return: InterstageTable, or None if the controller does not exist
+        """
+        time_period_id = self.signal_emulator.time_periods.get_period_id(context) if modified else None
+        key = controller_key, time_period_id
+        if key not in self.data:
+            controller = self.signal_emulator.controllers.get_by_key(controller_key)
+            if controller is None:
+                return None
+            self.data[key] = InterstageTable(self.signal_emulator, controller, time_period_id)
+        return self.data[key]
+
+    def invalidate(self, controller_key, time_period_id=None):
+        """
+        Method to remove the tables of a controller so they are rebuilt on next use
+        :param controller_key: controller key
+        :param time_period_id: time period id of the table to remove, all tables of the controller are removed if None
+        :return: None
+        """
+        if time_period_id is not None:
+            self.data.pop((controller_key, time_period_id), None)
+        else:
+            for key in [key for key in self.data if key[0] == controller_key]:
+                del self.data[key]
+
+    def remove_all(self):
+        self.data = {}
+
+    def get_interstage_time(self, end_stage, start_stage, modified=True, context=None):
+        """
+        Function to get the interstage time of a stage to stage move
+        :param end_stage: end Stage
+        :param start_stage: start Stage
+        :param modified: bool, apply the modified intergreens and phase delays of the time period
+        :param context: EmulationContext
+        :return: interstage time
+        """
+        table = self.get_table(end_stage.controller_key, modified, context)
+        interstage_time = (
+            table.get_interstage_time(end_stage.stage_number, start_stage.stage_number) if table else None
+        )
+        if interstage_time is not None:
+            return interstage_time
+        start_phases = self.signal_emulator.stages.get_start_phases(end_stage, start_stage)
+        max_interstage_time = 0
+        for start_phase in start_phases:
+            interstage_time = self.get_max_start_time(
+                start_phase, end_stage.stage_number, start_stage.stage_number, modified, context
+            )
+            max_interstage_time = max(max_interstage_time, interstage_time)
+        return max_interstage_time
+
+    def get_max_start_time(self, start_phase, end_stage_key, start_stage_key, modified=True, context=None):
+        """
+        Function to get the time after the start of a stage to stage move that a phase can start. The ending phases
+        are those in the end stage and not in the start stage
+        :param start_phase: starting Phase
+        :param end_stage_key: end stage number
+        :param start_stage_key: start stage number
+        :param modified: bool, apply the modified intergreens and phase delays of the time period
+        :param context: EmulationContext
+        :return: max start time
+        """
+        table = self.get_table(start_phase.controller_key, modified, context)
+        max_start_time = (
+            table.get_max_start_time(end_stage_key, start_stage_key, start_phase.phase_ref) if table else None
+        )
+        if max_start_time is not None:
+            return max_start_time
+        end_stage = self.signal_emulator.stages.get_by_key((start_phase.controller_key, end_stage_key))
+        start_stage = self.signal_emulator.stages.get_by_key((start_phase.controller_key, start_stage_key))
+        if end_stage is None or start_stage is None:
+            return 0
+        time_delta = 0
+        for end_phase in self.signal_emulator.stages.get_end_phases(end_stage, start_stage):
+            end_phase_delay = self.signal_emulator.phase_delays.get_delay_time_by_stage_and_phase_keys(
+                controller_key=end_phase.controller_key,
+                end_stage_key=end_stage_key,
+                start_stage_key=start_stage_key,
+                phase_key=end_phase.phase_ref,
+                modified=modified,
+                context=context,
+            )
+            intergreen = self.signal_emulator.intergreens.get_intergreen_time_by_phase_keys(
+                controller_key=end_phase.controller_key,
+                end_phase_key=end_phase.phase_ref,
+                start_phase_key=start_phase.phase_ref,
+                modified=modified,
+                context=context,
+            )
+            start_phase_delay = self.signal_emulator.phase_delays.get_delay_time_by_stage_and_phase_keys(
+                controller_key=end_phase.controller_key,
+                end_stage_key=end_stage_key,
+                start_stage_key=start_stage_key,
+                phase_key=start_phase.phase_ref,
+                modified=modified,
+                context=context,
+            )
+            time_delta = max(time_delta, max(end_phase_delay + intergreen, start_phase_delay))
+        return time_delta
@@ -1,8 +1,9 @@
 import os
 import random
-from pathlib import Path
 
-from signal_emulator.utilities.utility_functions import list_to_txt
+from signal_emulator.emulation_context import EmulationContext
+from signal_emulator.parallel_exporter import ParallelExporter
+from signal_emulator.utilities.utility_functions import text_to_file
 
 
 class Linsig:
@@ -11,117 +12,237 @@ class Linsig:
         "SVERS": "SVERS2, 3, 6, 0",
         "USRHD": "USRHDTCU1U78637TCU1U78638    1",
     }
+    NETWORK_LINES = (
+        "THEAD    1",
+        "TEXT ",
+        "LENV     2    1    0    0",
+        "PREFS0000100030001000003000050000600000000100000000000000010",
+        "PFONT150,0,0,0,400,0,0,0,0,0,0,2,18,Arial,0",
+        "PFONT150,0,0,0,400,0,0,0,0,0,0,2,18,Arial,0",
+        "PFONT240,0,0,0,400,0,0,0,0,0,0,2,18,Arial,0",
+        "PFONT240,0,0,0,400,0,0,0,0,0,0,2,18,Arial,0",
+        "LNETW    0    0    0    0   -1   -1   -1   -1   -1   -1   -1   -1",
+        "JUNC     0    0    1    2  100    1    0    0    0    0    2    0         0         0         0      "
+        "   0    1   -1    0         0         0         0         0",
+    )
+    VIEW_LINES = (
+        "REPDS    0    5    0",
+        "SELEC    0",
+        "PPGES    2",
+        "VWPPS    1    0",
+        "VWPPS    2    0",
+        "VWPOS   29    0    0  840  400    0    1    0    0    0    0   -1    0    1",
+        "VWPOS   12    0    0  840  400    0    1    0    0    0    0   -1    0    1",
+    )
     PROBABLY_ZERO = "0"
     LAST_STREAM_NUMBER = "0"
 
     def __init__(self, signal_emulator, output_directory):
         self.signal_emulator = signal_emulator
         self.output_directory = output_directory
+        # controller key to dict of the rendered lines of the sections that are the same for every time period
+        self.controller_sections = {}
 
-    def export_all_to_lsg_v236(self):
-        Path(self.output_directory).mkdir(exist_ok=True, parents=True)
-
-        for controller in self.signal_emulator.controllers:
-            for signal_plan in controller.signal_plans:
-                self.signal_emulator.logger.info(
-                    f"Exporting Signal Plan: {controller.controller_key} {signal_plan.time_period_id} to Linsig file"
-                )
-                self.export_to_lsg_v236(signal_plan)
+    def export_all_to_lsg_v236(self, processes=None, multi_scenario=False):
+        """
+        Method to export a LinSig file for each signal plan, or a multi scenario LinSig file of all signal plans of
+        each controller. Files are rendered in a process pool if processes is greater than 1
+        :param processes: number of worker processes, defaults to the SignalEmulator processes
+        :param multi_scenario: bool, export one file per controller with a scenario for each signal plan. Raises a
+            ValueError if the modified intergreens or phase delays of a controller differ between its time periods
+        :return: None
+        """
+        ParallelExporter(self.signal_emulator, processes).export_lsg_files(multi_scenario)
 
     def export_to_lsg_v236(self, signal_plan):
-        self.signal_emulator.time_periods.active_period_id = signal_plan.time_period_id
-        output_data = ["SCHEM2.15", "SVERS2, 3, 6, 0", "USRHDTCU1U78637TCU1U78638    1"]
-        output_data.extend(["TEXT "] * 3)
-        output_data.extend(
-            [f"TEXT {' - '.join([stream.site_id for stream in signal_plan.signal_plan_streams])}"]
+        text_to_file(self.render_lsg_v236(signal_plan), self.get_linsig_filepath(signal_plan))
+
+    def export_to_multi_scenario_lsg_v236(self, controller):
+        text_to_file(
+            self.render_multi_scenario_lsg_v236(controller.signal_plans),
+            self.get_multi_scenario_linsig_filepath(controller),
+        )
+
+    def render_lsg_v236(self, signal_plan):
+        """
+        Function to render the LinSig v2.3.6 file of a signal plan
+        :param signal_plan: SignalPlan
+        :return: str lsg file contents
+        """
+        # the flow group of a single plan file has the time period of the first signal plan
+        return self.render_signal_plans_lsg_v236(
+            [signal_plan], [self.signal_emulator.signal_plans.get_first().time_period]
+        )
+
+    def render_multi_scenario_lsg_v236(self, signal_plans):
+        """
+        Function to render a LinSig v2.3.6 file with a signal plan, flow group and scenario for each signal plan of
+        a controller. A LinSig controller has one set of intergreens and phase delays for all scenarios, see
+        validate_multi_scenario_signal_plans
+        :param signal_plans: list of SignalPlan of one controller
+        :return: str lsg file contents
+        """
+        self.validate_multi_scenario_signal_plans(signal_plans)
+        return self.render_signal_plans_lsg_v236(
+            signal_plans, [signal_plan.time_period for signal_plan in signal_plans]
+        )
+
+    def validate_multi_scenario_signal_plans(self, signal_plans):
+        """
+        Method to check that the modified intergreen and phase delay times of the controller are the same in the
+        time period of each signal plan, so they can be written once for all scenarios of a multi scenario file
+        :param signal_plans: list of SignalPlan of one controller
+        :return: None
+        :raises ValueError: if the modified times differ between the time periods
+        """
+        controller = signal_plans[0].controller
+        modified_times = {
+            signal_plan.time_period_id: self.get_modified_times(
+                controller, EmulationContext(time_period_id=signal_plan.time_period_id)
+            )
+            for signal_plan in signal_plans
+        }
+        if len(set(modified_times.values())) > 1:
+            raise ValueError(
+                f"Controller: {controller.controller_key} has modified intergreens or phase delays that differ "
+                f"between time periods: {list(modified_times)}, so can not be exported to a multi scenario LinSig file"
+            )
+
+    @staticmethod
+    def get_modified_times(controller, context):
+        """
+        Function to get the modified intergreen and phase delay times of a controller in a time period
+        :param controller: Controller
+        :param context: EmulationContext
+        :return: tuple of tuple of intergreen times and tuple of phase delay times
+        """
+        return (
+            tuple(intergreen.get_modified_intergreen_time(context) for intergreen in controller.intergreens),
+            tuple(phase_delay.get_modified_delay_time(context) for phase_delay in controller.phase_delays),
         )
+
+    def render_signal_plans_lsg_v236(self, signal_plans, flow_group_time_periods):
+        """
+        Function to render a LinSig v2.3.6 file of the signal plans of a controller. The sections that are the same
+        for every time period are rendered once per controller, see get_controller_sections
+        :param signal_plans: list of SignalPlan of one controller, numbered from 1 in the file
+        :param flow_group_time_periods: list of TimePeriod of the flow groups, one for each signal plan
+        :return: str lsg file contents
+        """
+        first_signal_plan = signal_plans[0]
+        controller = first_signal_plan.controller
+        context = EmulationContext(time_period_id=first_signal_plan.time_period_id)
+        controller_sections = self.get_controller_sections(controller)
+        output_data = list(self.HEADERS.values())
         output_data.extend(["TEXT "] * 3)
         output_data.extend(
-            [
-                "THEAD    1",
-                "TEXT ",
-                "LENV     2    1    0    0",
-                "PREFS0000100030001000003000050000600000000100000000000000010",
-                "PFONT150,0,0,0,400,0,0,0,0,0,0,2,18,Arial,0",
-                "PFONT150,0,0,0,400,0,0,0,0,0,0,2,18,Arial,0",
-                "PFONT240,0,0,0,400,0,0,0,0,0,0,2,18,Arial,0",
-                "PFONT240,0,0,0,400,0,0,0,0,0,0,2,18,Arial,0",
-                "LNETW    0    0    0    0   -1   -1   -1   -1   -1   -1   -1   -1",
-                "JUNC     0    0    1    2  100    1    0    0    0    0    2    0         0         0         0      "
-                "   0    1   -1    0         0         0         0         0",
-            ]
+            [f"TEXT {' - '.join([stream.site_id for stream in first_signal_plan.signal_plan_streams])}"]
         )
-        output_data.append(self.get_controller_line(signal_plan))
-        for phase in sorted(signal_plan.controller.phases, key=lambda x: x.phase_number):
-            output_data.append(self.get_phase_line_1(phase))
-            output_data.append(self.get_phase_line_2(phase))
-
-        for stream in signal_plan.controller.streams:
-            output_data.append(self.get_stream_line(stream))
-            for stage in stream.stages_in_stream_linsig:
-                output_data.append(self.get_stage_line(stage))
-            output_data.append("ISTLA    0")
+        output_data.extend(["TEXT "] * 3)
+        output_data.extend(self.NETWORK_LINES)
+        output_data.append(self.get_controller_line(first_signal_plan))
+        output_data.extend(controller_sections["phases"])
+        output_data.extend(controller_sections["streams"])
 
-        for intergreen in signal_plan.controller.intergreens:
-            if intergreen.modified_intergreen_time > 0:
-                output_data.append(self.get_intergreen_line(intergreen))
+        # intergreens and phase delays can be modified for the time period
+        for intergreen in controller.intergreens:
+            if intergreen.get_modified_intergreen_time(context) > 0:
+                output_data.append(self.get_intergreen_line(intergreen, context))
 
-        for phase_delay in signal_plan.controller.phase_delays:
+        for phase_delay in controller.phase_delays:
             if (
-                phase_delay.modified_delay_time > 0
+                phase_delay.get_modified_delay_time(context) > 0
                 and phase_delay.start_stage_key > 0
                 and phase_delay.end_stage_key > 0
             ):
-                output_data.append(self.get_phase_delay_line(phase_delay))
-
-        output_data.append(self.get_signal_plan_line(signal_plan))
-        output_data.append(self.get_signal_plan_name_line())
-        for stream_plan in signal_plan.signal_plan_streams:
-            output_data.append(self.get_stream_plan_line_1(stream_plan))
-            output_data.append("PDTMN   90    0    1")
-        output_data.append(self.get_streams_num_line_1(signal_plan))
-        for stream_plan in signal_plan.signal_plan_streams:
-            output_data.append(self.get_stream_plan_line_2(stream_plan))
-
-        output_data.append(
-            f"FLWGP{'1'.rjust(5)}{'0'.rjust(5)}"
-            f"{self.signal_emulator.signal_plans.get_first().time_period.start_time_str[:-3]}"
-            f"{self.signal_emulator.signal_plans.get_first().time_period.end_time_str[:-3]}"
-            f"{'Flow Group 1    0    0'.rjust(90)}"
-        )
-        output_data.append("FLGPF    1    0")
+                output_data.append(self.get_phase_delay_line(phase_delay, context))
+
+        for plan_number, signal_plan in enumerate(signal_plans, start=1):
+            output_data.append(self.get_signal_plan_line(signal_plan, plan_number))
+            output_data.append(self.get_signal_plan_name_line(plan_number))
+            for stream_plan in signal_plan.signal_plan_streams:
+                output_data.append(self.get_stream_plan_line_1(stream_plan, plan_number))
+                output_data.append("PDTMN   90    0    1")
+            output_data.append(self.get_streams_num_line_1(signal_plan))
+            for stream_plan in signal_plan.signal_plan_streams:
+                output_data.append(self.get_stream_plan_line_2(stream_plan))
+
+        for flow_group_number, time_period in enumerate(flow_group_time_periods, start=1):
+            output_data.append(self.get_flow_group_line(flow_group_number, time_period))
+        for flow_group_number in range(1, len(flow_group_time_periods) + 1):
+            output_data.append(f"FLGPF{str(flow_group_number).rjust(5)}    0")
         output_data.append("FGRFS    0")
 
-        # scenarios
-        # changed this to only handle one time period scenario
-        output_data.append(
-            f"TIMPD{'1'.rjust(5)}" f"{'1'.rjust(5)}" f"{'1'.rjust(5)}" f"{'1'.rjust(5)}¬"
-        )
-        output_data.append("REPDS    0    5    0")
-        output_data.append("SELEC    0")
-        output_data.append("PPGES    2")
-        output_data.append("VWPPS    1    0")
-        output_data.append("VWPPS    2    0")
-        output_data.append(
-            "VWPOS   29    0    0  840  400    0    1    0    0    0    0   -1    0    1"
-        )
-        output_data.append(
-            "VWPOS   12    0    0  840  400    0    1    0    0    0    0   -1    0    1"
-        )
+        # scenarios, one for each signal plan and its flow group
+        for scenario_number in range(1, len(signal_plans) + 1):
+            output_data.append(
+                f"TIMPD{str(scenario_number).rjust(5)}"
+                f"{str(scenario_number).rjust(5)}"
+                f"{str(scenario_number).rjust(5)}"
+                f"{'1'.rjust(5)}¬"
+            )
+        output_data.extend(self.VIEW_LINES)
+        output_data.extend(controller_sections["phase_charts"])
+        output_data.append("FITGR27650    0    0")
+        return "".join(f"{row}\n" for row in output_data)
+
+    def get_controller_sections(self, controller):
+        """
+        Function to get the rendered phase, stream and phase chart lines of a controller, which are the same for
+        every time period so are rendered once and cached. The cache is cleared by clear_controller_sections
+        :param controller: Controller
+        :return: dict of section name to list of lines
+        """
+        controller_sections = self.controller_sections.get(controller.controller_key)
+        if controller_sections is None:
+            controller_sections = self.render_controller_sections(controller)
+            self.controller_sections[controller.controller_key] = controller_sections
+        return controller_sections
+
+    def clear_controller_sections(self):
+        self.controller_sections = {}
+
+    def render_controller_sections(self, controller):
+        """
+        Function to render the phase, stream and phase chart lines of a controller
+        :param controller: Controller
+        :return: dict of section name to list of lines
+        """
+        phase_lines = []
+        for phase in sorted(controller.phases, key=lambda x: x.phase_number):
+            phase_lines.append(self.get_phase_line_1(phase))
+            phase_lines.append(self.get_phase_line_2(phase))
+
+        stream_lines = []
+        for stream in controller.streams:
+            stream_lines.append(self.get_stream_line(stream))
+            for stage in stream.stages_in_stream_linsig:
+                stream_lines.append(self.get_stage_line(stage))
+            stream_lines.append("ISTLA    0")
 
         temp_str_1, temp_str_2 = "", ""
         temp_count_1, temp_count_2 = 0, 0
-        for phase in signal_plan.controller.phases:
-            if phase.phase_number < len(signal_plan.controller.phases) / 2:
+        for phase in controller.phases:
+            if phase.phase_number < len(controller.phases) / 2:
                 temp_str_1 += str(phase.phase_number).rjust(5)
                 temp_count_1 += 1
             else:
                 temp_str_2 += str(phase.phase_number).rjust(5)
                 temp_count_2 += 1
-        output_data.append(f"CRTPH{str(temp_count_1).rjust(5)}{temp_str_1}")
-        output_data.append(f"CRTPH{str(temp_count_2).rjust(5)}{temp_str_2}")
-        output_data.append("FITGR27650    0    0")
-        list_to_txt(output_data, self.get_linsig_filepath(signal_plan))
+        phase_chart_lines = [
+            f"CRTPH{str(temp_count_1).rjust(5)}{temp_str_1}",
+            f"CRTPH{str(temp_count_2).rjust(5)}{temp_str_2}",
+        ]
+        return {"phases": phase_lines, "streams": stream_lines, "phase_charts": phase_chart_lines}
+
+    @staticmethod
+    def get_flow_group_line(flow_group_number, time_period):
+        return (
+            f"FLWGP{str(flow_group_number).rjust(5)}{'0'.rjust(5)}"
+            f"{time_period.start_time_str[:-3]}"
+            f"{time_period.end_time_str[:-3]}"
+            f"{f'Flow Group {flow_group_number}    0    0'.rjust(90)}"
+        )
 
     @staticmethod
     def get_linsig_filename(signal_plan):
@@ -130,6 +251,9 @@ class Linsig:
     def get_linsig_filepath(self, signal_plan):
         return os.path.join(self.output_directory, f"{self.get_linsig_filename(signal_plan)}")
 
+    def get_multi_scenario_linsig_filepath(self, controller):
+        return os.path.join(self.output_directory, f"{controller.site_number_filename}_ALL.lsg")
+
     @staticmethod
     def get_streams_num_line_1(signal_plan):
         return f"SSLES{str(len(signal_plan.signal_plan_streams)).rjust(5)}"
@@ -143,9 +267,9 @@ class Linsig:
             f"{'1'.rjust(5)}"
         )
 
-    def get_stream_plan_line_1(self, stream_plan):
+    def get_stream_plan_line_1(self, stream_plan, plan_number=1):
         return (
-            f"STSEQ{'1'.rjust(5)}"
+            f"STSEQ{str(plan_number).rjust(5)}"
             f"{str(stream_plan.stream_number).rjust(5)}"
             f"{str(stream_plan.first_stage_time).rjust(5)}"
             f"{str(stream_plan.cycle_time).rjust(5)}"
@@ -164,9 +288,9 @@ class Linsig:
         )
 
     @staticmethod
-    def get_signal_plan_line(signal_plan):
+    def get_signal_plan_line(signal_plan, plan_number=1):
         return (
-            f"SGPLN{'1'.rjust(5)}"
+            f"SGPLN{str(plan_number).rjust(5)}"
             f"{str(len(signal_plan.signal_plan_streams)).rjust(5)}"
             f"{str(signal_plan.PROBABLY_ZERO).rjust(5)}"
             f"{str(signal_plan.PROBABLY_ZERO).rjust(5)}"
@@ -174,17 +298,17 @@ class Linsig:
         )
 
     @staticmethod
-    def get_signal_plan_name_line():
-        # signal plan number always 1, as we only include 1 signal plan per file
-        return f"SGPLD{'1'.rjust(50)}"
+    def get_signal_plan_name_line(plan_number=1):
+        # signal plans are numbered from 1 in the order they are included in the file
+        return f"SGPLD{str(plan_number).rjust(50)}"
 
-    def get_phase_delay_line(self, phase_delay):
+    def get_phase_delay_line(self, phase_delay, context):
         return (
             f"PDELY{str(phase_delay.end_stage.stream_number_linsig).rjust(5)}"
             f"{str(phase_delay.end_stage.stage_number).rjust(5)}"
             f"{str(phase_delay.start_stage.stage_number).rjust(5)}"
             f"{str(phase_delay.phase.phase_number).rjust(5)}"
-            f"{str(phase_delay.modified_delay_time).rjust(5)}"
+            f"{str(phase_delay.get_modified_delay_time(context)).rjust(5)}"
             f"{self.get_losing_phase_delay_string(phase_delay.phase_delay_type, phase_delay.is_absolute)}"
         )
 
@@ -193,10 +317,11 @@ class Linsig:
         return f"    {'1' if phase_delay_type == 'losing' or is_absolute else '0'}3548{random.randint(1000, 9999)}"
 
     @staticmethod
-    def get_intergreen_line(intergreen):
+    def get_intergreen_line(intergreen, context):
         return (
             f"INGRN{str(intergreen.end_phase.phase_number).rjust(5)}"
-            f"{str(intergreen.start_phase.phase_number).rjust(5)}{str(intergreen.modified_intergreen_time).rjust(5)}"
+            f"{str(intergreen.start_phase.phase_number).rjust(5)}"
+            f"{str(intergreen.get_modified_intergreen_time(context)).rjust(5)}"
         )
 
     @staticmethod
@@ -4,7 +4,9 @@ from datetime import datetime
 import pandas as pd
 
 from signal_emulator.controller import BaseCollection, BaseItem
-from signal_emulator.utilities.utility_functions import find_files_with_extension
+from signal_emulator.utilities.aggregate_cache import AggregateCache
+from signal_emulator.utilities.fixed_width_decoder import decode_fixed_width_files
+from signal_emulator.utilities.log_file_reader import find_log_files, open_log_file
 
 
 @dataclass(eq=False)
@@ -35,6 +37,7 @@ class M16Averages(BaseCollection):
     TABLE_NAME = "m16_averages"
     ITEM_CLASS = M16Average
     WRITE_TO_DATABASE = True
+    PARTITION_FIELD = "node_id"
     COLUMN_LIMITS = [
         (0, 8),
         (13, 16),
@@ -69,6 +72,18 @@ class M16Averages(BaseCollection):
         "pulse_time_5": pd.Int64Dtype(),
     }
     HEADER_ROWS = [0, 1]
+    LSG_COLUMN_TYPES = {
+        "timestamp": "time",
+        "message_type": "str",
+        "node_id": "str",
+        "time_now": "int",
+        "node_cycle_time": "int",
+        "pulse_time_1": "int",
+        "pulse_time_2": "int",
+        "pulse_time_3": "int",
+        "pulse_time_4": "int",
+        "pulse_time_5": "int",
+    }
 
     def __init__(
         self,
@@ -77,7 +92,17 @@ class M16Averages(BaseCollection):
         source_type="averaged",
         export_to_csv_path=None,
         signal_emulator=None,
+        cache_path=None,
     ):
+        """
+        Constructor for M16Averages
+        :param m16_path: averaged M16 csv file path, or directory to load raw M16 lsg files from
+        :param periods: TimePeriods, the SignalEmulator time periods if None
+        :param source_type: "averaged", "raw" or None
+        :param export_to_csv_path: csv file path to export the averaged M16s to
+        :param signal_emulator: parent SignalEmulator object
+        :param cache_path: directory of the cache of the cycle time counts of each raw M16 file, not cached if None
+        """
         super().__init__(item_data=[], signal_emulator=signal_emulator)
         if signal_emulator.load_from_postgres:
             return
@@ -85,12 +110,12 @@ class M16Averages(BaseCollection):
         if not periods and signal_emulator:
             periods = signal_emulator.time_periods
         self.periods = periods
+        self.cache_path = cache_path
         if source_type is None:
             self.m16_df = pd.DataFrame()
             self.m16_average_df = pd.DataFrame()
         elif source_type == "raw":
-            self.m16_raw_df = self.load_all_m16_in_directory_df(m16_path)
-            self.m16_average_df = self.calculate_modal_cycle_times()
+            self.m16_average_df = self.calculate_modal_cycle_times(self.count_all_m16_in_directory(m16_path))
         elif source_type == "averaged":
             self.m16_average_df = pd.read_csv(
                 m16_path,
@@ -103,76 +128,147 @@ class M16Averages(BaseCollection):
         if export_to_csv_path:
             self.write_to_csv(export_to_csv_path)
 
-    def calculate_modal_cycle_times(self):
-        self.m16_raw_df["timedelta"] = self.m16_raw_df["timestamp"].dt.time.apply(
-            lambda x: pd.to_timedelta(str(x))
-        )
-        self.m16_raw_df["time_period_id"] = self.m16_raw_df["timedelta"].apply(
-            lambda x: self.signal_emulator.time_periods.get_period_id_for_timedelta(x)
-        )
-        self.m16_raw_df["region_id"] = self.m16_raw_df.apply(
-            lambda x: self.get_region_id(x["node_id"], x["time_period_id"]), axis=1
-        )
-
-        ct_count = (
-            self.m16_raw_df.groupby(["region_id", "node_id", "time_period_id"])["node_cycle_time"]
-            .value_counts()
-            .reset_index(name="count")
-        )
-        ct_total_count = (
-            ct_count.groupby(["region_id", "node_id", "time_period_id"])["count"]
-            .sum()
-            .reset_index(name="count_total")
+    def calculate_modal_cycle_times(self, cycle_time_counts=None):
+        """
+        Function to calculate the modal cycle time of each node and region in each time period from raw M16 data
+        :param cycle_time_counts: DataFrame of cycle time counts from count_cycle_times, counted from the
+            m16_raw_df attribute if None
+        :return: DataFrame of modal cycle times
+        """
+        node_keys = ["region_id", "node_id", "time_period_id"]
+        region_keys = ["region_id", "time_period_id"]
+        if cycle_time_counts is None:
+            cycle_time_counts = self.count_cycle_times(self.m16_raw_df)
+        cycle_time_counts = pd.merge(
+            cycle_time_counts, self.get_region_ids(cycle_time_counts), on=["node_id", "time_period_id"]
         )
-        ct_count = pd.merge(ct_count, ct_total_count, on=["region_id", "node_id", "time_period_id"])
-        ct_count["proportion"] = ct_count["count"] / ct_count["count_total"]
-        ct_count.to_csv("D:/dump/out.csv")
 
-        # group by region, node and time period, calculate the modal cycle time
+        # group by region, node and time period, calculate the modal cycle time, the smallest on ties
         node_id_grouped = (
-            self.m16_raw_df.groupby(["region_id", "node_id", "time_period_id"])["node_cycle_time"]
-            .apply(lambda x: x.mode().iloc[0])
-            .reset_index()
-        )
-        node_id_grouped_max = (
-            node_id_grouped.groupby(["region_id", "time_period_id"])["node_cycle_time"]
-            .apply(lambda x: self.get_max_cycle_time(x))
-            .reset_index()
-        ).rename(columns={"node_cycle_time": "region_cycle_time"})
-
-        merged_df = pd.merge(
-            node_id_grouped, node_id_grouped_max, on=["region_id", "time_period_id"]
+            cycle_time_counts.sort_values(by=["count", "node_cycle_time"], ascending=[False, True], kind="stable")
+            .drop_duplicates(subset=node_keys)
+            .sort_values(by=node_keys)
+            .reset_index(drop=True)[node_keys + ["node_cycle_time"]]
         )
-
-        merged_df.sort_values(by=["region_id", "node_id", "time_period_id"])
+        merged_df = pd.merge(node_id_grouped, self.get_region_cycle_times(node_id_grouped), on=region_keys)
         merged_df["ratio"] = merged_df["region_cycle_time"] / merged_df["node_cycle_time"]
 
         # set nodes to double or triple cycle
         merged_df["single_double_triple"] = 1
-        merged_df["single_double_triple"][merged_df["ratio"] == 2] = 2
-        merged_df["single_double_triple"][merged_df["ratio"] == 3] = 3
+        merged_df.loc[merged_df["ratio"] == 2, "single_double_triple"] = 2
+        merged_df.loc[merged_df["ratio"] == 3, "single_double_triple"] = 3
 
         # set the final cycle time, use region_cycle_time unless it is multi cycling
-        merged_df["cycle_time_independent"] = False
-        merged_df["cycle_time_independent"][
-            (merged_df["node_cycle_time"] != merged_df["region_cycle_time"])
-            & (merged_df["single_double_triple"] == 1)
-        ] = True
+        merged_df["cycle_time_independent"] = (merged_df["node_cycle_time"] != merged_df["region_cycle_time"]) & (
+            merged_df["single_double_triple"] == 1
+        )
         return merged_df
 
+    def count_cycle_times(self, m16_df):
+        """
+        Function to count the M16s of each cycle time by node and time period. Counts of separate files can be
+        combined with combine_cycle_time_counts
+        :param m16_df: DataFrame of M16 data
+        :return: DataFrame of node_id, time_period_id, node_cycle_time and count
+        """
+        time_of_day = (m16_df["timestamp"] - m16_df["timestamp"].dt.normalize()).to_numpy()
+        return (
+            pd.DataFrame(
+                {
+                    "node_id": m16_df["node_id"].to_numpy(),
+                    "time_period_id": self.signal_emulator.time_periods.get_period_ids_for_timedeltas(time_of_day),
+                    "node_cycle_time": m16_df["node_cycle_time"].to_numpy(),
+                }
+            )
+            .value_counts(sort=False)
+            .reset_index(name="count")
+        )
+
+    @staticmethod
+    def combine_cycle_time_counts(cycle_time_counts):
+        """
+        Function to combine the cycle time counts of separate files
+        :param cycle_time_counts: list of DataFrames from count_cycle_times
+        :return: DataFrame of node_id, time_period_id, node_cycle_time and count
+        """
+        if not cycle_time_counts:
+            return pd.DataFrame(columns=["node_id", "time_period_id", "node_cycle_time", "count"])
+        return (
+            pd.concat(cycle_time_counts)
+            .groupby(["node_id", "time_period_id", "node_cycle_time"], sort=False)["count"]
+            .sum()
+            .reset_index()
+        )
+
+    def count_all_m16_in_directory(self, directory_path):
+        """
+        Function to get the cycle time counts of all M16 files found in directory. If cache_path is set, the counts
+        of each file are cached and only new or modified files are read
+        :param directory_path: path to directory
+        :return: DataFrame of node_id, time_period_id, node_cycle_time and count
+        """
+        file_paths = find_log_files(directory_path, "lsg")
+        aggregate_cache = None
+        if self.cache_path:
+            periods = [
+                (period.name, period.start_time, period.end_time) for period in self.signal_emulator.time_periods
+            ]
+            aggregate_cache = AggregateCache(self.cache_path, "m16", periods)
+        cycle_time_counts = []
+        uncached_file_paths = []
+        for file_path in file_paths:
+            cached_counts = aggregate_cache.get(file_path) if aggregate_cache else None
+            if cached_counts is None:
+                uncached_file_paths.append(file_path)
+            else:
+                cycle_time_counts.append(cached_counts)
+        for file_path, m16_df in self.m16_file_iterator(uncached_file_paths):
+            file_counts = self.count_cycle_times(m16_df)
+            if aggregate_cache:
+                aggregate_cache.put(file_path, file_counts)
+            cycle_time_counts.append(file_counts)
+        if aggregate_cache:
+            aggregate_cache.save(file_paths)
+        return self.combine_cycle_time_counts(cycle_time_counts)
+
     @staticmethod
-    def get_max_cycle_time(node_cycle_times):
+    def get_region_cycle_times(node_id_grouped):
+        """
+        Function to set the region cycle times. If node cycle times greater than or equal to 64 seconds exist in a
+        region, then the most frequently occurring of them is selected, otherwise all node cycle times are selected
+        from. Ties are resolved by the first occurring cycle time
+        :param node_id_grouped: DataFrame of modal node cycle times by region, node and time period
+        :return: DataFrame of region cycle time by region and time period
+        """
+        region_keys = ["region_id", "time_period_id"]
+        is_long_cycle = node_id_grouped["node_cycle_time"] >= 64
+        region_has_long_cycle = is_long_cycle.groupby(
+            [node_id_grouped[key] for key in region_keys]
+        ).transform("any")
+        candidates = node_id_grouped.loc[is_long_cycle | ~region_has_long_cycle, region_keys + ["node_cycle_time"]]
+        candidates = candidates.assign(position=range(len(candidates)))
+        return (
+            candidates.groupby(region_keys + ["node_cycle_time"])
+            .agg(count=("position", "size"), first_position=("position", "min"))
+            .reset_index()
+            .sort_values(by=["count", "first_position"], ascending=[False, True])
+            .drop_duplicates(subset=region_keys)
+            .rename(columns={"node_cycle_time": "region_cycle_time"})[region_keys + ["region_cycle_time"]]
+        )
+
+    def get_region_ids(self, m16_df):
         """
-        Function to set the region cycle time. If node cycle times greater than or equal to 64 seconds exist, then the
-        most frequently occurring cycle time is selected, otherwise all node cycle times are selected from.
-        :param node_cycle_times: series of cycle times
-        :return: region cycle time
+        Function to build the lookup table of region id by node and time period, the region of each distinct node
+        and time period is looked up once
+        :param m16_df: DataFrame of M16 data with node_id and time_period_id columns
+        :return: DataFrame of node_id, time_period_id and region_id
         """
-        filtered_node_cycle_times = node_cycle_times[node_cycle_times >= 64]
-        if len(filtered_node_cycle_times) == 0:
-            filtered_node_cycle_times = node_cycle_times
-        max_ct = filtered_node_cycle_times.value_counts().idxmax()
-        return max_ct
+        region_ids = m16_df[["node_id", "time_period_id"]].drop_duplicates()
+        region_ids["region_id"] = [
+            self.get_region_id(node_id, time_period_id)
+            for node_id, time_period_id in zip(region_ids["node_id"], region_ids["time_period_id"])
+        ]
+        return region_ids
 
     def get_region_id(self, node_id, time_period_id):
         stream_key = f"J{node_id[1:]}"
@@ -197,8 +293,8 @@ class M16Averages(BaseCollection):
 
     @staticmethod
     def get_m16_file_date(m16_filepath):
-        with open(m16_filepath, "r") as file:
-            date_string = file.read(11)
+        with open_log_file(m16_filepath) as file:
+            date_string = file.read(11).decode()
         return datetime.strptime(date_string, "%d-%b-%Y")
 
     def load_all_m16_in_directory_df(self, directory_path):
@@ -207,20 +303,30 @@ class M16Averages(BaseCollection):
         :param directory_path: path to directory
         :return: DataFrame of M16 data
         """
-        m16_all_df = pd.DataFrame()
-        for file_path in find_files_with_extension(directory_path, "lsg"):
-            date = self.get_m16_file_date(file_path)
-            m16_df = pd.read_fwf(
-                file_path,
-                colspecs=self.COLUMN_LIMITS,
-                skiprows=self.HEADER_ROWS,
-                names=self.COLUMN_NAMES,
-                dtypes=self.COLUMN_DTYPES,
-            )
-            m16_df = m16_df[m16_df["message_type"] == "M16"]
-            m16_df["timestamp"] = pd.to_timedelta(m16_df["timestamp"]) + date
-            m16_all_df = pd.concat([m16_all_df, m16_df], ignore_index=True)
-        return m16_all_df
+        m16_dfs = [m16_df for _, m16_df in self.m16_file_iterator(find_log_files(directory_path, "lsg"))]
+        if not m16_dfs:
+            return pd.DataFrame()
+        return pd.concat(m16_dfs, ignore_index=True)
+
+    def m16_file_iterator(self, file_paths):
+        """
+        Generator of the M16 data of lsg files
+        :param file_paths: list of lsg file paths
+        :return: tuple of file path and DataFrame of M16 data
+        """
+        for file_path, lsg_columns in decode_fixed_width_files(
+            file_paths,
+            processes=self.signal_emulator.processes,
+            column_limits=self.COLUMN_LIMITS,
+            column_names=self.COLUMN_NAMES,
+            column_types=self.LSG_COLUMN_TYPES,
+            filter_column="message_type",
+            filter_value="M16",
+            header_rows=self.HEADER_ROWS,
+        ):
+            m16_df = pd.DataFrame(lsg_columns).astype(self.COLUMN_DTYPES)
+            m16_df["timestamp"] = m16_df["timestamp"] + self.get_m16_file_date(file_path)
+            yield file_path, m16_df
 
 
 if __name__ == "__main__":
@@ -1,12 +1,23 @@
 import os
 from dataclasses import dataclass
+from itertools import groupby
+from operator import itemgetter
 
+import numpy as np
 import pandas as pd
 
 from signal_emulator.controller import BaseCollection
 from signal_emulator.enums import M37StageToStageNumber
+from signal_emulator.file_parsers.signal_event_parser import SignalEventParser
 from signal_emulator.time_period import TimePeriods
-from signal_emulator.utilities.utility_functions import clean_site_number, find_files_with_extension
+from signal_emulator.utilities.aggregate_cache import AggregateCache
+from signal_emulator.utilities.fixed_width_decoder import decode_fixed_width_file, decode_fixed_width_files
+from signal_emulator.utilities.log_file_reader import find_log_files, open_log_file, strip_compression_suffix
+from signal_emulator.utilities.utility_functions import (
+    clean_site_number,
+    find_files_with_extension,
+    round_preserving_row_totals,
+)
 
 
 @dataclass(eq=False)
@@ -50,6 +61,7 @@ class M37Averages(BaseCollection):
     TABLE_NAME = "m37_averages"
     ITEM_CLASS = M37Average
     WRITE_TO_DATABASE = True
+    PARTITION_FIELD = "site_id"
     COLUMN_DTYPES = {"FinalGreenTime": int, "final_interstage_time": int, "scoot_cycle_time": int}
     CSV_COLUMN_RENAME = {
         "UtcDateTimestamp": "timestamp",
@@ -60,6 +72,8 @@ class M37Averages(BaseCollection):
         "SiteId": "site_id",
         "Gn": "green_time",
         "Ig": "intergreen_time",
+        # M37 files converted from SAD files by SignalEventParser
+        "interstage_time": "intergreen_time",
     }
 
     COLUMN_LIMITS = [(0, 8), (13, 16), (18, 26), (28, 35), (41, 43), (47, 50), (55, 58), (67, 70)]
@@ -74,6 +88,30 @@ class M37Averages(BaseCollection):
         "length",
     ]
     HEADER_ROWS = [0, 1]
+    LSG_COLUMN_TYPES = {
+        "timestamp": "time",
+        "message_id": "str",
+        "node_id": "str",
+        "site_id": "str",
+        "utc_stage_id": "str",
+        "intergreen_time": "int",
+        "green_time": "int",
+        "length": "int",
+    }
+    # compact dtypes of the raw M37 columns, times are nullable as csv files may have missing values
+    RAW_DTYPES = {
+        "node_id": "category",
+        "site_id": "category",
+        "utc_stage_id": "category",
+        "intergreen_time": "Int16",
+        "green_time": "Int16",
+    }
+    # number of raw M37 rows read from a file at a time
+    CHUNK_SIZE = 1_000_000
+    # number of chunk aggregates held before they are combined
+    MAX_PARTIAL_AGGREGATES = 16
+    STAGE_KEYS = ["period_id", "node_id", "site_id", "utc_stage_id"]
+    SITE_KEYS = ["period_id", "node_id", "site_id"]
 
     def __init__(
         self,
@@ -82,22 +120,28 @@ class M37Averages(BaseCollection):
         source_type="averaged",
         export_to_csv_path=None,
         signal_emulator=None,
+        cache_path=None,
     ):
         """
 
         :param m37_path: directory to load M37 data from
         :param periods: parent SignalEmulator object
+        :param source_type: "averaged" csv file, directory of "raw" M37 files, directory of SAD "signal_events"
+            files, or None
+        :param cache_path: directory of the cache of the stage time totals of each raw M37 file, not cached if None
         """
         super().__init__(item_data=[], signal_emulator=signal_emulator)
         if signal_emulator.load_from_postgres:
             return
-        assert source_type in ("averaged", "raw", None)
+        assert source_type in ("averaged", "raw", "signal_events", None)
         self.periods = periods
+        self.cache_path = cache_path
         if source_type is None:
             self.m37_df = pd.DataFrame()
         elif source_type == "raw":
-            self.m37_data = self.load_all_m37_in_directory_df(m37_path)
-            self.m37_df = self.calculate_average_signal_timings()
+            self.m37_df = self.calculate_average_signal_timings(self.aggregate_all_m37_in_directory(m37_path))
+        elif source_type == "signal_events":
+            self.m37_df = self.calculate_average_signal_timings(self.aggregate_signal_events_in_directory(m37_path))
         elif source_type == "averaged":
             self.m37_df = pd.read_csv(
                 m37_path,
@@ -118,111 +162,83 @@ class M37Averages(BaseCollection):
         else:
             return None
 
-    def calculate_average_signal_timings(self):
+    def calculate_average_signal_timings(self, stage_aggregates):
         """
-        Function to return a DataFrame of averaged M37 signal timings
+        Function to return a DataFrame of averaged M37 signal timings. Each M37 is labelled with the time periods
+        that contain it, then the timings of all periods are aggregated together by period, node, site and stage
+        :param stage_aggregates: DataFrame of stage time totals from aggregate_stage_times
         :return: DataFrame of M37 timings
         """
-        m37_all = pd.DataFrame()
-        for period in self.periods:
-            # filter M37s to the time bounds of the time Period
-            m37_filtered = self.m37_data.between_time(
-                start_time=period.start_time_str, end_time=period.end_time_str
-            )
-            # Group by NodeId, site_id and utc_stage_id
-            m37_grouped_node_site_stage = m37_filtered.groupby(
-                ["node_id", "site_id", "utc_stage_id"]
-            )
-            # aggregate to get the number of occurrences, average green time and total green times
-            m37 = m37_grouped_node_site_stage.agg(
-                occurrences=("intergreen_time", "count"),
-                interstage_total=("intergreen_time", "sum"),
-                interstage_average=("intergreen_time", "mean"),
-                green_total=("green_time", "sum"),
-                green_average=("green_time", "mean"),
-            )
-            m37["start_timestamp"] = period.start_time
-            m37["end_timestamp"] = period.end_time
-            m37["period_id"] = period.name
-            m37["stage_total"] = m37["green_total"] + m37["interstage_total"]
-            m37_cycles = (
-                m37_grouped_node_site_stage.size().groupby(["node_id", "site_id"]).agg(cycles="max")
-            )
-            m37 = m37.merge(m37_cycles, left_index=True, right_index=True, how="outer")
-            total_times = m37.groupby(["node_id", "site_id"]).agg(total_time=("stage_total", "sum"))
-            total_times["coverage"] = total_times["total_time"] / period.total_seconds
-            m37 = m37.merge(total_times, left_index=True, right_index=True, how="outer")
-            # Calculate the proportion og stage occurrences to the total number of cycles
-            m37["occurrence_factor"] = m37["occurrences"] / m37["cycles"]
-            # Apply occurrence factor to the green times and interstage times
-            m37["adjusted_green_average"] = m37["green_average"] * m37["occurrence_factor"]
-            m37["adjusted_interstage_average"] = (
-                m37["interstage_average"] * m37["occurrence_factor"]
-            )
-            m37_cycle_time = m37.groupby(["node_id", "site_id"]).agg(
-                adjusted_green_average_sum=("adjusted_green_average", "sum"),
-                adjusted_interstage_average_sum=("adjusted_interstage_average", "sum"),
-            )
-            # sum the adjusted green times and interstage times to get the cycle time
-            m37_cycle_time["m37_cycle_time"] = (
-                m37_cycle_time["adjusted_green_average_sum"]
-                + m37_cycle_time["adjusted_interstage_average_sum"]
-            )
-            m37 = m37.merge(
-                m37_cycle_time["m37_cycle_time"],
-                left_index=True,
-                right_index=True,
-                how="outer",
-            )
-
-            m37.reset_index(inplace=True)
-            m37.set_index("node_id", inplace=True)
-            m16_cycle_times = self.signal_emulator.m16s.m16_average_df
-            m16_cycle_times = m16_cycle_times[m16_cycle_times["time_period_id"] == period.name]
-            m16_cycle_times.set_index("node_id", inplace=True)
-            m37 = m37.join(m16_cycle_times[["node_cycle_time", "single_double_triple", "cycle_time_independent"]])
-            if len(m37[m37["node_cycle_time"].isna()]) > 0:
+        stage_keys = self.STAGE_KEYS
+        site_keys = self.SITE_KEYS
+        # get the number of occurrences and average green and interstage times
+        m37 = pd.DataFrame(
+            {
+                "occurrences": stage_aggregates["occurrences"],
+                "interstage_average": stage_aggregates["interstage_total"] / stage_aggregates["occurrences"],
+                "green_average": stage_aggregates["green_total"] / stage_aggregates["green_count"],
+            }
+        )
+        # the number of cycles is the greatest number of occurrences of any stage of the site
+        m37["cycles"] = stage_aggregates["messages"].groupby(site_keys, observed=True).transform("max")
+        # Calculate the proportion of stage occurrences to the total number of cycles
+        m37["occurrence_factor"] = m37["occurrences"] / m37["cycles"]
+        # Apply occurrence factor to the green times and interstage times
+        m37["adjusted_green_average"] = m37["green_average"] * m37["occurrence_factor"]
+        m37["adjusted_interstage_average"] = m37["interstage_average"] * m37["occurrence_factor"]
+        # sum the adjusted green times and interstage times to get the cycle time
+        site_totals = m37.groupby(site_keys, observed=True)[
+            ["adjusted_green_average", "adjusted_interstage_average"]
+        ].transform("sum")
+        m37["m37_cycle_time"] = (
+            site_totals["adjusted_green_average"] + site_totals["adjusted_interstage_average"]
+        )
+        m37.reset_index(inplace=True)
+        m37["period_id"] = m37["period_id"].astype(object)
+        m16_cycle_times = self.signal_emulator.m16s.m16_average_df[
+            ["time_period_id", "node_id", "node_cycle_time", "single_double_triple", "cycle_time_independent"]
+        ].rename(columns={"time_period_id": "period_id"})
+        m37 = m37.merge(m16_cycle_times, on=["period_id", "node_id"], how="left")
+        unmatched = m37["node_cycle_time"].isna()
+        if unmatched.any():
+            unmatched_periods = m37.loc[unmatched, "period_id"].unique()
+            for period_id in unmatched_periods:
                 self.signal_emulator.logger.warning(
                     f"M16 ids not matched in M16s for nodes: "
-                    f'{m37[m37["node_cycle_time"].isna()]["site_id"].unique()}'
+                    f'{m37.loc[unmatched & (m37["period_id"] == period_id), "site_id"].unique()}'
                 )
-                m37.dropna(inplace=True)
+            m37 = m37[~(m37["period_id"].isin(unmatched_periods) & m37.isna().any(axis=1))]
 
-            # factor green times and interstage times to match the SCOOT cycle time
-            m37["scoot_green_time"] = (
-                m37["node_cycle_time"] / m37["m37_cycle_time"] * m37["adjusted_green_average"]
-            )
-            m37["scoot_interstage_time"] = (
-                m37["node_cycle_time"] / m37["m37_cycle_time"] * m37["adjusted_interstage_average"]
-            )
-            m37.reset_index(inplace=True)
-            m37.set_index(["node_id", "site_id", "utc_stage_id"], inplace=True)
-            # unstack the utc_stage_id from the row index to a column so that the stage times can be rounded together
-            m37_unstack = m37[["scoot_green_time", "scoot_interstage_time"]].unstack(level=2)
-
-            # apply rounding function that rounds times to whole seconds,
-            # while maintaining the total (cycle time)
-            m37_unstack = m37_unstack.apply(lambda x: self.rounding_function(x), axis=1)
-            m37_stack = m37_unstack.stack()
-            m37_stack.rename(
-                columns={
-                    "scoot_green_time": "final_green_time",
-                    "scoot_interstage_time": "final_interstage_time",
-                },
-                inplace=True,
-            )
-            m37 = m37.merge(m37_stack, left_index=True, right_index=True, how="outer")
-            m37.reset_index(inplace=True)
-            m37_all = pd.concat([m37_all, m37], ignore_index=True)
-
-            print(m37_all[m37_all["final_green_time"].isna()])
-
-            m37_all["green_time"] = m37_all["final_green_time"].astype(int)
-            m37_all["interstage_time"] = m37_all["final_interstage_time"].astype(int)
-            m37_all["cycle_time"] = m37_all["node_cycle_time"].astype(int)
-        m37_all["stage_number"] = m37_all["utc_stage_id"].apply(self.map_utc_stage_id_to_number)
-        m37_all["site_id"] = m37_all["site_id"].apply(lambda x: clean_site_number(x))
-        m37_all = m37_all[
+        # factor green times and interstage times to match the SCOOT cycle time
+        m37["scoot_green_time"] = m37["node_cycle_time"] / m37["m37_cycle_time"] * m37["adjusted_green_average"]
+        m37["scoot_interstage_time"] = (
+            m37["node_cycle_time"] / m37["m37_cycle_time"] * m37["adjusted_interstage_average"]
+        )
+        m37.set_index(stage_keys, inplace=True)
+        # unstack the utc_stage_id from the row index to a column so that the stage times can be rounded together
+        m37_unstack = m37[["scoot_green_time", "scoot_interstage_time"]].unstack(level=3)
+        # round times to whole seconds, while maintaining the total (cycle time)
+        m37_unstack = pd.DataFrame(
+            round_preserving_row_totals(m37_unstack.to_numpy(dtype=float)),
+            index=m37_unstack.index,
+            columns=m37_unstack.columns,
+        )
+        m37_stack = m37_unstack.stack()
+        m37_stack.rename(
+            columns={
+                "scoot_green_time": "final_green_time",
+                "scoot_interstage_time": "final_interstage_time",
+            },
+            inplace=True,
+        )
+        m37 = m37.join(m37_stack)
+        m37.reset_index(inplace=True)
+        m37["green_time"] = m37["final_green_time"].astype(int)
+        m37["interstage_time"] = m37["final_interstage_time"].astype(int)
+        m37["cycle_time"] = m37["node_cycle_time"].astype(int)
+        m37["stage_number"] = m37["utc_stage_id"].apply(self.map_utc_stage_id_to_number)
+        m37["site_id"] = m37["site_id"].apply(lambda x: clean_site_number(x))
+        m37 = m37[
             [
                 "node_id",
                 "site_id",
@@ -234,7 +250,150 @@ class M37Averages(BaseCollection):
                 "cycle_time",
             ]
         ]
-        return m37_all
+        return m37
+
+    def aggregate_stage_times(self, m37_data, time_of_day=None):
+        """
+        Function to get the totals of the M37 stage times by period, node, site and stage. Totals of separate chunks
+        of M37 data can be combined with combine_stage_aggregates
+        :param m37_data: DataFrame of M37 data
+        :param time_of_day: array of the time of day of each M37 as timedelta64, taken from the timestamp index
+            of m37_data if None
+        :return: DataFrame of stage time totals and counts
+        """
+        m37_labelled = self.label_periods(m37_data, time_of_day)
+        # totals are summed as floats so that they can not overflow the compact integer dtypes
+        m37_labelled["intergreen_time"] = m37_labelled["intergreen_time"].astype(float)
+        m37_labelled["green_time"] = m37_labelled["green_time"].astype(float)
+        return m37_labelled.groupby(self.STAGE_KEYS, observed=True).agg(
+            occurrences=("intergreen_time", "count"),
+            interstage_total=("intergreen_time", "sum"),
+            green_count=("green_time", "count"),
+            green_total=("green_time", "sum"),
+            messages=("green_time", "size"),
+        )
+
+    def combine_stage_aggregates(self, stage_aggregates):
+        """
+        Function to combine stage time totals of separate chunks of M37 data
+        :param stage_aggregates: list of DataFrames from aggregate_stage_times
+        :return: DataFrame of stage time totals and counts
+        """
+        combined_aggregates = pd.concat(stage_aggregates).reset_index()
+        # ids are categorical within a chunk, they are compared as values between chunks
+        for column in ("node_id", "site_id", "utc_stage_id"):
+            combined_aggregates[column] = combined_aggregates[column].astype(object)
+        return combined_aggregates.groupby(self.STAGE_KEYS, observed=True).sum()
+
+    def aggregate_all_m37_in_directory(self, directory_path):
+        """
+        Function to get the stage time totals of all M37 files found in directory. The files are read in chunks
+        which are aggregated as they are read, so the raw M37 data is never held in memory in full. If cache_path
+        is set, the totals of each file are cached and only new or modified files are read
+        :param directory_path: path to directory
+        :return: DataFrame of stage time totals and counts
+        """
+        file_paths = self.find_m37_files(directory_path)
+        aggregate_cache = self.get_aggregate_cache()
+        stage_aggregates = []
+        uncached_file_paths = []
+        for file_path in file_paths:
+            cached_aggregate = aggregate_cache.get(file_path) if aggregate_cache else None
+            if cached_aggregate is None:
+                uncached_file_paths.append(file_path)
+            else:
+                stage_aggregates.append(self.cached_to_stage_aggregate(cached_aggregate))
+        for file_path, file_chunks in groupby(self.m37_file_chunk_iterator(uncached_file_paths), key=itemgetter(0)):
+            file_aggregates = []
+            for _, m37_chunk in file_chunks:
+                timestamps = pd.DatetimeIndex(pd.to_datetime(m37_chunk["timestamp"]))
+                file_aggregates.append(
+                    self.aggregate_stage_times(m37_chunk, (timestamps - timestamps.normalize()).to_numpy())
+                )
+                if len(file_aggregates) >= self.MAX_PARTIAL_AGGREGATES:
+                    file_aggregates = [self.combine_stage_aggregates(file_aggregates)]
+            file_aggregate = self.combine_stage_aggregates(file_aggregates)
+            if aggregate_cache:
+                aggregate_cache.put(file_path, file_aggregate.reset_index())
+            stage_aggregates.append(file_aggregate)
+            if len(stage_aggregates) >= self.MAX_PARTIAL_AGGREGATES:
+                stage_aggregates = [self.combine_stage_aggregates(stage_aggregates)]
+        if aggregate_cache:
+            aggregate_cache.save(file_paths)
+        if not stage_aggregates:
+            raise ValueError(f"No M37 data found in directory: {directory_path}")
+        return self.combine_stage_aggregates(stage_aggregates)
+
+    def aggregate_signal_events_in_directory(self, directory_path):
+        """
+        Function to get the stage time totals of all SAD files found in directory. The signal events are converted
+        to M37 messages which are aggregated as they are produced, without writing intermediate M37 files
+        :param directory_path: path to directory
+        :return: DataFrame of stage time totals and counts
+        """
+        summaries = SignalEventParser().aggregate_signal_event_folder(
+            directory_path, self, processes=self.signal_emulator.processes
+        )
+        stage_aggregates = [summary.stage_aggregate for summary in summaries if summary.stage_aggregate is not None]
+        if not stage_aggregates:
+            raise ValueError(f"No signal event data found in directory: {directory_path}")
+        return self.combine_stage_aggregates(stage_aggregates)
+
+    def get_aggregate_cache(self):
+        """
+        Function to get the cache of the stage time totals of each raw M37 file, the cached totals depend on the
+        time periods they were labelled with
+        :return: AggregateCache, or None if cache_path is not set
+        """
+        if not self.cache_path:
+            return None
+        periods = [(period.name, period.start_time, period.end_time) for period in self.periods]
+        return AggregateCache(self.cache_path, "m37", periods)
+
+    def cached_to_stage_aggregate(self, cached_aggregate):
+        """
+        Function to restore the index and categorical period id of cached stage time totals
+        :param cached_aggregate: DataFrame from AggregateCache
+        :return: DataFrame of stage time totals and counts
+        """
+        cached_aggregate["period_id"] = pd.Categorical(
+            cached_aggregate["period_id"], categories=[period.name for period in self.periods]
+        )
+        return cached_aggregate.set_index(self.STAGE_KEYS)
+
+    def label_periods(self, m37_data, time_of_day=None):
+        """
+        Function to label each M37 with the time periods that contain its time of day, start and end times
+        inclusive. An M37 in more than one period, such as at the boundary of adjacent periods, is repeated for
+        each period
+        :param m37_data: DataFrame of M37 data
+        :param time_of_day: array of the time of day of each M37 as timedelta64, taken from the timestamp index
+            of m37_data if None
+        :return: DataFrame of M37 data with a categorical period_id column, in the order of the periods
+        """
+        if time_of_day is None:
+            time_of_day = (m37_data.index - m37_data.index.normalize()).to_numpy()
+        row_indices = []
+        period_codes = []
+        for period_code, period in enumerate(self.periods):
+            start_time = np.timedelta64(period.start_time)
+            end_time = np.timedelta64(period.end_time)
+            if start_time <= end_time:
+                in_period = (time_of_day >= start_time) & (time_of_day <= end_time)
+            else:
+                # period spans midnight
+                in_period = (time_of_day >= start_time) | (time_of_day <= end_time)
+            period_row_indices = np.flatnonzero(in_period)
+            row_indices.append(period_row_indices)
+            period_codes.append(np.full(len(period_row_indices), period_code))
+        m37_labelled = m37_data[
+            ["node_id", "site_id", "utc_stage_id", "intergreen_time", "green_time"]
+        ].iloc[np.concatenate(row_indices)]
+        m37_labelled.reset_index(drop=True, inplace=True)
+        m37_labelled["period_id"] = pd.Categorical.from_codes(
+            np.concatenate(period_codes), categories=[period.name for period in self.periods]
+        )
+        return m37_labelled
 
     @staticmethod
     def map_utc_stage_id_to_number(utc_stage_id):
@@ -248,37 +407,8 @@ class M37Averages(BaseCollection):
         :param original_series:
         :return: Series of rounded values
         """
-
-        def custom_round(value):
-            """
-            custom rounding function that ignores NaNs
-            :param value: value
-            :return: rounded value or NaN
-            """
-
-            if pd.notna(value):
-                return round(value)
-            else:
-                return value
-
-        # Calculate the original total sum
-        original_total = int(round(original_series.sum(), 4))
-        # Round the values
-        rounded_series = original_series.apply(custom_round)
-        rounded_total = int(rounded_series.sum())
-        # Calculate the difference between rounded total and original total
-        difference = original_total - rounded_total
-        # Identify the indices with the largest differences
-        indices_largest_diff = (
-            (original_series - rounded_series).abs().nlargest(int(abs(difference))).index
-        )
-        # Adjust values at identified indices
-        for index in indices_largest_diff:
-            if difference > 0:
-                rounded_series.at[index] += 1
-            elif difference < 0:
-                rounded_series.at[index] -= 1
-        return rounded_series
+        rounded_values = round_preserving_row_totals(original_series.to_numpy(dtype=float)[None, :])[0]
+        return pd.Series(rounded_values, index=original_series.index)
 
     def load_all_m37_in_directory_df(self, directory_path):
         """
@@ -286,32 +416,120 @@ class M37Averages(BaseCollection):
         :param directory_path: path to directory
         :return: DataFrame of M37 data
         """
-        m37_all_df = pd.DataFrame()
-        file_paths = find_files_with_extension(directory_path, "csv")
-        for file_path in file_paths:
-            m37_df = pd.read_csv(file_path)
-            m37_df.rename(columns=self.CSV_COLUMN_RENAME)
-            m37_all_df = pd.concat([m37_all_df, m37_df], ignore_index=True)
-        file_paths = find_files_with_extension(directory_path, "lsg")
-        for file_path in file_paths:
-            m37_df = self.read_m37_lsg_file_to_df(file_path)
-            m37_all_df = pd.concat([m37_all_df, m37_df], ignore_index=True)
+        m37_all_df = pd.concat(
+            [m37_chunk for _, m37_chunk in self.m37_file_chunk_iterator(self.find_m37_files(directory_path))],
+            ignore_index=True,
+        )
         m37_all_df["timestamp"] = pd.to_datetime(m37_all_df["timestamp"])
         m37_all_df.set_index("timestamp", inplace=True)
         return m37_all_df
 
-    def read_m37_lsg_file_to_df(self, file_path):
-        m37_df = pd.read_fwf(
-            file_path,
-            colspecs=self.COLUMN_LIMITS,
-            skiprows=self.HEADER_ROWS,
-            names=self.COLUMN_NAMES,
+    @staticmethod
+    def find_m37_files(directory_path):
+        """
+        Function to find all csv, parquet and lsg files in directory, csv and lsg files may be gzip or zstd
+        compressed
+        :param directory_path: path to directory
+        :return: list of file paths
+        """
+        return (
+            find_log_files(directory_path, "csv")
+            + find_files_with_extension(directory_path, "parquet")
+            + find_log_files(directory_path, "lsg")
+        )
+
+    def m37_file_chunk_iterator(self, file_paths):
+        """
+        Generator of chunks of the M37 data in csv, parquet and lsg files, the chunks of each file are consecutive
+        :param file_paths: list of csv, parquet and lsg file paths
+        :return: tuple of file path and DataFrame of M37 data
+        """
+        for file_path in file_paths:
+            if file_path.endswith(".parquet"):
+                for m37_chunk in self.read_m37_parquet_file_chunks(file_path):
+                    yield file_path, m37_chunk
+            elif not strip_compression_suffix(file_path).endswith(".lsg"):
+                for m37_chunk in self.read_m37_csv_file_chunks(file_path):
+                    yield file_path, m37_chunk
+        for file_path, lsg_columns in decode_fixed_width_files(
+            [file_path for file_path in file_paths if strip_compression_suffix(file_path).endswith(".lsg")],
+            processes=self.signal_emulator.processes,
+            **self.lsg_decode_kwargs,
+        ):
+            yield file_path, self.lsg_columns_to_df(lsg_columns)
+
+    def read_m37_csv_file_chunks(self, file_path):
+        """
+        Generator of chunks of the M37 data in a csv file, columns are renamed to the M37 column names
+        :param file_path: path to csv file
+        :return: DataFrame of M37 data
+        """
+        csv_dtypes = {
+            source_column: self.RAW_DTYPES[column]
+            for source_column, column in self.CSV_COLUMN_RENAME.items()
+            if column in self.RAW_DTYPES
+        }
+        csv_dtypes.update(self.RAW_DTYPES)
+        with open_log_file(file_path) as csv_file:
+            for m37_chunk in pd.read_csv(
+                csv_file,
+                chunksize=self.CHUNK_SIZE,
+                dtype=csv_dtypes,
+                usecols=lambda column: self.CSV_COLUMN_RENAME.get(column, column) in ("timestamp", *self.RAW_DTYPES),
+            ):
+                yield m37_chunk.rename(columns=self.CSV_COLUMN_RENAME)
+
+    def read_m37_parquet_file_chunks(self, file_path):
+        """
+        Generator of chunks of the M37 data in a Parquet file, such as those converted from SAD files by
+        SignalEventParser. pyarrow is an optional dependency, required to read Parquet files
+        :param file_path: path to parquet file
+        :return: DataFrame of M37 data
+        """
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as error:
+            raise ImportError("pyarrow is required to read Parquet M37 files: pip install pyarrow") from error
+        parquet_file = pq.ParquetFile(file_path)
+        columns = [
+            column
+            for column in parquet_file.schema_arrow.names
+            if self.CSV_COLUMN_RENAME.get(column, column) in ("timestamp", *self.RAW_DTYPES)
+        ]
+        for record_batch in parquet_file.iter_batches(batch_size=self.CHUNK_SIZE, columns=columns):
+            yield record_batch.to_pandas().rename(columns=self.CSV_COLUMN_RENAME).astype(self.RAW_DTYPES)
+
+    @property
+    def lsg_decode_kwargs(self):
+        return {
+            "column_limits": self.COLUMN_LIMITS,
+            "column_names": self.COLUMN_NAMES,
+            "column_types": self.LSG_COLUMN_TYPES,
+            "filter_column": "message_id",
+            "filter_value": "M37",
+            "header_rows": self.HEADER_ROWS,
+        }
+
+    def lsg_columns_to_df(self, lsg_columns):
+        """
+        Function to convert the decoded columns of an lsg file to a DataFrame of M37 data with compact dtypes
+        :param lsg_columns: dict of column name to array from decode_fixed_width_file
+        :return: DataFrame of M37 data
+        """
+        m37_df = pd.DataFrame(lsg_columns)
+        # lsg timestamps are times of day, they are placed on the current date
+        m37_df["timestamp"] = pd.Timestamp.today().normalize() + m37_df["timestamp"]
+        return m37_df.astype(
+            {
+                **self.RAW_DTYPES,
+                "intergreen_time": "int16",
+                "green_time": "int16",
+                "length": "int16",
+            }
         )
-        m37_df = m37_df[m37_df["message_id"] == "M37"]
-        m37_df["green_time"] = m37_df["green_time"].astype(int)
-        m37_df["length"] = m37_df["length"].astype(int)
-        m37_df["intergreen_time"] = m37_df["intergreen_time"].astype(int)
-        return m37_df
+
+    def read_m37_lsg_file_to_df(self, file_path):
+        return self.lsg_columns_to_df(decode_fixed_width_file(file_path, **self.lsg_decode_kwargs))
 
 
 if __name__ == "__main__":
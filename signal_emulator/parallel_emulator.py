@@ -0,0 +1,187 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import fields
+
+# SignalEmulator instance owned by each worker process, set by the pool initializer
+_worker_signal_emulator = None
+
+
+def _init_worker(signal_emulator):
+    """
+    Pool initializer, stores the SignalEmulator for use by the worker functions. With the fork start method the
+    object is inherited by the worker, otherwise it is pickled once per worker
+    :param signal_emulator: SignalEmulator object
+    :return: None
+    """
+    global _worker_signal_emulator
+    _worker_signal_emulator = signal_emulator
+
+
+def _generate_signal_plans_worker(controller_keys, ped_only):
+    """
+    Worker function to generate the signal plans for a shard of controllers
+    :param controller_keys: list of controller keys in the shard
+    :param ped_only: bool, only generate signal plans for pedestrian streams
+    :return: dict of collection name to list of item records
+    """
+    signal_emulator = _worker_signal_emulator
+    for controller_key in controller_keys:
+        signal_emulator.generate_controller_signal_plans(
+            signal_emulator.controllers.get_by_key(controller_key), ped_only=ped_only
+        )
+    return ParallelEmulator.get_shard_records(
+        signal_emulator, ParallelEmulator.SIGNAL_PLAN_COLLECTIONS, controller_keys
+    )
+
+
+def _emulate_worker(controller_keys):
+    """
+    Worker function to emulate the signal plans for a shard of controllers
+    :param controller_keys: list of controller keys in the shard
+    :return: dict of collection name to list of item records
+    """
+    signal_emulator = _worker_signal_emulator
+    controller_keys_set = set(controller_keys)
+    for signal_plan in signal_emulator.signal_plans:
+        if signal_plan.controller_key in controller_keys_set:
+            signal_plan.emulate()
+    return ParallelEmulator.get_shard_records(
+        signal_emulator, ParallelEmulator.PHASE_TIMING_COLLECTIONS, controller_keys
+    )
+
+
+class ParallelEmulator:
+    """
+    Class to run the signal plan generation and emulation over a process pool. Controllers are independent, so they
+    are split into contiguous shards which are processed by the workers. The items created by each worker are
+    returned as records and merged back into the parent SignalEmulator collections in shard order, so the result is
+    identical to a serial run
+    """
+
+    SIGNAL_PLAN_COLLECTIONS = ("signal_plans", "signal_plan_streams", "signal_plan_stages")
+    PHASE_TIMING_COLLECTIONS = (
+        "phase_timings",
+        "modified_intergreens",
+        "modified_phase_delays",
+        "visum_signal_controllers",
+    )
+    SHARDS_PER_PROCESS = 4
+
+    def __init__(self, signal_emulator, processes=None):
+        """
+        Constructor for ParallelEmulator
+        :param signal_emulator: parent SignalEmulator object
+        :param processes: number of worker processes, defaults to the number of CPUs
+        """
+        self.signal_emulator = signal_emulator
+        self.processes = processes or os.cpu_count()
+
+    def generate_signal_plans(self, ped_only=False):
+        """
+        Method to generate signal plans for all controllers over the process pool
+        :param ped_only: bool, only generate signal plans for pedestrian streams
+        :return: None
+        """
+        controller_keys = [controller.controller_key for controller in self.signal_emulator.controllers]
+        self.run(
+            _generate_signal_plans_worker,
+            controller_keys,
+            self.SIGNAL_PLAN_COLLECTIONS,
+            ped_only,
+        )
+
+    def generate_phase_timings(self):
+        """
+        Method to emulate all signal plans over the process pool
+        :return: None
+        """
+        controller_keys = list(
+            dict.fromkeys(signal_plan.controller_key for signal_plan in self.signal_emulator.signal_plans)
+        )
+        self.run(_emulate_worker, controller_keys, self.PHASE_TIMING_COLLECTIONS)
+
+    def run(self, worker_function, controller_keys, collection_names, *args):
+        """
+        Method to process the controller shards with worker_function and merge the results
+        :param worker_function: module level worker function
+        :param controller_keys: list of controller keys to process
+        :param collection_names: names of the SignalEmulator collections the worker writes to
+        :param args: additional arguments passed to worker_function
+        :return: None
+        """
+        shards = self.get_shards(controller_keys)
+        if not shards:
+            return
+        self.signal_emulator.logger.info(
+            f"Processing {len(controller_keys)} controllers in {len(shards)} shards "
+            f"with {self.processes} processes"
+        )
+        with ProcessPoolExecutor(
+            max_workers=min(self.processes, len(shards)),
+            initializer=_init_worker,
+            initargs=(self.signal_emulator,),
+        ) as executor:
+            futures = [executor.submit(worker_function, shard, *args) for shard in shards]
+            # results are merged in submission order so the merged collections are deterministic
+            for shard, future in zip(shards, futures):
+                self.merge_shard_records(future.result(), collection_names, shard)
+
+    def get_shards(self, controller_keys):
+        """
+        Function to split controller keys into contiguous shards
+        :param controller_keys: list of controller keys
+        :return: list of lists of controller keys
+        """
+        num_shards = min(len(controller_keys), self.processes * self.SHARDS_PER_PROCESS)
+        if num_shards == 0:
+            return []
+        shard_size, remainder = divmod(len(controller_keys), num_shards)
+        shards = []
+        start = 0
+        for shard_index in range(num_shards):
+            end = start + shard_size + (1 if shard_index < remainder else 0)
+            shards.append(controller_keys[start:end])
+            start = end
+        return shards
+
+    @staticmethod
+    def get_shard_records(signal_emulator, collection_names, controller_keys):
+        """
+        Function to get the records of all items belonging to the controllers in a shard
+        :param signal_emulator: SignalEmulator object
+        :param collection_names: names of the collections to get records from
+        :param controller_keys: list of controller keys in the shard
+        :return: dict of collection name to list of item records
+        """
+        controller_keys_set = set(controller_keys)
+        shard_records = {}
+        for collection_name in collection_names:
+            collection = getattr(signal_emulator, collection_name)
+            record_fields = [
+                field.name
+                for field in fields(collection.ITEM_CLASS)
+                if field.init and field.name != "signal_emulator"
+            ]
+            shard_records[collection_name] = [
+                {field_name: getattr(item, field_name) for field_name in record_fields}
+                for item in collection
+                if item.controller_key in controller_keys_set
+            ]
+        return shard_records
+
+    def merge_shard_records(self, shard_records, collection_names, controller_keys):
+        """
+        Method to replace the items of the shard controllers with the items created by the worker.
+        Collections are merged in the order given so that items referencing a parent item can find it
+        :param shard_records: dict of collection name to list of item records
+        :param collection_names: names of the collections to merge
+        :param controller_keys: list of controller keys in the shard
+        :return: None
+        """
+        controller_keys_set = set(controller_keys)
+        for collection_name in collection_names:
+            collection = getattr(self.signal_emulator, collection_name)
+            for key in [key for key, item in collection.data.items() if item.controller_key in controller_keys_set]:
+                collection.remove_by_key(key)
+            for record in shard_records[collection_name]:
+                collection.add_instance(collection.ITEM_CLASS(**record, signal_emulator=self.signal_emulator))
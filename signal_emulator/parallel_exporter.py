@@ -0,0 +1,296 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from signal_emulator.parallel_emulator import ParallelEmulator
+from signal_emulator.utilities.utility_functions import text_to_file
+
+# SignalEmulator instance owned by each worker process, set by the pool initializer
+_worker_signal_emulator = None
+
+
+def _init_worker(signal_emulator):
+    """
+    Pool initializer, stores the SignalEmulator for use by the render functions. With the fork start method the
+    object is inherited by the worker, otherwise it is pickled once per worker
+    :param signal_emulator: SignalEmulator object
+    :return: None
+    """
+    global _worker_signal_emulator
+    _worker_signal_emulator = signal_emulator
+
+
+def _render_worker(render_function, args):
+    """
+    Worker function to run a render function with the SignalEmulator of the worker
+    :param render_function: module level render function
+    :param args: tuple of arguments passed to render_function after the SignalEmulator
+    :return: str rendered file contents
+    """
+    return render_function(_worker_signal_emulator, *args)
+
+
+def render_rgs_controllers(signal_emulator, collection_name, time_period_id, controller_numbers):
+    """
+    Function to render the RGS sections of a shard of controllers
+    :param signal_emulator: SignalEmulator object
+    :param collection_name: name of the SaturnCollection of the SignalEmulator
+    :param time_period_id: time period id
+    :param controller_numbers: list of signal controller numbers, all controllers if None
+    :return: str RGS sections
+    """
+    return getattr(signal_emulator, collection_name).render_rgs_controllers(time_period_id, controller_numbers)
+
+
+def render_net_file(signal_emulator, collection_name, time_period_id):
+    """
+    Function to render a VISUM net file
+    :param signal_emulator: SignalEmulator object
+    :param collection_name: name of the VisumCollection of the SignalEmulator
+    :param time_period_id: time period id, all time periods if None
+    :return: str net file contents
+    """
+    return getattr(signal_emulator, collection_name).render_net_file(time_period_id)
+
+
+def render_lsg_file(signal_emulator, signal_plan_key):
+    """
+    Function to render the LinSig file of a signal plan
+    :param signal_emulator: SignalEmulator object
+    :param signal_plan_key: key of the SignalPlan
+    :return: str lsg file contents
+    """
+    return signal_emulator.linsig.render_lsg_v236(signal_emulator.signal_plans.get_by_key(signal_plan_key))
+
+
+def render_multi_scenario_lsg_file(signal_emulator, controller_key):
+    """
+    Function to render the multi scenario LinSig file of a controller
+    :param signal_emulator: SignalEmulator object
+    :param controller_key: key of the Controller
+    :return: str lsg file contents
+    """
+    return signal_emulator.linsig.render_multi_scenario_lsg_v236(
+        signal_emulator.controllers.get_by_key(controller_key).signal_plans
+    )
+
+
+@dataclass(eq=False)
+class ExportFile:
+    """
+    Class to represent an output file of an export, the contents are the header followed by the results of the
+    render tasks in order
+    """
+    output_path: str
+    render_tasks: list
+    header: str = ""
+    newline: Optional[str] = None
+    log_message: Optional[str] = None
+
+
+class ParallelExporter:
+    """
+    Class to export the SATURN, VISUM and LinSig files over a process pool. Rendering is pure formatting of the
+    emulated timings, so the file contents are rendered by the workers and returned to the parent, which writes
+    each file with a single buffered write. Results are consumed in submission order, so files are written in a
+    deterministic order with the same contents as a serial export. With one process the render tasks are run in
+    this process
+    """
+
+    # number of render task chunks submitted per process
+    CHUNKS_PER_PROCESS = ParallelEmulator.SHARDS_PER_PROCESS
+
+    def __init__(self, signal_emulator, processes=None):
+        """
+        Constructor for ParallelExporter
+        :param signal_emulator: parent SignalEmulator object
+        :param processes: number of worker processes, defaults to the SignalEmulator processes
+        """
+        self.signal_emulator = signal_emulator
+        self.processes = processes or signal_emulator.processes
+
+    def export_all(self, time_periods=None):
+        """
+        Method to export the RGS file of each time period, the VISUM net files of all time periods and the LinSig
+        file of each signal plan, rendered in a single pool
+        :param time_periods: list of TimePeriod for the RGS files, all time periods if None
+        :return: None
+        """
+        self.run(
+            self.get_rgs_export_files(time_periods)
+            + self.get_net_export_files(["visum_signal_controllers", "visum_signal_groups"], [None])
+            + self.get_lsg_export_files()
+        )
+
+    def export_rgs_files(self, time_periods=None, collection_name="saturn_signal_groups"):
+        """
+        Method to export SATURN RGS files
+        :param time_periods: list of TimePeriod, all time periods if None
+        :param collection_name: name of the SaturnCollection of the SignalEmulator
+        :return: None
+        """
+        self.run(self.get_rgs_export_files(time_periods, collection_name))
+
+    def export_net_files(self, collection_names, time_periods=None, include_all_periods=True):
+        """
+        Method to export VISUM net files
+        :param collection_names: names of the VisumCollections of the SignalEmulator
+        :param time_periods: list of TimePeriod, all time periods if None
+        :param include_all_periods: bool, also export the net file of all time periods
+        :return: None
+        """
+        if time_periods is None:
+            time_periods = self.signal_emulator.time_periods.get_all()
+        time_period_ids = [time_period.name for time_period in time_periods]
+        if include_all_periods:
+            time_period_ids.append(None)
+        self.run(self.get_net_export_files(collection_names, time_period_ids))
+
+    def export_lsg_files(self, multi_scenario=False):
+        """
+        Method to export LinSig files
+        :param multi_scenario: bool, one file per controller with a scenario for each signal plan
+        :return: None
+        """
+        self.run(self.get_lsg_export_files(multi_scenario))
+
+    def get_rgs_export_files(self, time_periods=None, collection_name="saturn_signal_groups"):
+        """
+        Function to get the RGS export files, the controllers of each time period are rendered in contiguous shards
+        :param time_periods: list of TimePeriod, all time periods if None
+        :param collection_name: name of the SaturnCollection of the SignalEmulator
+        :return: list of ExportFile
+        """
+        if time_periods is None:
+            time_periods = self.signal_emulator.time_periods.get_all()
+        collection = getattr(self.signal_emulator, collection_name)
+        export_files = []
+        for time_period in time_periods:
+            if self.processes > 1:
+                shards = ParallelEmulator(self.signal_emulator, self.processes).get_shards(
+                    collection.get_rgs_controller_numbers(time_period.name)
+                )
+            else:
+                shards = [None]
+            output_path = collection.get_rgs_output_path(time_period.name)
+            export_files.append(
+                ExportFile(
+                    output_path=output_path,
+                    render_tasks=[
+                        (render_rgs_controllers, (collection_name, time_period.name, shard)) for shard in shards
+                    ],
+                    header=collection.OUTPUT_HEADER,
+                    log_message=f"SATURN {collection.SATURN_TABLE_NAME} output to net file: {output_path}",
+                )
+            )
+        return export_files
+
+    def get_net_export_files(self, collection_names, time_period_ids):
+        """
+        Function to get the VISUM net export files
+        :param collection_names: names of the VisumCollections of the SignalEmulator
+        :param time_period_ids: list of time period ids, None for the net file of all time periods
+        :return: list of ExportFile
+        """
+        export_files = []
+        for collection_name in collection_names:
+            collection = getattr(self.signal_emulator, collection_name)
+            for time_period_id in time_period_ids:
+                # checked before rendering, so no files are written if a net file can not be exported
+                collection.validate_net_file_time_period_id(time_period_id)
+                output_path = collection.get_net_output_path(time_period_id)
+                export_files.append(
+                    ExportFile(
+                        output_path=output_path,
+                        render_tasks=[(render_net_file, (collection_name, time_period_id))],
+                        newline="",
+                        log_message=f"VISUM {collection.VISUM_TABLE_NAME} output to net file: {output_path}",
+                    )
+                )
+        return export_files
+
+    def get_lsg_export_files(self, multi_scenario=False):
+        """
+        Function to get the LinSig export files, one for each signal plan of each controller, or one multi scenario
+        file for each controller. Signal plans of a controller are consecutive tasks, so mostly share a worker and
+        its cached controller sections
+        :param multi_scenario: bool, one file per controller with a scenario for each signal plan
+        :return: list of ExportFile
+        """
+        linsig = self.signal_emulator.linsig
+        # the cached sections may be of controllers that have since changed
+        linsig.clear_controller_sections()
+        if multi_scenario:
+            # checked before rendering, so no files are written if any controller can not be exported
+            for controller in self.signal_emulator.controllers:
+                if controller.signal_plans:
+                    linsig.validate_multi_scenario_signal_plans(controller.signal_plans)
+            return [
+                ExportFile(
+                    output_path=linsig.get_multi_scenario_linsig_filepath(controller),
+                    render_tasks=[(render_multi_scenario_lsg_file, (controller.controller_key,))],
+                    log_message=f"Exporting Signal Plans: {controller.controller_key} to multi scenario Linsig file",
+                )
+                for controller in self.signal_emulator.controllers
+                if controller.signal_plans
+            ]
+        return [
+            ExportFile(
+                output_path=linsig.get_linsig_filepath(signal_plan),
+                render_tasks=[(render_lsg_file, (signal_plan.get_key(),))],
+                log_message=(
+                    f"Exporting Signal Plan: {controller.controller_key} {signal_plan.time_period_id} to Linsig file"
+                ),
+            )
+            for controller in self.signal_emulator.controllers
+            for signal_plan in controller.signal_plans
+        ]
+
+    def run(self, export_files):
+        """
+        Method to render the export files and write them in order
+        :param export_files: list of ExportFile
+        :return: None
+        """
+        render_tasks = [render_task for export_file in export_files for render_task in export_file.render_tasks]
+        for output_directory in dict.fromkeys(Path(export_file.output_path).parent for export_file in export_files):
+            output_directory.mkdir(exist_ok=True, parents=True)
+        if self.processes <= 1 or len(render_tasks) <= 1:
+            self.write_export_files(
+                export_files,
+                (render_function(self.signal_emulator, *args) for render_function, args in render_tasks),
+            )
+            return
+        self.signal_emulator.logger.info(
+            f"Rendering {len(export_files)} export files in {len(render_tasks)} tasks with {self.processes} processes"
+        )
+        with ProcessPoolExecutor(
+            max_workers=min(self.processes, len(render_tasks)),
+            initializer=_init_worker,
+            initargs=(self.signal_emulator,),
+        ) as executor:
+            # map returns the results in submission order, so files are written in order as they complete
+            self.write_export_files(
+                export_files,
+                executor.map(
+                    _render_worker,
+                    [render_function for render_function, _ in render_tasks],
+                    [args for _, args in render_tasks],
+                    chunksize=max(1, len(render_tasks) // (self.processes * self.CHUNKS_PER_PROCESS)),
+                ),
+            )
+
+    def write_export_files(self, export_files, rendered_parts):
+        """
+        Method to write the export files from their rendered parts
+        :param export_files: list of ExportFile
+        :param rendered_parts: iterator of the rendered contents of the render tasks, in order
+        :return: None
+        """
+        for export_file in export_files:
+            contents = [export_file.header]
+            contents.extend(next(rendered_parts) for _ in export_file.render_tasks)
+            if export_file.log_message:
+                self.signal_emulator.logger.info(export_file.log_message)
+            text_to_file("".join(contents), export_file.output_path, newline=export_file.newline)
@@ -40,14 +40,14 @@ class Plan:
     # def process_data(data, signal_emulator):
     #     return [PlanSequenceItem(i, d, signal_emulator) for i, d in enumerate(data)]
 
-    def emulate(self):
-        self.signal_emulator.plans.active_plan_id = self.plan_number
+    def emulate(self, context):
+        context.plan_number = self.plan_number
         stream = self.signal_emulator.controller.streams.get_by_site_id(self.site_id)
-        m37_stages = self.get_m37_stage_numbers(self.site_id)
+        m37_stages = self.get_m37_stage_numbers(self.site_id, context)
         m37_check = len(m37_stages) > 0
         if m37_check:
             cycle_time = self.signal_emulator.m37s.get_cycle_time_by_site_id_and_period_id(
-                self.site_id, self.signal_emulator.periods.active_period_id
+                self.site_id, context.time_period_id
             )
             self.signal_emulator.logger.info("M37s used for stage lengths")
         else:
@@ -55,22 +55,22 @@ class Plan:
             self.signal_emulator.logger.info(
                 "M37s not found, plan pulse times used for stage lengths"
             )
-        stage_sequence = self.get_stage_sequence(m37_stages, stream.stream_number)
+        stage_sequence = self.get_stage_sequence(m37_stages, stream, context=context)
 
-        self.signal_emulator.controller.stages.active_stage_id = stage_sequence[-1].stage_number
+        context.set_active_stage_key(stream, (stream.controller_key, stage_sequence[-1].stage_number))
         if len(stage_sequence) == 1:
             for phase in stage_sequence[0].stage.phases_in_stage:
-                phase.phase_timings.add_phase_timing(
+                phase.get_phase_timings(context).add_phase_timing(
                     phase_ref=phase.phase_ref, start_time=0, end_time=cycle_time
                 )
 
         for index, stage_sequence_item in enumerate(stage_sequence + [stage_sequence[0]]):
-            current_stage = self.signal_emulator.controller.stages.active_stage
+            current_stage = context.get_active_stage(stream)
             m37 = self.signal_emulator.m37s.get_by_key(
                 (
                     self.site_id,
                     stage_sequence_item.stage.m37_stage_id,
-                    self.signal_emulator.periods.active_period_id,
+                    context.time_period_id,
                 )
             )
             if not m37:
@@ -78,7 +78,7 @@ class Plan:
                     (
                         self.site_id,
                         stage_sequence_item.stage.m37_stage_id_ped,
-                        self.signal_emulator.periods.active_period_id,
+                        context.time_period_id,
                     )
                 )
             end_phases = self.signal_emulator.controller.stages.get_end_phases(
@@ -87,7 +87,9 @@ class Plan:
             start_phases = self.signal_emulator.controller.stages.get_start_phases(
                 current_stage, stage_sequence_item.stage
             )
-            interstage_time = self.get_interstage_time(current_stage, stage_sequence_item.stage)
+            interstage_time = self.get_interstage_time(
+                current_stage, stage_sequence_item.stage, context=context
+            )
             if (
                 m37_check
                 and m37.stage_id not in {"PG", "GX"}
@@ -114,18 +116,18 @@ class Plan:
                         ),
                         cycle_time,
                     )
-                    last_phase_timing = end_phase.phase_timings.get_last()
+                    end_phase_timings = end_phase.get_phase_timings(context)
+                    last_phase_timing = end_phase_timings[-1] if end_phase_timings else None
                     if last_phase_timing and last_phase_timing.end_time is None:
                         last_phase_timing.end_time = end_time
                     else:
-                        end_phase.phase_timings.add_phase_timing(
+                        end_phase.get_phase_timings(context).add_phase_timing(
                             phase_ref=end_phase.phase_ref,
                             end_time=end_time,
                         )
             if not index == len(stage_sequence):
                 for start_phase in start_phases:
                     max_start_time_delta = self.get_max_start_time(
-                        end_phases=end_phases,
                         start_phase=start_phase,
                         end_stage_key=current_stage.stage_number,
                         start_stage_key=stage_sequence_item.stage_number,
@@ -133,16 +135,17 @@ class Plan:
                     start_time = self.constrain_time_to_cycle_time(
                         stage_sequence_item.pulse_time + max_start_time_delta, cycle_time
                     )
-                    last_phase_timing = start_phase.phase_timings.get_last()
+                    start_phase_timings = start_phase.get_phase_timings(context)
+                    last_phase_timing = start_phase_timings[-1] if start_phase_timings else None
                     if last_phase_timing and last_phase_timing.start_time is None:
                         last_phase_timing.start_time = start_time
                     else:
-                        start_phase.phase_timings.add_phase_timing(
+                        start_phase.get_phase_timings(context).add_phase_timing(
                             phase_ref=start_phase.phase_ref,
                             start_time=start_time,
                         )
-            self.signal_emulator.controller.stages.active_stage_id = (
-                stage_sequence_item.stage_number
+            context.set_active_stage_key(
+                stream, (stream.controller_key, stage_sequence_item.stage_number)
             )
 
     @staticmethod
@@ -152,105 +155,83 @@ class Plan:
     def validate(self):
         return any(psi.has_f_bits() or psi.has_p_bits() for psi in self.plan_sequence_items)
 
-    def get_interstage_time(self, end_stage, start_stage, modified=True):
-        end_phases = self.signal_emulator.stages.get_end_phases(end_stage, start_stage)
-        start_phases = self.signal_emulator.stages.get_start_phases(end_stage, start_stage)
-        max_interstage_time = 0
-        for start_phase in start_phases:
-            interstage_time = self.get_max_start_time(
-                end_phases, start_phase, end_stage.stage_number, start_stage.stage_number, modified
-            )
-            max_interstage_time = max(max_interstage_time, interstage_time)
-        return max_interstage_time
-
-    def get_max_start_time(self, end_phases, start_phase, end_stage_key, start_stage_key, modified=True):
-        time_delta = 0
-        for end_phase in end_phases:
-            end_phase_delay = (
-                self.signal_emulator.phase_delays.get_delay_time_by_stage_and_phase_keys(
-                    controller_key=end_phase.controller_key,
-                    end_stage_key=end_stage_key,
-                    start_stage_key=start_stage_key,
-                    phase_key=end_phase.phase_ref,
-                    modified=modified,
-                )
-            )
-            intergreen = self.signal_emulator.intergreens.get_intergreen_time_by_phase_keys(
-                controller_key=end_phase.controller_key,
-                end_phase_key=end_phase.phase_ref,
-                start_phase_key=start_phase.phase_ref,
-                modified=modified,
-            )
-            start_phase_delay = (
-                self.signal_emulator.phase_delays.get_delay_time_by_stage_and_phase_keys(
-                    controller_key=end_phase.controller_key,
-                    end_stage_key=end_stage_key,
-                    start_stage_key=start_stage_key,
-                    phase_key=start_phase.phase_ref,
-                    modified=modified,
-                )
-            )
-            time_delta = max(time_delta, max(end_phase_delay + intergreen, start_phase_delay))
-        return time_delta
+    def get_interstage_time(self, end_stage, start_stage, modified=True, context=None):
+        return self.signal_emulator.interstage_tables.get_interstage_time(
+            end_stage, start_stage, modified=modified, context=context
+        )
+
+    def get_max_start_time(self, start_phase, end_stage_key, start_stage_key, modified=True, context=None):
+        return self.signal_emulator.interstage_tables.get_max_start_time(
+            start_phase, end_stage_key, start_stage_key, modified=modified, context=context
+        )
 
-    def get_initial_stage_id(self, m37_stages, stream):
+    def get_initial_stage_id(self, m37_stages, stream, context):
         m37_check = len(m37_stages) > 0
         initial_stage_id = None
         for plan_sequence_item in self.plan_sequence_items:
             # self.plan_sequence_items.active_index = plan_sequence_item.index
             stage_id = self.process_plan_sequence_item_initial(
-                plan_sequence_item, m37_check, stream
+                plan_sequence_item, m37_check, stream, context
             )
             if stage_id:
                 initial_stage_id = stage_id
         return stream.controller.controller_key, initial_stage_id
 
-    def get_initial_stage_id_ped(self, m37_stages, stream):
+    def get_initial_stage_id_ped(self, m37_stages, stream, context):
         m37_check = len(m37_stages) > 0
         initial_stage_id = None
         for plan_sequence_item in sorted(self.plan_sequence_items, key=lambda x: len(x.p_bits)):
             # self.plan_sequence_items.active_index = plan_sequence_item.index
             stage_id = self.process_plan_sequence_item_initial(
-                plan_sequence_item, m37_check, stream
+                plan_sequence_item, m37_check, stream, context
             )
             if stage_id:
                 initial_stage_id = stage_id
         return stream.controller.controller_key, initial_stage_id
 
-    def process_plan_sequence_item_initial(self, plan_sequence_item, m37_check, stream):
+    def process_plan_sequence_item_initial(self, plan_sequence_item, m37_check, stream, context):
         new_stage_key = None
-        if not stream.active_stage_key:
-            for stage in plan_sequence_item.stages_existing_in_stream(stream):
-                if stage.m37_exists(self.site_id) or not m37_check:
+        active_stage = context.get_active_stage(stream)
+        if not context.get_active_stage_key(stream):
+            for stage in plan_sequence_item.stages_existing_in_stream(stream, context):
+                if stage.m37_exists(self.site_id, context) or not m37_check:
                     new_stage_key = stage.stage_number
                     break
         else:
-            if stream.active_stage.stream_stage_number in plan_sequence_item.stage_numbers:
-                new_stage_key = stream.active_stage.stage_number
+            if active_stage.stream_stage_number in plan_sequence_item.stage_numbers:
+                new_stage_key = active_stage.stage_number
             else:
-                for stage in plan_sequence_item.stages_existing_in_stream(stream):
-                    if stage.m37_exists(self.site_id) or not m37_check:
+                for stage in plan_sequence_item.stages_existing_in_stream(stream, context):
+                    if stage.m37_exists(self.site_id, context) or not m37_check:
                         new_stage_key = stage.stage_number
                         break
         if new_stage_key:
-            stream.active_stage_key = stream.controller.controller_key, new_stage_key
+            context.set_active_stage_key(stream, (stream.controller.controller_key, new_stage_key))
         return new_stage_key
 
-    def get_stage_sequence(self, m37_stages, stream, cycle_time=None):
+    def get_stage_sequence(self, m37_stages, stream, cycle_time=None, *, context):
+        """
+        Function to get the stage sequence of the plan for a stream
+        :param m37_stages: set of stage numbers with M37 data
+        :param stream: Stream
+        :param cycle_time: cycle time, the plan cycle time is used if None
+        :param context: EmulationContext
+        :return: DefaultList of StageSequenceItem
+        """
         if stream.is_pv_px_mode:
-            return self.get_stage_sequence_pv_px(m37_stages, stream, cycle_time)
+            return self.get_stage_sequence_pv_px(m37_stages, stream, cycle_time, context)
         elif stream.controller.is_pedestrian_controller:
-            return self.get_stage_sequence_pedestrian(m37_stages, stream, cycle_time)
+            return self.get_stage_sequence_pedestrian(m37_stages, stream, cycle_time, context)
         else:
-            return self.get_stage_sequence_junction(m37_stages, stream, cycle_time)
+            return self.get_stage_sequence_junction(m37_stages, stream, cycle_time, context)
 
-    def get_stage_sequence_pedestrian(self, m37_stages, stream, cycle_time=None):
+    def get_stage_sequence_pedestrian(self, m37_stages, stream, cycle_time, context):
         stage_sequence = DefaultList(None)
         m37_check = len(m37_stages) > 1
         # set the initial stage number
-        # stream.active_stage_key = self.get_initial_stage_id_ped(m37_stages, stream)
+        # context.set_active_stage_key(stream, self.get_initial_stage_id_ped(m37_stages, stream, context))
         active_stage = self.signal_emulator.stages.get_by_stream_number_and_stage_number(stream.controller_key, stream.stream_number, 1)
-        stream.active_stage_key = active_stage.controller_key, active_stage.stage_number
+        context.set_active_stage_key(stream, (active_stage.controller_key, active_stage.stage_number))
         plan_sequence_items = []
         for psi in self.plan_sequence_items:
             if psi.f_bits == ["F2"]:
@@ -272,7 +253,8 @@ class Plan:
                 previous_stage_sequence_item=previous_stage_sequence_item,
                 m37_check=m37_check,
                 stream=stream,
-                cycle_time=cycle_time
+                cycle_time=cycle_time,
+                context=context,
             )
             if new_stage_sequence_item:
                 if (
@@ -280,18 +262,17 @@ class Plan:
                     and previous_stage_sequence_item.stage.stage_number
                     != new_stage_sequence_item.stage.stage_number
                 ) or not previous_stage_sequence_item:
-                    stream.active_stage_key = (
-                        stream.controller_key,
-                        new_stage_sequence_item.stage.stage_number,
+                    context.set_active_stage_key(
+                        stream, (stream.controller_key, new_stage_sequence_item.stage.stage_number)
                     )
                     stage_sequence.append(new_stage_sequence_item)
         return stage_sequence
 
-    def get_stage_sequence_pv_px(self, m37_stages, stream, cycle_time=None):
+    def get_stage_sequence_pv_px(self, m37_stages, stream, cycle_time, context):
         stage_sequence = DefaultList(None)
         m37_check = len(m37_stages) > 0
         # set the initial stage number
-        stream.active_stage_key = self.get_initial_stage_id_ped(m37_stages, stream)
+        context.set_active_stage_key(stream, self.get_initial_stage_id_ped(m37_stages, stream, context))
         for plan_sequence_item in sorted(self.plan_sequence_items, key=lambda x: len(x.p_bits)):
             previous_stage_sequence_item = stage_sequence[-1]
             new_stage_sequence_item = self.process_plan_sequence_item_pvpx(
@@ -299,7 +280,8 @@ class Plan:
                 previous_stage_sequence_item=previous_stage_sequence_item,
                 m37_check=m37_check,
                 stream=stream,
-                cycle_time=cycle_time
+                cycle_time=cycle_time,
+                context=context,
             )
             if new_stage_sequence_item:
                 if (
@@ -307,19 +289,18 @@ class Plan:
                     and previous_stage_sequence_item.stage.stage_number
                     != new_stage_sequence_item.stage.stage_number
                 ) or not previous_stage_sequence_item:
-                    stream.active_stage_key = (
-                        stream.controller_key,
-                        new_stage_sequence_item.stage.stage_number,
+                    context.set_active_stage_key(
+                        stream, (stream.controller_key, new_stage_sequence_item.stage.stage_number)
                     )
                     stage_sequence.append(new_stage_sequence_item)
         return stage_sequence
 
-    def get_stage_sequence_junction(self, m37_stages, stream, cycle_time):
+    def get_stage_sequence_junction(self, m37_stages, stream, cycle_time, context):
         stage_sequence = DefaultList(None)
         stages_used = set()
         m37_check = len(m37_stages) > 0
         # set the initial stage number
-        stream.active_stage_key = self.get_initial_stage_id(m37_stages, stream)
+        context.set_active_stage_key(stream, self.get_initial_stage_id(m37_stages, stream, context))
         for plan_sequence_item in self.plan_sequence_items:
             # self.plan_sequence_items.active_index = plan_sequence_item.index
             previous_stage_sequence_item = stage_sequence[-1]
@@ -328,7 +309,8 @@ class Plan:
                 previous_stage_sequence_item=previous_stage_sequence_item,
                 m37_check=m37_check,
                 stream=stream,
-                cycle_time=cycle_time
+                cycle_time=cycle_time,
+                context=context,
             )
             if new_stage_sequence_item and new_stage_sequence_item.stage.stage_number not in stages_used:
                 if (
@@ -336,9 +318,8 @@ class Plan:
                     and previous_stage_sequence_item.stage.stage_number
                     != new_stage_sequence_item.stage.stage_number
                 ) or not previous_stage_sequence_item:
-                    stream.active_stage_key = (
-                        stream.controller_key,
-                        new_stage_sequence_item.stage.stage_number,
+                    context.set_active_stage_key(
+                        stream, (stream.controller_key, new_stage_sequence_item.stage.stage_number)
                     )
                     stage_sequence.append(new_stage_sequence_item)
                     stages_used.add(new_stage_sequence_item.stage.stage_number)
@@ -346,7 +327,7 @@ class Plan:
         if len(stage_sequence) == 0:
             # todo check this
             stage = self.signal_emulator.stages.get_by_key(
-                self.get_initial_stage_id(m37_stages, stream)
+                self.get_initial_stage_id(m37_stages, stream, context)
             )
             stage_sequence.append(
                 StageSequenceItem(
@@ -358,7 +339,7 @@ class Plan:
         if m37_check and not m37_stages == set([a.stage.stream_stage_number for a in stage_sequence]):
             self.signal_emulator.logger.warning(
                 f"Stream: {stream.site_number} "
-                f"Time Period: {self.signal_emulator.time_periods.active_period_id} "
+                f"Time Period: {context.time_period_id} "
                 f"Plan stage sequence: {[a.stage.stream_stage_number for a in stage_sequence]} "
                 f"does not match m37 stages: {m37_stages}"
             )
@@ -395,24 +376,31 @@ class Plan:
                         f"prohibited stage move {current_ssi.stage.stage_number} -> {next_ssi.stage.stage_number}"
                     )
     def process_plan_sequence_item_pvpx(
-        self, plan_sequence_item, stream, previous_stage_sequence_item=None, m37_check=False, cycle_time=None
+        self,
+        plan_sequence_item,
+        stream,
+        previous_stage_sequence_item=None,
+        m37_check=False,
+        cycle_time=None,
+        context=None,
     ):
         if cycle_time is None:
             cycle_time = self.cycle_time
-        if stream.active_stage_key[1] is None:
+        if context.get_active_stage_key(stream)[1] is None:
             # should not get here now
             raise ValueError(
                 f"Stream: {stream.controller_key} active stage id should be set before calling this function"
             )
-        new_stage = stream.active_stage
-        if stream.active_stage.stream_stage_number in plan_sequence_item.stage_numbers:
-            new_stage = stream.active_stage
+        active_stage = context.get_active_stage(stream)
+        new_stage = active_stage
+        if active_stage.stream_stage_number in plan_sequence_item.stage_numbers:
+            new_stage = active_stage
         else:
-            for stage in plan_sequence_item.stages_existing_in_stream(stream):  # pass stream
-                if stage.m37_exists(self.site_id) or not m37_check:
+            for stage in plan_sequence_item.stages_existing_in_stream(stream, context):  # pass stream
+                if stage.m37_exists(self.site_id, context) or not m37_check:
                     new_stage = stage
                     break
-        if new_stage.stage_number == stream.active_stage_key[1]:
+        if new_stage.stage_number == active_stage.stage_number:
             return None
 
         if not previous_stage_sequence_item:
@@ -425,13 +413,17 @@ class Plan:
             )
             not_road_green_phase = not_road_green_stage.phases_in_stage[0]
             ped_green_man_time = not_road_green_phase.min_time
-            ig_ped = self.get_interstage_time(road_green_stage, not_road_green_stage, modified=False)
-            ig_traffic = self.get_interstage_time(not_road_green_stage, road_green_stage, modified=False)
-            if not_road_green_stage.m37_exists(self.site_id):
-                m37_not_road_green_time = not_road_green_stage.get_m37(self.site_id).total_time
+            ig_ped = self.get_interstage_time(
+                road_green_stage, not_road_green_stage, modified=False, context=context
+            )
+            ig_traffic = self.get_interstage_time(
+                not_road_green_stage, road_green_stage, modified=False, context=context
+            )
+            if not_road_green_stage.m37_exists(self.site_id, context):
+                m37_not_road_green_time = not_road_green_stage.get_m37(self.site_id, context).total_time
                 effective_stage_call_rate = m37_not_road_green_time / (ig_ped + ig_traffic + ped_green_man_time)
             else:
-                effective_stage_call_rate = self.get_default_ped_call_rate()
+                effective_stage_call_rate = self.get_default_ped_call_rate(context)
         else:
             road_green_stage = self.signal_emulator.stages.get_by_stream_number_and_stage_number(
                 stream.controller_key, stream.stream_number, 1
@@ -441,14 +433,18 @@ class Plan:
             )
             not_road_green_phase = not_road_green_stage.phases_in_stage[0]
             ped_green_man_time = not_road_green_phase.min_time
-            ig_ped = self.get_interstage_time(road_green_stage, not_road_green_stage, modified=False)
-            ig_traffic = self.get_interstage_time(not_road_green_stage, road_green_stage, modified=False)
-            if not_road_green_stage.m37_exists(self.site_id):
-                m37_not_road_green_time = not_road_green_stage.get_m37(self.site_id).total_time
+            ig_ped = self.get_interstage_time(
+                road_green_stage, not_road_green_stage, modified=False, context=context
+            )
+            ig_traffic = self.get_interstage_time(
+                not_road_green_stage, road_green_stage, modified=False, context=context
+            )
+            if not_road_green_stage.m37_exists(self.site_id, context):
+                m37_not_road_green_time = not_road_green_stage.get_m37(self.site_id, context).total_time
                 effective_stage_call_rate = 1
             else:
                 m37_not_road_green_time = ig_ped + ig_traffic + ped_green_man_time
-                effective_stage_call_rate = self.get_default_ped_call_rate()
+                effective_stage_call_rate = self.get_default_ped_call_rate(context)
             adjustment_factor = ig_traffic / (ped_green_man_time + ig_ped + ig_traffic)
             adjustment_seconds = int(adjustment_factor * m37_not_road_green_time)
             stage_length = round((m37_not_road_green_time - adjustment_seconds) * effective_stage_call_rate)
@@ -464,24 +460,31 @@ class Plan:
         )
 
     def process_plan_sequence_item_pedestrian(
-        self, plan_sequence_item, stream, previous_stage_sequence_item=None, m37_check=False, cycle_time=None
+        self,
+        plan_sequence_item,
+        stream,
+        previous_stage_sequence_item=None,
+        m37_check=False,
+        cycle_time=None,
+        context=None,
     ):
         if cycle_time is None:
             cycle_time = self.cycle_time
-        if stream.active_stage_key[1] is None:
+        if context.get_active_stage_key(stream)[1] is None:
             # should not get here now
             raise ValueError(
                 f"Stream: {stream.controller_key} active stage id should be set before calling this function"
             )
-        new_stage = stream.active_stage
-        if stream.active_stage.stream_stage_number in plan_sequence_item.stage_numbers:
-            new_stage = stream.active_stage
+        active_stage = context.get_active_stage(stream)
+        new_stage = active_stage
+        if active_stage.stream_stage_number in plan_sequence_item.stage_numbers:
+            new_stage = active_stage
         else:
-            for stage in plan_sequence_item.stages_existing_in_stream(stream):  # pass stream
-                if stage.m37_exists(self.site_id) or not m37_check:
+            for stage in plan_sequence_item.stages_existing_in_stream(stream, context):  # pass stream
+                if stage.m37_exists(self.site_id, context) or not m37_check:
                     new_stage = stage
                     break
-        if new_stage.stage_number == stream.active_stage_key[1]:
+        if new_stage.stage_number == active_stage.stage_number:
             return None
 
         if not previous_stage_sequence_item:
@@ -494,13 +497,13 @@ class Plan:
             )
             not_road_green_phase = not_road_green_stage.phases_in_stage[0]
             ped_green_man_time = not_road_green_phase.min_time
-            ig_ped = self.get_interstage_time(road_green_stage, not_road_green_stage)
-            ig_traffic = self.get_interstage_time(not_road_green_stage, road_green_stage)
-            if not_road_green_stage.m37_exists(self.site_id):
-                m37_not_road_green_time = not_road_green_stage.get_m37(self.site_id).total_time
+            ig_ped = self.get_interstage_time(road_green_stage, not_road_green_stage, context=context)
+            ig_traffic = self.get_interstage_time(not_road_green_stage, road_green_stage, context=context)
+            if not_road_green_stage.m37_exists(self.site_id, context):
+                m37_not_road_green_time = not_road_green_stage.get_m37(self.site_id, context).total_time
                 effective_stage_call_rate = m37_not_road_green_time / (ig_ped + ped_green_man_time)
             else:
-                effective_stage_call_rate = self.get_default_ped_call_rate()
+                effective_stage_call_rate = self.get_default_ped_call_rate(context)
         else:
             road_green_stage = self.signal_emulator.stages.get_by_stream_number_and_stage_number(
                 stream.controller_key, stream.stream_number, 1
@@ -510,14 +513,14 @@ class Plan:
             )
             not_road_green_phase = not_road_green_stage.phases_in_stage[0]
             ped_green_man_time = not_road_green_phase.min_time
-            ig_ped = self.get_interstage_time(road_green_stage, not_road_green_stage)
-            ig_traffic = self.get_interstage_time(not_road_green_stage, road_green_stage)
-            if not_road_green_stage.m37_exists(self.site_id):
-                m37_not_road_green_time = not_road_green_stage.get_m37(self.site_id).total_time
+            ig_ped = self.get_interstage_time(road_green_stage, not_road_green_stage, context=context)
+            ig_traffic = self.get_interstage_time(not_road_green_stage, road_green_stage, context=context)
+            if not_road_green_stage.m37_exists(self.site_id, context):
+                m37_not_road_green_time = not_road_green_stage.get_m37(self.site_id, context).total_time
                 effective_stage_call_rate = 1
             else:
                 m37_not_road_green_time = ig_ped  + ped_green_man_time
-                effective_stage_call_rate = self.get_default_ped_call_rate()
+                effective_stage_call_rate = self.get_default_ped_call_rate(context)
             stage_length = round(m37_not_road_green_time * effective_stage_call_rate)
             if new_stage.stream_stage_number==1:
                 pulse_time = previous_stage_sequence_item.pulse_time + stage_length
@@ -531,32 +534,39 @@ class Plan:
         )
 
     def process_plan_sequence_item(
-        self, plan_sequence_item, stream, previous_stage_sequence_item=None, m37_check=False, cycle_time=None
+        self,
+        plan_sequence_item,
+        stream,
+        previous_stage_sequence_item=None,
+        m37_check=False,
+        cycle_time=None,
+        context=None,
     ):
         if cycle_time is None:
             cycle_time = self.cycle_time
-        if stream.active_stage_key[1] is None:
+        if context.get_active_stage_key(stream)[1] is None:
             # should not get here now
             raise ValueError(
                 f"Stream: {stream.controller_key} active stage id should be set before calling this function"
             )
 
-        new_stage = stream.active_stage
-        if stream.active_stage.stream_stage_number in plan_sequence_item.stage_numbers:
-            new_stage = stream.active_stage
+        active_stage = context.get_active_stage(stream)
+        new_stage = active_stage
+        if active_stage.stream_stage_number in plan_sequence_item.stage_numbers:
+            new_stage = active_stage
         else:
-            for stage in plan_sequence_item.stages_existing_in_stream(stream):  # pass stream
-                if stage.m37_exists(self.site_id) or not m37_check:
+            for stage in plan_sequence_item.stages_existing_in_stream(stream, context):  # pass stream
+                if stage.m37_exists(self.site_id, context) or not m37_check:
                     new_stage = stage
                     break
 
-        if new_stage.stage_number == stream.active_stage_key[1]:
+        if new_stage.stage_number == active_stage.stage_number:
             return None
         if m37_check:
             if previous_stage_sequence_item:
                 pulse_time = (
                     previous_stage_sequence_item.pulse_time
-                    + previous_stage_sequence_item.stage.get_m37(self.site_id).total_time
+                    + previous_stage_sequence_item.stage.get_m37(self.site_id, context).total_time
                 )
             else:
                 pulse_time = plan_sequence_item.pulse_time
@@ -573,7 +583,8 @@ class Plan:
                 controller_key=stream.controller.controller_key,
                 end_phase_key="B",
                 start_phase_key="A",
-                modified=True
+                modified=True,
+                context=context,
             )
             if new_stage.stage_number == 1:
                 pulse_time -= ped_stage_trailing_intergreen_time
@@ -589,7 +600,8 @@ class Plan:
         else:
             return this_pulse_time + cycle_time - previous_pulse_time
 
-    def get_m37_stage_numbers(self, site_number):
+    def get_m37_stage_numbers(self, site_number, context=None):
+        time_period_id = self.signal_emulator.time_periods.get_period_id(context)
         m37_stages = set()
         for m37_stage_to_stage_number in M37StageToStageNumber:
             if (
@@ -597,14 +609,14 @@ class Plan:
                     (
                         site_number,
                         m37_stage_to_stage_number.name,
-                        self.signal_emulator.periods.active_period_id,
+                        time_period_id,
                     )
                 )
                 and self.signal_emulator.m37s.get_by_key(
                     (
                         site_number,
                         m37_stage_to_stage_number.name,
-                        self.signal_emulator.periods.active_period_id,
+                        time_period_id,
                     )
                 ).total_time
                 > 0
@@ -612,7 +624,8 @@ class Plan:
                 m37_stages.add(m37_stage_to_stage_number.value)
         return m37_stages
 
-    def get_m37_stage_bits(self, site_number):
+    def get_m37_stage_bits(self, site_number, context=None):
+        time_period_id = self.signal_emulator.time_periods.get_period_id(context)
         m37_stage_bits = []
         for m37_stage_to_stage_number in M37StageToStageNumber:
             if (
@@ -620,14 +633,14 @@ class Plan:
                     (
                         site_number,
                         m37_stage_to_stage_number.name,
-                        self.signal_emulator.periods.active_period_id,
+                        time_period_id,
                     )
                 )
                 and self.signal_emulator.m37s.get_by_key(
                     (
                         site_number,
                         m37_stage_to_stage_number.name,
-                        self.signal_emulator.periods.active_period_id,
+                        time_period_id,
                     )
                 ).total_time
                 > 0
@@ -687,9 +700,9 @@ class Plan:
             stage_nos.add(stage_sequence_item.stage.stage_number)
         return output_stage_sequence
 
-    def get_default_ped_call_rate(self):
+    def get_default_ped_call_rate(self, context=None):
         return self.signal_emulator.plans.DEFAULT_PED_STAGE_CALL_RATE.get(
-            self.signal_emulator.time_periods.active_period_id, 1.0
+            self.signal_emulator.time_periods.get_period_id(context), 1.0
         )
 
 
@@ -697,6 +710,7 @@ class Plans(BaseCollection):
     TABLE_NAME = "plans"
     ITEM_CLASS = Plan
     WRITE_TO_DATABASE = True
+    PARTITION_FIELD = "site_id"
     DEFAULT_PED_STAGE_CALL_RATE = {
         "AM": 0.5,
         "OP": 0.5,
@@ -709,19 +723,6 @@ class Plans(BaseCollection):
         self.data_by_name = {}
         for plan in self:
             self.data_by_name[plan.get_name_key()] = plan
-        self.active_plan_id = None
-
-    @property
-    def active_plan_id(self):
-        return self._active_plan_id
-
-    @active_plan_id.setter
-    def active_plan_id(self, value):
-        self._active_plan_id = value
-
-    @property
-    def active_plan(self):
-        return self.data[self._active_plan_id]
 
     @classmethod
     def init_from_pln_path(cls, plan_file_path, signal_emulator=None):
@@ -936,7 +937,8 @@ class PlanSequenceItem:
     #         )
     #     ]
 
-    def stages_existing_in_stream(self, stream):
+    def stages_existing_in_stream(self, stream, context=None):
+        active_stage = context.get_active_stage(stream) if context else None
         existing_stages = [
             stage
             for stage in self.stages
@@ -945,9 +947,9 @@ class PlanSequenceItem:
             )
         ]
         existing_sorted = sorted(existing_stages, key=lambda x: x.stage_number)
-        if stream.active_stage:
-            low = [a for a in existing_sorted if a.stage_number < stream.active_stage.stage_number]
-            high = [a for a in existing_sorted if a.stage_number > stream.active_stage.stage_number]
+        if active_stage:
+            low = [a for a in existing_sorted if a.stage_number < active_stage.stage_number]
+            high = [a for a in existing_sorted if a.stage_number > active_stage.stage_number]
             existing_stages_cyclic = high + low
         else:
             existing_stages_cyclic = existing_stages
@@ -958,6 +960,7 @@ class PlanSequenceItems(BaseCollection):
     TABLE_NAME = "plan_sequence_items"
     ITEM_CLASS = PlanSequenceItem
     WRITE_TO_DATABASE = True
+    PARTITION_FIELD = "site_id"
 
     def __init__(self, item_data, signal_emulator):
         super().__init__(item_data=item_data, signal_emulator=signal_emulator)
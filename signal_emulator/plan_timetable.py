@@ -70,6 +70,7 @@ class PlanTimetables(BaseCollection):
     TABLE_NAME = "plan_timetables"
     ITEM_CLASS = PlanTimetable
     WRITE_TO_DATABASE = True
+    PARTITION_FIELD = "site_number"
 
     def __init__(self, signal_emulator, pja_directory_path=None):
         super().__init__(item_data=[], signal_emulator=signal_emulator)
@@ -7,6 +7,8 @@ from pathlib import Path
 import pandas as pd
 
 from signal_emulator.controller import BaseCollection, BaseItem
+from signal_emulator.parallel_exporter import ParallelExporter
+from signal_emulator.utilities.utility_functions import text_to_file
 
 
 @dataclass(eq=False)
@@ -22,6 +24,13 @@ class PhaseToSaturnTurn:
     def get_key(self):
         return self.controller_key, self.phase_ref, self.saturn_b_node, self.turn
 
+    @property
+    def signal_controller_number(self):
+        parts = self.controller_key.split("/")
+        if parts[0][0].isalpha():
+            parts[0] = parts[0][1:]
+        return int(parts[0]) * 1000 + int(parts[1])
+
 
 class PhaseToSaturnTurns(BaseCollection):
     ITEM_CLASS = PhaseToSaturnTurn
@@ -29,6 +38,9 @@ class PhaseToSaturnTurns(BaseCollection):
     WRITE_TO_DATABASE = True
 
     def __init__(self, signal_emulator, saturn_lookup_file=None):
+        # signal controller number to SATURN b-node to phase ref to dict of key to PhaseToSaturnTurn. Created before
+        # the base constructor, which indexes the initial items
+        self.data_by_signal_controller_number = {}
         super().__init__(item_data=[], signal_emulator=signal_emulator)
         self.signal_emulator = signal_emulator
         if saturn_lookup_file:
@@ -67,6 +79,44 @@ class PhaseToSaturnTurns(BaseCollection):
             for row in csvreader:
                 self.add_item(row, signal_emulator=self.signal_emulator)
 
+    def add_to_index(self, item):
+        self.data_by_signal_controller_number.setdefault(item.signal_controller_number, {}).setdefault(
+            item.saturn_b_node, {}
+        ).setdefault(item.phase_ref, {})[item.get_key()] = item
+
+    def remove_from_index(self, item):
+        saturn_b_nodes = self.data_by_signal_controller_number[item.signal_controller_number]
+        phase_refs = saturn_b_nodes[item.saturn_b_node]
+        del phase_refs[item.phase_ref][item.get_key()]
+        # empty levels are removed, so b-nodes and phases are in the order they were first added
+        if not phase_refs[item.phase_ref]:
+            del phase_refs[item.phase_ref]
+        if not phase_refs:
+            del saturn_b_nodes[item.saturn_b_node]
+        if not saturn_b_nodes:
+            del self.data_by_signal_controller_number[item.signal_controller_number]
+
+    def get_saturn_b_nodes(self, signal_controller_number):
+        """
+        Function to get the distinct SATURN b-nodes mapped to a signal controller
+        :param signal_controller_number: int signal controller number
+        :return: list of SATURN b-nodes
+        """
+        return list(self.data_by_signal_controller_number.get(signal_controller_number, {}))
+
+    def get_saturn_turns(self, signal_controller_number, saturn_b_node):
+        """
+        Function to get the SATURN turns of each phase of a signal controller at a SATURN b-node
+        :param signal_controller_number: int signal controller number
+        :param saturn_b_node: SATURN b-node
+        :return: dict of phase ref to list of [a-node, c-node] turns
+        """
+        phase_refs = self.data_by_signal_controller_number.get(signal_controller_number, {}).get(saturn_b_node, {})
+        return {
+            phase_ref: [[item.saturn_a_node, item.saturn_c_node] for item in items.values()]
+            for phase_ref, items in phase_refs.items()
+        }
+
     def get_saturn_b_node(self, controller_number):
         for key, value in self.signal_emulator.phase_to_saturn_turns.data.items():
             if int(key[0].split("/")[1]) == controller_number:
@@ -87,170 +137,198 @@ class SaturnCollection(BaseCollection):
         self.signal_emulator = signal_emulator
         self.output_directory = output_directory
 
-    def export_to_rgs_files(self, time_periods=None):
-        if time_periods is None:
-            time_periods = self.signal_emulator.time_periods.get_all()
-        for time_period in time_periods:
-            self.export_to_rgs_file(time_period)
+    def export_to_rgs_files(self, time_periods=None, processes=None):
+        """
+        Method to export an RGS file for each time period. Controller sections are rendered in a process pool if
+        processes is greater than 1, the files are identical to a serial export
+        :param time_periods: list of TimePeriod, all time periods if None
+        :param processes: number of worker processes, defaults to the SignalEmulator processes
+        :return: None
+        """
+        ParallelExporter(self.signal_emulator, processes).export_rgs_files(
+            time_periods, collection_name=self.TABLE_NAME
+        )
 
     def export_to_rgs_file(self, time_period, output_path=None):
         if not output_path:
-            output_path = os.path.join(
-                self.output_directory,
-                f"LoHAMP6_SignalGroupData_{self.OUTPUT_VERSON}_{time_period.name}.rgs",
-            )
+            output_path = self.get_rgs_output_path(time_period.name)
         Path(output_path).parent.mkdir(exist_ok=True, parents=True)
-        with open(output_path, "w") as rgs_file:
-            # Print the SATURN file header
-            rgs_file.write(self.OUTPUT_HEADER)
-
-            # Get a list of all distinct controllers for time period
-            controllers = []
-            for item in self:
-                if item.time_period_id == time_period.name:
-                    if item.signal_controller_number not in controllers:
-                        controllers.append(item.signal_controller_number)
-
-            # Iterate all distinct controllers for time period
-            for controller_number in controllers:
-                # Identify the cycle time of the current controller
-                cycle_time = self._get_cycle_time(controller_number, time_period.name)
-                # Get all distinct node-b's for the current controller and iterate (each will have it's own SATURN rec-1)
-                node_bs = self._get_controller_saturn_nodes(controller_number)
-                for node_b in node_bs:
-                    # Iterate through cycle period second-by-second
-                    cycle_seconds_phases = []
-                    for t in range(0, cycle_time):
-                        # For each second, check if a phase is set for current t
-                        # If phase is set, add it to list for current second
-                        phases_in_second = self._get_phases_in_second(
-                            controller_number, node_b, time_period, t
-                        )
-                        cycle_seconds_phases.append(phases_in_second)
-
-                    # Adjust list where phases wrap-around from end to start
-                    cycle_seconds_phases = self._post_process_cycle_seconds_phases(
-                        cycle_seconds_phases
-                    )
+        text_to_file(self.OUTPUT_HEADER + self.render_rgs_controllers(time_period.name), output_path)
+        self.signal_emulator.logger.info(
+            f"SATURN {self.SATURN_TABLE_NAME} output to net file: {output_path}"
+        )
 
-                    # To store phases assoicated with previous second
-                    last_phases_in_second = []
-                    # To store last non-intergreen phases
-                    last_non_intergreen = []
-                    # To store list of phases being constructed to add to SATURN type-3 record
-                    rec_3_list = []
-                    # Stage duration
-                    stage_duration = 0
-                    # The initial intergreen (if present), summed to final intergreen
-                    initial_intergreen = None
-                    # Last intergreen, ready to add to next SATURN type-3 record
-                    intergreen = 0
+    def get_rgs_output_path(self, time_period_id):
+        return os.path.join(
+            self.output_directory,
+            f"LoHAMP6_SignalGroupData_{self.OUTPUT_VERSON}_{time_period_id}.rgs",
+        )
 
-                    # Loop through all phases per second
-                    for i, phases_in_second in enumerate(cycle_seconds_phases):
-                        # Determine if a new SATURN type-3 record should be built
-                        if (
-                            # Current second's phases are different from previous second
-                            phases_in_second != last_phases_in_second
-                            # and we have passed at least one second with phases set
-                            and last_non_intergreen != []
-                            # and we are not currently in an intergreen (need to reach next phase to determine full intergreen period)
-                            and phases_in_second != []
-                            # or it is the last second
-                        ) or i == len(cycle_seconds_phases) - 1:
-                            if i == len(cycle_seconds_phases) - 1:
-                                # If it is the last record, add the initial pre-phase intergreen time
-                                intergreen += (
-                                    initial_intergreen
-                                    if initial_intergreen is not None
-                                    else 0
-                                )
-                                # If we finish on an intergreen, add an extra second as it hasn't yet been counted
-                                intergreen += 1 if phases_in_second == [] else 0
-                                # If we finish on a stage, add an extra second as it hasn't yet been counted
-                                if phases_in_second != []:
-                                    stage_duration += 1
-                            # Append attributes to list of controllers SATURN type-3 record
-                            if rec_3_list != [] and rec_3_list[-1][1] != 0:
-                                # Test if previous stage had matching phases with non-zero intergreen (to mark previous intergreen negative)
-                                if self._test_stages_negative_intergreen(
-                                    rec_3_list[-1], last_non_intergreen
-                                ):
-                                    rec_3_list[-1][1] = 0 - rec_3_list[-1][1]
-                                # Test if only a single stage (e.g zebra crossing), so mark current intergreen negative
-                                if self._test_zebra_negative_intergreen(
-                                    cycle_seconds_phases
-                                ):
-                                    intergreen = 0 - intergreen
-                            rec_3_list.append(
-                                [stage_duration, intergreen, last_non_intergreen]
-                            )
-
-                            # Reset stage duration and intergreen counters after identifying a new record
-                            stage_duration = 0
-                            intergreen = 0
-
-                        # Keep track of the last second's phases
-                        last_phases_in_second = phases_in_second
-
-                        # Keep track of the last non-intergreen record and counters (we write this when the current record changes)
-                        if phases_in_second != []:
-                            last_non_intergreen = phases_in_second
-                            # Stage duration counter can be increased
-                            stage_duration += 1
-                            if initial_intergreen is None:
-                                # Store first intergreen to use on last phase
-                                initial_intergreen = intergreen
-                                intergreen = 0
-
-                        if phases_in_second == []:
-                            # Intergreen counter can be incremented
-                            intergreen += 1
-
-                    # Print SATURN header
-                    rgs_file.write(
-                        "* LoHAM P6 Signal. UTC:" + str(controller_number) + "\n"
-                    )
+    def get_rgs_controller_numbers(self, time_period_id):
+        """
+        Function to get the distinct controllers of a time period, in the order they are exported
+        :param time_period_id: time period id
+        :return: list of signal controller numbers
+        """
+        return list(
+            dict.fromkeys(item.signal_controller_number for item in self if item.time_period_id == time_period_id)
+        )
 
-                    # Process SATURN lines
-                    saturn_rec1 = self._format_saturn_line(
-                        [
-                            node_b,
-                            "",
-                            3,
-                            len(rec_3_list),
-                            initial_intergreen if initial_intergreen is not None else 0,
-                            cycle_time,
-                        ],
-                        self.SATURN_TYPE1_FIELD_LENS,
-                    )
+    def render_rgs_controllers(self, time_period_id, controller_numbers=None):
+        """
+        Function to render the RGS sections of the controllers of a time period
+        :param time_period_id: time period id
+        :param controller_numbers: list of signal controller numbers to render, all controllers if None
+        :return: str RGS sections, in the order of get_rgs_controller_numbers
+        """
+        controller_numbers = set(controller_numbers) if controller_numbers is not None else None
+        # Group the signal groups of the time period by controller, in order of first appearance
+        controller_signal_groups = {}
+        for item in self:
+            if item.time_period_id == time_period_id and (
+                controller_numbers is None or item.signal_controller_number in controller_numbers
+            ):
+                controller_signal_groups.setdefault(item.signal_controller_number, []).append(item)
+        rgs_lines = []
+
+        # Iterate all distinct controllers for time period
+        for controller_number, signal_groups in controller_signal_groups.items():
+            # Identify the cycle time of the current controller
+            cycle_time = self._get_cycle_time(controller_number, time_period_id)
+            # Iterate the distinct node-b's for the current controller (each will have it's own SATURN rec-1)
+            for node_b in self.signal_emulator.phase_to_saturn_turns.get_saturn_b_nodes(controller_number):
+                # Runs of seconds with the same SATURN turns, swept from the signal group green intervals
+                phase_runs = self._get_phase_runs(
+                    signal_groups,
+                    self.signal_emulator.phase_to_saturn_turns.get_saturn_turns(controller_number, node_b),
+                    cycle_time,
+                )
+                rec_3_list, initial_intergreen = self._get_stage_records(phase_runs)
+
+                # Print SATURN header
+                rgs_lines.append("* LoHAM P6 Signal. UTC:" + str(controller_number) + "\n")
+
+                # Process SATURN lines
+                saturn_rec1 = self._format_saturn_line(
+                    [
+                        node_b,
+                        "",
+                        3,
+                        len(rec_3_list),
+                        initial_intergreen if initial_intergreen is not None else 0,
+                        cycle_time,
+                    ],
+                    self.SATURN_TYPE1_FIELD_LENS,
+                )
 
-                    # Print SATURN type-1 record
-                    rgs_file.write(saturn_rec1 + "\n")
-                    # Print SATURN type-3 records
-                    for stage in rec_3_list:
-                        saturn_type3_field_lens = [5, 5, 5, 5, 5]
-                        for n in range(0, len(stage[2]) * 2):
-                            saturn_type3_field_lens.append(5)
-                        rgs_file.write(
-                            self._break_saturn_string(
-                                self._format_saturn_line(
-                                    ["", "", stage[0], stage[1], len(stage[2]) * 2]
-                                    + [
-                                        item for sublist in stage[2] for item in sublist
-                                    ],
-                                    saturn_type3_field_lens,
-                                ),
-                                75,
-                                25,
-                            )
-                            + "\n"
+                # Print SATURN type-1 record
+                rgs_lines.append(saturn_rec1 + "\n")
+                # Print SATURN type-3 records
+                for stage in rec_3_list:
+                    saturn_type3_field_lens = [5, 5, 5, 5, 5]
+                    for n in range(0, len(stage[2]) * 2):
+                        saturn_type3_field_lens.append(5)
+                    rgs_lines.append(
+                        self._break_saturn_string(
+                            self._format_saturn_line(
+                                ["", "", stage[0], stage[1], len(stage[2]) * 2]
+                                + [item for sublist in stage[2] for item in sublist],
+                                saturn_type3_field_lens,
+                            ),
+                            75,
+                            25,
                         )
-                    rgs_file.write("\n")
-
-        self.signal_emulator.logger.info(
-            f"SATURN {self.SATURN_TABLE_NAME} output to net file: {output_path}"
-        )
+                        + "\n"
+                    )
+                rgs_lines.append("\n")
+        return "".join(rgs_lines)
+
+    def _get_stage_records(self, phase_runs):
+        """
+        Function to build the SATURN type-3 stage records of a b-node. Within a run every second has the same phases,
+        so a new record can only start at the first second of a run, or at the last second of the cycle
+        :param phase_runs: list of [phases, number of seconds] runs covering the cycle
+        :return: tuple of list of [stage duration, intergreen, phases] records and the initial intergreen
+        """
+        is_single_stage = self._test_zebra_negative_intergreen([phases for phases, _ in phase_runs])
+        # To store phases associated with previous second
+        last_phases_in_second = []
+        # To store last non-intergreen phases
+        last_non_intergreen = []
+        # To store list of phases being constructed to add to SATURN type-3 record
+        rec_3_list = []
+        # Stage duration
+        stage_duration = 0
+        # The initial intergreen (if present), summed to final intergreen
+        initial_intergreen = None
+        # Last intergreen, ready to add to next SATURN type-3 record
+        intergreen = 0
+
+        for phases_in_second, num_seconds, is_last_second in self._get_phase_run_steps(phase_runs):
+            # Determine if a new SATURN type-3 record should be built
+            if (
+                # Current second's phases are different from previous second
+                phases_in_second != last_phases_in_second
+                # and we have passed at least one second with phases set
+                and last_non_intergreen != []
+                # and we are not currently in an intergreen (need to reach next phase to determine full intergreen period)
+                and phases_in_second != []
+                # or it is the last second
+            ) or is_last_second:
+                if is_last_second:
+                    # If it is the last record, add the initial pre-phase intergreen time
+                    intergreen += initial_intergreen if initial_intergreen is not None else 0
+                    # If we finish on an intergreen, add an extra second as it hasn't yet been counted
+                    intergreen += 1 if phases_in_second == [] else 0
+                    # If we finish on a stage, add an extra second as it hasn't yet been counted
+                    if phases_in_second != []:
+                        stage_duration += 1
+                # Append attributes to list of controllers SATURN type-3 record
+                if rec_3_list != [] and rec_3_list[-1][1] != 0:
+                    # Test if previous stage had matching phases with non-zero intergreen (to mark previous intergreen negative)
+                    if self._test_stages_negative_intergreen(rec_3_list[-1], last_non_intergreen):
+                        rec_3_list[-1][1] = 0 - rec_3_list[-1][1]
+                    # Test if only a single stage (e.g zebra crossing), so mark current intergreen negative
+                    if is_single_stage:
+                        intergreen = 0 - intergreen
+                rec_3_list.append([stage_duration, intergreen, last_non_intergreen])
+
+                # Reset stage duration and intergreen counters after identifying a new record
+                stage_duration = 0
+                intergreen = 0
+
+            # Keep track of the last second's phases
+            last_phases_in_second = phases_in_second
+
+            # Keep track of the last non-intergreen record and counters (we write this when the current record changes)
+            if phases_in_second != []:
+                last_non_intergreen = phases_in_second
+                # Stage duration counter can be increased
+                stage_duration += num_seconds
+                if initial_intergreen is None:
+                    # Store first intergreen to use on last phase
+                    initial_intergreen = intergreen
+                    intergreen = 0
+            else:
+                # Intergreen counter can be incremented
+                intergreen += num_seconds
+        return rec_3_list, initial_intergreen
+
+    @staticmethod
+    def _get_phase_run_steps(phase_runs):
+        """
+        Generator of the runs of seconds as steps of seconds with the same phases, the last second of the cycle is
+        a separate step
+        :param phase_runs: list of [phases, number of seconds] runs covering the cycle
+        :return: tuple of phases, number of seconds and bool, the step is the last second of the cycle
+        """
+        for run_index, (phases, num_seconds) in enumerate(phase_runs):
+            if run_index < len(phase_runs) - 1:
+                yield phases, num_seconds, False
+            else:
+                if num_seconds > 1:
+                    yield phases, num_seconds - 1, False
+                yield phases, 1, True
 
     # Test if a negative intergreen should be applied due to matching phases between stages and non-zero intergreen
     def _test_stages_negative_intergreen(self, prev_rec, nodes_list_b):
@@ -294,80 +372,66 @@ class SaturnCollection(BaseCollection):
             formatted_saturn_line += str(fields[i]).rjust(field_len[i])
         return formatted_saturn_line
 
-    # Retrieve the VISUM calculated controller time period
+    # Retrieve the VISUM calculated controller cycle time for a time period
     def _get_cycle_time(self, controller_number, time_period):
-        for key, value in self.signal_emulator.visum_signal_controllers.data.items():
-            if value.signal_controller_number == controller_number: # and key[1] == time_period:
-                if time_period == "AM":
-                    return value.cycle_time_am
-                elif time_period == "OP":
-                    return value.cycle_time_op
-                elif time_period == "PM":
-                    return value.cycle_time_pm
-
-    # Test if a a given phase name/controller/node-b exists in the SATURN node mapping
-    def _test_in_database(self, controller_number, node_b, phase_name):
-        saturn_in_phase = []
-        for key in self.signal_emulator.phase_to_saturn_turns.data.keys():
-            if (
-                int(key[0].replace("/","")) == controller_number
-                and key[2] == node_b
-                and key[1] == phase_name
-            ):
-                record = self.signal_emulator.phase_to_saturn_turns.data[key]
-                saturn_in_phase.append([record.saturn_a_node, record.saturn_c_node])
-        if saturn_in_phase == []:
+        value = self.signal_emulator.visum_signal_controllers.get_by_signal_controller_number(controller_number)
+        if value is None:
             return None
-        else:
-            return saturn_in_phase
-
-    # Get mapped distinct SATURN b-nodes for a given controller
-    def _get_controller_saturn_nodes(self, controller_number):
-        nodes = []
-        for key in self.signal_emulator.phase_to_saturn_turns.data.keys():
-            if int(key[0].replace("/","")) == controller_number:
-                record = self.signal_emulator.phase_to_saturn_turns.data[key]
-                if record.saturn_b_node not in nodes:
-                    nodes.append(record.saturn_b_node)
-        return nodes
-
-    # Identify what SATURN phases occur and exist for a given second of a controller/b-node time period
-    def _get_phases_in_second(self, controller_number, node_b, time_period, t):
-        phases_in_second = []
-        for item in self:
-            if (
-                item.time_period_id == time_period.name
-                and item.signal_controller_number == controller_number
-                and (
-                    (
-                        item.green_time_start < item.green_time_end
-                        and item.green_time_start <= t
-                        and item.green_time_end > t
-                    )
-                    or (
-                        item.green_time_start > item.green_time_end
-                        and (item.green_time_start <= t or item.green_time_end > t)
-                    )
-                )
-            ):
-                is_in_database = self._test_in_database(
-                    controller_number, node_b, item.phase_name
-                )
-                if is_in_database is not None:
-                    phases_in_second += is_in_database
-        return phases_in_second
-
-    # Resolve issues relating to the layout of phases within the stages cycle time
-    def _post_process_cycle_seconds_phases(self, cycle_seconds_phases):
-        # If a phase has a start_time > start_time, it will wrap around, resolve this
-        while (
-            cycle_seconds_phases[0] != []
-            and cycle_seconds_phases[0] == cycle_seconds_phases[-1]
-            and any(x != cycle_seconds_phases[0] for x in cycle_seconds_phases)
-        ):
-            element = cycle_seconds_phases.pop(0)
-            cycle_seconds_phases.append(element)
-        return cycle_seconds_phases
+        if time_period == "AM":
+            return value.cycle_time_am
+        elif time_period == "OP":
+            return value.cycle_time_op
+        elif time_period == "PM":
+            return value.cycle_time_pm
+
+    @staticmethod
+    def _get_phase_runs(signal_groups, phase_turns, cycle_time):
+        """
+        Function to get the mapped SATURN turns with green in each second of the cycle, as runs of seconds with the
+        same turns. The green intervals of the signal groups are swept as start and end events, a signal group with
+        a start time after its end time wraps around the end of the cycle
+        :param signal_groups: list of SaturnSignalGroup of a controller and time period
+        :param phase_turns: dict of phase name to list of [a-node, c-node] turns of a b-node
+        :param cycle_time: cycle time in seconds
+        :return: list of [turns, number of seconds] runs covering the cycle, adjacent runs have different turns
+        """
+        events = {0: ([], []), cycle_time: ([], [])}
+        for group_index, signal_group in enumerate(signal_groups):
+            if signal_group.phase_name not in phase_turns:
+                continue
+            start, end = signal_group.green_time_start, signal_group.green_time_end
+            if start < end:
+                green_intervals = [(start, end)]
+            elif start > end:
+                green_intervals = [(start, cycle_time), (0, end)]
+            else:
+                green_intervals = []
+            for interval_start, interval_end in green_intervals:
+                interval_start, interval_end = max(interval_start, 0), min(interval_end, cycle_time)
+                if interval_start < interval_end:
+                    events.setdefault(interval_start, ([], []))[0].append(group_index)
+                    events.setdefault(interval_end, ([], []))[1].append(group_index)
+        event_times = sorted(events)
+        active_group_indices = set()
+        phase_runs = []
+        for event_time, next_event_time in zip(event_times, event_times[1:]):
+            group_starts, group_ends = events[event_time]
+            active_group_indices.difference_update(group_ends)
+            active_group_indices.update(group_starts)
+            # turns are in signal group order, as the phases of each second were
+            phases = [
+                turn
+                for group_index in sorted(active_group_indices)
+                for turn in phase_turns[signal_groups[group_index].phase_name]
+            ]
+            if phase_runs and phase_runs[-1][0] == phases:
+                phase_runs[-1][1] += next_event_time - event_time
+            else:
+                phase_runs.append([phases, next_event_time - event_time])
+        # If a stage wraps around from the end to the start of the cycle, move its start to the end
+        if len(phase_runs) > 1 and phase_runs[0][0] != [] and phase_runs[0][0] == phase_runs[-1][0]:
+            phase_runs[-1][1] += phase_runs.pop(0)[1]
+        return phase_runs
 
 
 @dataclass(eq=False)
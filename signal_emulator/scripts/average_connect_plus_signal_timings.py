@@ -1,12 +1,14 @@
 import glob
 import os
 from datetime import datetime
+from itertools import chain, islice, repeat
 from pathlib import Path
 
 import pandas as pd
 
 from signal_emulator.time_period import TimePeriods
-from signal_emulator.utilities.utility_functions import load_json_to_dict
+from signal_emulator.utilities.log_file_reader import iter_log_file_lines, open_log_file
+from signal_emulator.utilities.utility_functions import load_json_to_dict, round_preserving_row_totals
 
 
 class ConnectPlusTimingsProcessor:
@@ -33,12 +35,13 @@ class ConnectPlusTimingsProcessor:
         file_data = []
         for timings_file_path in self.timings_directory_iterator(connect_plus_directory):
             datetime_obj = self.get_datetime_from_file_path(timings_file_path)
-            this_timings_df = pd.read_fwf(
-                timings_file_path,
-                colspecs=self.COLUMN_LIMITS,
-                skiprows=self.HEADER_ROWS,
-                names=self.COLUMN_NAMES,
-            )
+            with open_log_file(timings_file_path) as timings_file:
+                this_timings_df = pd.read_fwf(
+                    timings_file,
+                    colspecs=self.COLUMN_LIMITS,
+                    skiprows=self.HEADER_ROWS,
+                    names=self.COLUMN_NAMES,
+                )
             this_timings_df = this_timings_df.dropna()
             node_id, site_id = self.get_controller_key_from_timings_file(timings_file_path)
             file_data.append([os.path.basename(timings_file_path), node_id, site_id, datetime_obj, len(this_timings_df.index)])
@@ -77,12 +80,13 @@ class ConnectPlusTimingsProcessor:
         node_id, site_id = self.get_controller_key_from_timings_file(timings_file_path)
         datetime_obj = self.get_datetime_from_file_path(timings_file_path)
         num_stages = self.get_num_stages_from_file_path(timings_file_path)
-        this_timings_df = pd.read_fwf(
-            timings_file_path,
-            colspecs=getattr(self, f"COLUMN_LIMITS_{num_stages}"),
-            skiprows=self.HEADER_ROWS,
-            names=getattr(self, f"COLUMN_NAMES_{num_stages}"),
-        )
+        with open_log_file(timings_file_path) as timings_file:
+            this_timings_df = pd.read_fwf(
+                timings_file,
+                colspecs=getattr(self, f"COLUMN_LIMITS_{num_stages}"),
+                skiprows=self.HEADER_ROWS,
+                names=getattr(self, f"COLUMN_NAMES_{num_stages}"),
+            )
         this_timings_df["node_id"] = node_id
         this_timings_df["site_id"] = site_id
 
@@ -112,9 +116,7 @@ class ConnectPlusTimingsProcessor:
 
     @staticmethod
     def get_controller_key_from_timings_file(timings_file_path):
-        with open(timings_file_path, 'r') as file:
-            first_line = file.readline()
-            second_line = file.readline()
+        first_line, second_line = islice(chain(iter_log_file_lines(timings_file_path), repeat("")), 2)
         if "Observation of" in first_line:
             line = first_line
         elif "Observation of" in second_line:
@@ -208,7 +210,11 @@ class ConnectPlusTimingsProcessor:
             m37_unstack = m37[["adjusted_green_average", "adjusted_interstage_average"]].unstack(level=2)
             # apply rounding function that rounds times to whole seconds,
             # while maintaining the total (cycle time)
-            m37_unstack = m37_unstack.apply(lambda x: self.rounding_function(x), axis=1)
+            m37_unstack = pd.DataFrame(
+                round_preserving_row_totals(m37_unstack.to_numpy(dtype=float)),
+                index=m37_unstack.index,
+                columns=m37_unstack.columns,
+            )
             m37_stack = m37_unstack.stack()
             m37_stack.rename(
                 columns={
@@ -242,9 +248,7 @@ class ConnectPlusTimingsProcessor:
 
     @staticmethod
     def get_datetime_from_file_path(file_path):
-        with open(file_path, 'r') as file:
-            first_line = file.readline()
-            second_line = file.readline()
+        first_line, second_line = islice(chain(iter_log_file_lines(file_path), repeat("")), 2)
         if "Observation of" in first_line:
             line = first_line
         elif "Observation of" in second_line:
@@ -271,51 +275,10 @@ class ConnectPlusTimingsProcessor:
                 else:
                     yield Path(file).as_posix()
 
-    @staticmethod
-    def rounding_function(original_series):
-        """
-        Rounding function that rounds a set of values to whole seconds while maintaining
-        the original total
-        :param original_series:
-        :return: Series of rounded values
-        """
-
-        def custom_round(value):
-            """
-            custom rounding function that ignores NaNs
-            :param value: value
-            :return: rounded value or NaN
-            """
-
-            if pd.notna(value):
-                return round(value)
-            else:
-                return value
-
-        # Calculate the original total sum
-        original_total = int(round(original_series.sum(), 4))
-        # Round the values
-        rounded_series = original_series.apply(custom_round)
-        rounded_total = int(rounded_series.sum())
-        # Calculate the difference between rounded total and original total
-        difference = original_total - rounded_total
-        # Identify the indices with the largest differences
-        indices_largest_diff = (
-            (original_series - rounded_series).abs().nlargest(int(abs(difference))).index
-        )
-        # Adjust values at identified indices
-        for index in indices_largest_diff:
-            if difference > 0:
-                rounded_series.at[index] += 1
-            elif difference < 0:
-                rounded_series.at[index] -= 1
-        return rounded_series
-
     def get_num_stages_from_file_path(self, file_path):
-        with open(file_path, 'r') as file:
-            for line in file.readlines():
-                if "STAGE" in line:
-                    break
+        for line in iter_log_file_lines(file_path):
+            if "STAGE" in line:
+                break
         return line.count("STAGE")
 
     @staticmethod
@@ -1,6 +1,7 @@
-from signal_emulator.controller import BaseCollection, BaseItem, PhaseTiming
+from signal_emulator.controller import BaseCollection, BaseItem, PhaseTiming, SlottedBaseItem
+from signal_emulator.emulation_context import EmulationContext
 from signal_emulator.enums import M37StageToStageNumber
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 
 @dataclass(eq=False)
@@ -43,11 +44,12 @@ class SignalPlan(BaseItem):
         elif self.time_period_id == "PM":
             visum_signal_controller.cycle_time_pm = self.cycle_time
 
+        context = EmulationContext(time_period_id=self.time_period_id)
         for signal_plan_stream in self.signal_plan_streams:
             self.signal_emulator.logger.info(
                 f"Emulating Signal Plan Stream: {signal_plan_stream.site_id}"
             )
-            signal_plan_stream.emulate()
+            signal_plan_stream.emulate(context)
 
 
 class SignalPlans(BaseCollection):
@@ -72,10 +74,12 @@ class SignalPlans(BaseCollection):
         )
         self.add_instance(signal_plan)
 
-    def add_from_stream_plan_dict(self, streams_and_plans, period, signal_plan_number):
+    def add_from_stream_plan_dict(self, streams_and_plans, period, signal_plan_number, context=None):
+        if context is None:
+            context = EmulationContext(time_period_id=period.get_key())
         first_plan = next((v for v in streams_and_plans.values() if v is not None), None)
         first_stream = next((k for k, v in streams_and_plans.items() if v is not None), None)
-        max_cycle_time = self.get_cycle_time(first_stream, first_plan)
+        max_cycle_time = self.get_cycle_time(first_stream, first_plan, context)
         signal_plan = SignalPlan(
             controller_key=first_stream.controller.controller_key,
             signal_emulator=self.signal_emulator,
@@ -90,8 +94,10 @@ class SignalPlans(BaseCollection):
         for stream, plan in streams_and_plans.items():
             if not plan:
                 continue
-            m37_stages = self.get_m37_stage_numbers(stream.site_number)
-            stage_sequence = plan.get_stage_sequence(m37_stages=m37_stages, stream=stream, cycle_time=max_cycle_time)
+            m37_stages = self.get_m37_stage_numbers(stream.site_number, context)
+            stage_sequence = plan.get_stage_sequence(
+                m37_stages=m37_stages, stream=stream, cycle_time=max_cycle_time, context=context
+            )
             signal_plan_stream = SignalPlanStream(
                 signal_emulator=self.signal_emulator,
                 controller_key=stream.controller.controller_key,
@@ -112,12 +118,12 @@ class SignalPlans(BaseCollection):
                     next_ssi.pulse_time,
                     max_cycle_time, #plan.cycle_time,
                 )
-                m37 = this_ssi.stage.get_m37(stream.site_number)
+                m37 = this_ssi.stage.get_m37(stream.site_number, context)
                 if m37 and m37.utc_stage_id not in {"PG", "GX"}:
                     interstage_length = m37.interstage_time
                 else:
                     interstage_length = signal_plan_stream.get_interstage_time(
-                        previous_ssi.stage, this_ssi.stage, modified=False
+                        previous_ssi.stage, this_ssi.stage, modified=False, context=context
                     )
                 if this_ssi.effective_stage_call_rate < 1:
                     interstage_length = int(interstage_length * this_ssi.effective_stage_call_rate)
@@ -142,23 +148,24 @@ class SignalPlans(BaseCollection):
                 self.signal_emulator.signal_plan_stages.add_instance(signal_plan_stage)
                 signal_plan_sequence_number += 1
 
-    def get_cycle_time(self, stream, plan):
-        cycle_time = self.get_m37_cycle_time(stream)
+    def get_cycle_time(self, stream, plan, context=None):
+        cycle_time = self.get_m37_cycle_time(stream, context)
         if cycle_time:
             return cycle_time
         else:
             return self.get_plan_cycle_time(plan)
 
-    def get_m37_cycle_time(self, stream):
+    def get_m37_cycle_time(self, stream, context=None):
+        time_period_id = self.signal_emulator.time_periods.get_period_id(context)
         for stage in M37StageToStageNumber:
-            if self.signal_emulator.m37s.key_exists((
-                stream.site_number, stage.value, self.signal_emulator.time_periods.active_period_id
-            )):
-                return self.signal_emulator.m37s.get_by_key((
-                stream.site_number, stage.value, self.signal_emulator.time_periods.active_period_id
-            )).cycle_time
+            if self.signal_emulator.m37s.key_exists((stream.site_number, stage.value, time_period_id)):
+                return self.signal_emulator.m37s.get_by_key(
+                    (stream.site_number, stage.value, time_period_id)
+                ).cycle_time
         if stream.site_number != stream.controller_key and self.signal_emulator.streams.key_exists((stream.controller_key, 0)):
-            return self.get_m37_cycle_time(self.signal_emulator.streams.get_by_key((stream.controller_key, 0)))
+            return self.get_m37_cycle_time(
+                self.signal_emulator.streams.get_by_key((stream.controller_key, 0)), context
+            )
         else:
             return None
 
@@ -170,7 +177,8 @@ class SignalPlans(BaseCollection):
     def get_stage_length_from_pulse_points(pulse_point_1, pulse_point_2, cycle_time):
         return (pulse_point_2 - pulse_point_1 + cycle_time) % cycle_time
 
-    def get_m37_stage_numbers(self, site_number):
+    def get_m37_stage_numbers(self, site_number, context=None):
+        time_period_id = self.signal_emulator.time_periods.get_period_id(context)
         m37_stages_numbers = set()
         for (m37_bit, stage_number) in M37StageToStageNumber.__members__.items():
             if (
@@ -178,14 +186,14 @@ class SignalPlans(BaseCollection):
                     (
                         site_number,
                         stage_number.value,
-                        self.signal_emulator.time_periods.active_period_id,
+                        time_period_id,
                     )
                 )
                 and self.signal_emulator.m37s.get_by_key(
                     (
                         site_number,
                         stage_number.value,
-                        self.signal_emulator.time_periods.active_period_id,
+                        time_period_id,
                     )
                 ).total_time
                 > 0
@@ -196,14 +204,14 @@ class SignalPlans(BaseCollection):
                     (
                         site_number.replace("J", "P"),
                         m37_bit,
-                        self.signal_emulator.time_periods.active_period_id,
+                        time_period_id,
                     )
                 )
                 and self.signal_emulator.m37s.get_by_key(
                     (
                         site_number.replace("J", "P"),
                         m37_bit,
-                        self.signal_emulator.time_periods.active_period_id,
+                        time_period_id,
                     )
                 ).total_time
                 > 0
@@ -212,8 +220,8 @@ class SignalPlans(BaseCollection):
         return m37_stages_numbers
 
 
-@dataclass(eq=False)
-class SignalPlanStream(BaseItem):
+@dataclass(eq=False, slots=True)
+class SignalPlanStream(SlottedBaseItem):
     signal_emulator: object
     controller_key: str
     site_id: str
@@ -223,7 +231,9 @@ class SignalPlanStream(BaseItem):
     cycle_time: int
     single_double_triple: int
     is_va: bool
+    signal_plan_stages: object = field(init=False, repr=False)
     PROBABLY_ZERO = 0
+    LINKS = ("stream",)
 
     def __post_init__(self):
         self.signal_plan.signal_plan_streams.append(self)
@@ -252,6 +262,9 @@ class SignalPlanStream(BaseItem):
 
     @property
     def stream(self):
+        return self.get_link("stream", self.resolve_stream)
+
+    def resolve_stream(self):
         return self.signal_emulator.streams.get_by_key(
             (self.controller_key, self.stream_number_controller)
         )
@@ -260,14 +273,20 @@ class SignalPlanStream(BaseItem):
     def stream_number_controller(self):
         return self.stream_number - 1
 
-    def emulate(self):
+    def emulate(self, context=None):
+        """
+        Method to emulate the signal plan stream and create the PhaseTimings
+        :param context: EmulationContext, a new context for the signal plan time period is used if None
+        :return: None
+        """
+        if context is None:
+            context = EmulationContext(time_period_id=self.signal_plan.time_period_id)
         stream = self.stream
-        self.signal_emulator.time_periods.active_period_id = self.signal_plan.time_period_id
-        m37_stages = self.signal_emulator.signal_plans.get_m37_stage_numbers(stream.site_number)
+        m37_stages = self.signal_emulator.signal_plans.get_m37_stage_numbers(stream.site_number, context)
         m37_check = len(m37_stages) > 0
         if m37_check:
             cycle_time = self.signal_emulator.m37s.get_cycle_time_by_site_id_and_period_id(
-                stream.site_number, self.signal_emulator.time_periods.active_period_id
+                stream.site_number, context.time_period_id
             )
             self.signal_emulator.logger.info("M37s used for stage lengths")
         else:
@@ -276,7 +295,7 @@ class SignalPlanStream(BaseItem):
                 "M37s not found, plan pulse times used for stage lengths"
             )
 
-        stream.active_stage_key = stream.controller_key, self.signal_plan_stages[-1].stage_number
+        context.set_active_stage_key(stream, (stream.controller_key, self.signal_plan_stages[-1].stage_number))
         if len(self.signal_plan_stages) == 1:
             for phase in self.signal_plan_stages[-1].stage.phases_in_stage:
                 phase_timing = PhaseTiming(
@@ -284,7 +303,7 @@ class SignalPlanStream(BaseItem):
                     controller_key=stream.controller_key,
                     site_id=stream.site_number,
                     phase_ref=phase.phase_ref,
-                    index=len(phase.phase_timings),
+                    index=len(phase.get_phase_timings(context)),
                     start_time=0,
                     end_time=self.cycle_time,
                     time_period_id=self.signal_plan.time_period_id,
@@ -297,12 +316,12 @@ class SignalPlanStream(BaseItem):
         for index, signal_plan_stage in enumerate(
             self.signal_plan_stages + [self.signal_plan_stages[0]]
         ):
-            current_stage = stream.active_stage
+            current_stage = context.get_active_stage(stream)
             m37 = self.signal_emulator.m37s.get_by_key(
                 (
                     self.site_id,
                     signal_plan_stage.stage.stream_stage_number,
-                    self.signal_emulator.time_periods.active_period_id,
+                    context.time_period_id,
                 )
             )
             if not m37:
@@ -310,7 +329,7 @@ class SignalPlanStream(BaseItem):
                     (
                         self.site_id,
                         signal_plan_stage.stage.stream_stage_number,
-                        self.signal_emulator.time_periods.active_period_id,
+                        context.time_period_id,
                     )
                 )
 
@@ -323,6 +342,7 @@ class SignalPlanStream(BaseItem):
             controller_interstage_time = self.get_interstage_time(
                 current_stage,
                 signal_plan_stage.stage,
+                context=context,
             )
 
             if controller_interstage_time < signal_plan_stage.interstage_length:
@@ -338,6 +358,7 @@ class SignalPlanStream(BaseItem):
                     end_stage_key=current_stage.stage_number,
                     start_stage_key=signal_plan_stage.stage_number,
                     interstage_time=signal_plan_stage.interstage_length,
+                    context=context,
                 )
 
             if not index == 0:
@@ -348,10 +369,10 @@ class SignalPlanStream(BaseItem):
                         and end_phase.termination_type.name == "ASSOCIATED_PHASE_GAINS_ROW"
                     ):
                         max_start_time_delta = self.get_max_start_time(
-                            end_phases=end_phases,
                             start_phase=end_phase.associated_phase,
                             end_stage_key=current_stage.stage_number,
                             start_stage_key=signal_plan_stage.stage_number,
+                            context=context,
                         )
                         end_time = self.constrain_time_to_cycle_time(
                             signal_plan_stage.pulse_point + max_start_time_delta, cycle_time
@@ -364,19 +385,16 @@ class SignalPlanStream(BaseItem):
                                 end_stage_key=current_stage.stage_number,
                                 start_stage_key=signal_plan_stage.stage_number,
                                 phase_key=end_phase.phase_ref,
-                                modified=True
+                                modified=True,
+                                context=context,
                             ),
                             cycle_time,
                         )
                         if end_phase.indicative_arrow_phase:
-                            if end_phase.indicative_arrow_phase.phase_timings:
-                                if (
-                                    end_phase.indicative_arrow_phase.phase_timings[-1].end_time
-                                    is None
-                                ):
-                                    end_phase.indicative_arrow_phase.phase_timings[
-                                        -1
-                                    ].end_time = end_time
+                            arrow_phase_timings = end_phase.indicative_arrow_phase.get_phase_timings(context)
+                            if arrow_phase_timings:
+                                if arrow_phase_timings[-1].end_time is None:
+                                    arrow_phase_timings[-1].end_time = end_time
                             elif end_phase.indicative_arrow_phase in all_phases_used:
                                 pass
                                 phase_timing = PhaseTiming(
@@ -384,14 +402,15 @@ class SignalPlanStream(BaseItem):
                                     controller_key=stream.controller_key,
                                     site_id=stream.site_number,
                                     phase_ref=end_phase.indicative_arrow_phase.phase_ref,
-                                    index=len(end_phase.indicative_arrow_phase.phase_timings),
+                                    index=len(arrow_phase_timings),
                                     end_time=end_time,
                                     time_period_id=self.signal_plan.time_period_id,
                                 )
                                 self.signal_emulator.phase_timings.add_instance(phase_timing)
                     if end_time is not None:
-                        if len(end_phase.phase_timings) > 0:
-                            last_phase_timing = end_phase.phase_timings[-1]
+                        end_phase_timings = end_phase.get_phase_timings(context)
+                        if len(end_phase_timings) > 0:
+                            last_phase_timing = end_phase_timings[-1]
                         else:
                             last_phase_timing = None
 
@@ -403,7 +422,7 @@ class SignalPlanStream(BaseItem):
                                 controller_key=stream.controller_key,
                                 site_id=stream.site_number,
                                 phase_ref=end_phase.phase_ref,
-                                index=len(end_phase.phase_timings),
+                                index=len(end_phase_timings),
                                 end_time=end_time,
                                 time_period_id=self.signal_plan.time_period_id,
                             )
@@ -411,16 +430,17 @@ class SignalPlanStream(BaseItem):
             if not index == len(self.signal_plan_stages):
                 for start_phase in start_phases:
                     max_start_time_delta = self.get_max_start_time(
-                        end_phases=end_phases,
                         start_phase=start_phase,
                         end_stage_key=current_stage.stage_number,
                         start_stage_key=signal_plan_stage.stage_number,
+                        context=context,
                     )
                     start_time = self.constrain_time_to_cycle_time(
                         signal_plan_stage.pulse_point + max_start_time_delta, cycle_time
                     )
-                    if len(start_phase.phase_timings) > 0:
-                        last_phase_timing = start_phase.phase_timings[-1]
+                    start_phase_timings = start_phase.get_phase_timings(context)
+                    if len(start_phase_timings) > 0:
+                        last_phase_timing = start_phase_timings[-1]
                     else:
                         last_phase_timing = None
 
@@ -432,13 +452,13 @@ class SignalPlanStream(BaseItem):
                             controller_key=stream.controller_key,
                             site_id=stream.site_number,
                             phase_ref=start_phase.phase_ref,
-                            index=len(start_phase.phase_timings),
+                            index=len(start_phase_timings),
                             start_time=start_time,
                             time_period_id=self.signal_plan.time_period_id,
                         )
                         self.signal_emulator.phase_timings.add_instance(phase_timing)
 
-            stream.active_stage_key = (stream.controller_key, signal_plan_stage.stage_number)
+            context.set_active_stage_key(stream, (stream.controller_key, signal_plan_stage.stage_number))
 
         # Create PhaseTimimgs for all green phases
         phases_in_all_stages = set(all_phases_used)
@@ -478,12 +498,13 @@ class SignalPlanStream(BaseItem):
     def constrain_time_to_cycle_time(time, cycle_time):
         return time % cycle_time
 
-    def reduce_interstage(self, controller_key, end_stage_key, start_stage_key, interstage_time):
+    def reduce_interstage(self, controller_key, end_stage_key, start_stage_key, interstage_time, context=None):
+        time_period_id = self.signal_emulator.time_periods.get_period_id(context)
         end_stage = self.signal_emulator.stages.get_by_key((controller_key, end_stage_key))
         start_stage = self.signal_emulator.stages.get_by_key((controller_key, start_stage_key))
         end_phases = self.signal_emulator.stages.get_end_phases(end_stage, start_stage)
         start_phases = self.signal_emulator.stages.get_start_phases(end_stage, start_stage)
-        original_interstage = self.get_interstage_time(end_stage, start_stage)
+        original_interstage = self.get_interstage_time(end_stage, start_stage, context=context)
         for start_phase in start_phases:
             for end_phase in end_phases:
                 end_phase_delay = self.signal_emulator.phase_delays.get_by_key(
@@ -506,9 +527,12 @@ class SignalPlanStream(BaseItem):
                 end_phase_delay_mod = self.signal_emulator.phase_delays.get_by_key(
                     (controller_key, end_stage_key, start_stage_key, end_phase.phase_ref),
                     modified=True,
+                    context=context,
                 )
                 intergreen_mod = self.signal_emulator.intergreens.get_by_key(
-                    (controller_key, end_phase.phase_ref, start_phase.phase_ref), modified=True
+                    (controller_key, end_phase.phase_ref, start_phase.phase_ref),
+                    modified=True,
+                    context=context,
                 )
                 start_phase_delay_mod = self.signal_emulator.phase_delays.get_by_key(
                     (
@@ -518,6 +542,7 @@ class SignalPlanStream(BaseItem):
                         start_phase.phase_ref,
                     ),
                     modified=True,
+                    context=context,
                 )
                 if end_phase_delay.delay_time + intergreen.intergreen_time > interstage_time:
                     old_interstage_time = end_phase_delay.delay_time + intergreen.intergreen_time
@@ -529,7 +554,7 @@ class SignalPlanStream(BaseItem):
                                 "controller_key": intergreen.controller_key,
                                 "end_phase_key": intergreen.end_phase_key,
                                 "start_phase_key": intergreen.start_phase_key,
-                                "time_period_id": self.signal_emulator.time_periods.active_period_id,
+                                "time_period_id": time_period_id,
                                 "intergreen_time": new_intergreen_time,
                                 "original_time": intergreen.intergreen_time,
                             },
@@ -542,7 +567,7 @@ class SignalPlanStream(BaseItem):
                                 "end_stage_key": end_phase_delay.end_stage_key,
                                 "start_stage_key": end_phase_delay.start_stage_key,
                                 "phase_ref": end_phase_delay.phase_ref,
-                                "time_period_id": self.signal_emulator.time_periods.active_period_id,
+                                "time_period_id": time_period_id,
                                 "delay_time": new_end_phase_delay_time,
                                 "original_delay_time": end_phase_delay.delay_time,
                                 "is_absolute": True,
@@ -555,59 +580,28 @@ class SignalPlanStream(BaseItem):
                             "end_stage_key": start_phase_delay.end_stage_key,
                             "start_stage_key": start_phase_delay.start_stage_key,
                             "phase_ref": start_phase_delay.phase_ref,
-                            "time_period_id": self.signal_emulator.time_periods.active_period_id,
+                            "time_period_id": time_period_id,
                             "delay_time": interstage_time,
                             "original_delay_time": start_phase_delay.delay_time,
                             "is_absolute": True,
                         }
                     )
 
-        reduced_interstage = self.get_interstage_time(end_stage, start_stage)
+        reduced_interstage = self.get_interstage_time(end_stage, start_stage, context=context)
         self.signal_emulator.logger.info(
             f"interstage_time: {original_interstage}, reduced interstage: {reduced_interstage}"
         )
         assert interstage_time == reduced_interstage
 
-    def get_interstage_time(self, end_stage, start_stage, modified=True):
-        end_phases = self.signal_emulator.stages.get_end_phases(end_stage, start_stage)
-        start_phases = self.signal_emulator.stages.get_start_phases(end_stage, start_stage)
-        max_interstage_time = 0
-        for start_phase in start_phases:
-            interstage_time = self.get_max_start_time(
-                end_phases, start_phase, end_stage.stage_number, start_stage.stage_number, modified
-            )
-            max_interstage_time = max(max_interstage_time, interstage_time)
-        return max_interstage_time
-
-    def get_max_start_time(self, end_phases, start_phase, end_stage_key, start_stage_key, modified=True):
-        time_delta = 0
-        for end_phase in end_phases:
-            end_phase_delay = (
-                self.signal_emulator.phase_delays.get_delay_time_by_stage_and_phase_keys(
-                    controller_key=end_phase.controller_key,
-                    end_stage_key=end_stage_key,
-                    start_stage_key=start_stage_key,
-                    phase_key=end_phase.phase_ref,
-                    modified=modified,
-                )
-            )
-            intergreen = self.signal_emulator.intergreens.get_intergreen_time_by_phase_keys(
-                controller_key=end_phase.controller_key,
-                end_phase_key=end_phase.phase_ref,
-                start_phase_key=start_phase.phase_ref,
-                modified=modified,
-            )
-            start_phase_delay = (
-                self.signal_emulator.phase_delays.get_delay_time_by_stage_and_phase_keys(
-                    controller_key=end_phase.controller_key,
-                    end_stage_key=end_stage_key,
-                    start_stage_key=start_stage_key,
-                    phase_key=start_phase.phase_ref,
-                    modified=modified,
-                )
-            )
-            time_delta = max(time_delta, max(end_phase_delay + intergreen, start_phase_delay))
-        return time_delta
+    def get_interstage_time(self, end_stage, start_stage, modified=True, context=None):
+        return self.signal_emulator.interstage_tables.get_interstage_time(
+            end_stage, start_stage, modified=modified, context=context
+        )
+
+    def get_max_start_time(self, start_phase, end_stage_key, start_stage_key, modified=True, context=None):
+        return self.signal_emulator.interstage_tables.get_max_start_time(
+            start_phase, end_stage_key, start_stage_key, modified=modified, context=context
+        )
 
 
 class SignalPlanStreams(BaseCollection):
@@ -620,8 +614,8 @@ class SignalPlanStreams(BaseCollection):
         self.signal_emulator = signal_emulator
 
 
-@dataclass(eq=False)
-class SignalPlanStage(BaseItem):
+@dataclass(eq=False, slots=True)
+class SignalPlanStage(SlottedBaseItem):
     signal_emulator: object
     controller_key: str
     signal_plan_number: int
@@ -633,8 +627,9 @@ class SignalPlanStage(BaseItem):
     interstage_length: int
     green_length: int
     pulse_point: int
-    either_or: int
+    either_or: bool
     fixed_length: bool
+    LINKS = ("stage",)
 
     def __post_init__(self):
         signal_plan_stream = self.signal_emulator.signal_plan_streams.get_by_key(
@@ -658,6 +653,9 @@ class SignalPlanStage(BaseItem):
 
     @property
     def stage(self):
+        return self.get_link("stage", self.resolve_stage)
+
+    def resolve_stage(self):
         return self.signal_emulator.stages.get_by_key(self.get_stage_key())
 
 
@@ -5,7 +5,7 @@ from typing import Optional
 import numpy as np
 
 from signal_emulator.controller import BaseCollection
-from signal_emulator.utilities.utility_functions import time_str_to_timedelta, time_str_to_time
+from signal_emulator.utilities.utility_functions import time_str_to_timedelta
 
 
 @dataclass(eq=False)
@@ -49,6 +49,7 @@ class TimePeriods(BaseCollection):
     TABLE_NAME = "time_periods"
     ITEM_CLASS = TimePeriod
     WRITE_TO_DATABASE = True
+    PARTITION_FIELD = None
 
     def __init__(self, periods_data, signal_emulator=None):
         """
@@ -85,6 +86,15 @@ class TimePeriods(BaseCollection):
     def active_period(self):
         return self.data[self._active_period_id]
 
+    def get_period_id(self, context=None):
+        """
+        Function to get the time period id of an emulation context, falling back to the active period id for
+        callers outside of emulation, such as the exporters
+        :param context: EmulationContext or None
+        :return: time period id
+        """
+        return context.time_period_id if context else self._active_period_id
+
     def get_periods_for_timedelta(self, target_timedelta: timedelta):
         """
         Function to return a list of Periods that contain target_timedelta
@@ -108,6 +118,22 @@ class TimePeriods(BaseCollection):
                 return period.name
         return np.NAN
 
+    def get_period_ids_for_timedeltas(self, target_timedeltas):
+        """
+        Function to return the id of the first Period that contains each of target_timedeltas, vectorised
+        equivalent of get_period_id_for_timedelta
+        :param target_timedeltas: array of timedelta64
+        :return: numpy array of period ids, NaN where no Period contains the timedelta
+        """
+        period_ids = np.full(len(target_timedeltas), np.NAN, dtype=object)
+        # periods are applied in reverse so the first containing period is the one kept
+        for period in reversed(list(self)):
+            in_period = (target_timedeltas >= np.timedelta64(period.start_time)) & (
+                target_timedeltas <= np.timedelta64(period.end_time)
+            )
+            period_ids[in_period] = period.name
+        return period_ids
+
 
 
 
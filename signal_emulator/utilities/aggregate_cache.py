@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from signal_emulator.utilities.utility_functions import dict_to_json_file, load_json_to_dict
+
+
+class AggregateCache:
+    """
+    Class to represent an on disk cache of the partial aggregates of raw log files, such as the M37 stage time
+    totals of each file. Each partial aggregate is stored in a Parquet file and is valid while the path, size and
+    modification time of its source file and the definition of the aggregation are unchanged, so only new or
+    modified files need to be read again. pyarrow is an optional dependency, required when the cache is used
+    """
+
+    def __init__(self, cache_path, name, definition):
+        """
+        Constructor for AggregateCache
+        :param cache_path: directory of the cache files
+        :param name: name of the aggregation, used as the prefix of the cache files
+        :param definition: json serialisable definition of the aggregation, such as the time periods. Cached
+            aggregates of a different definition are not used
+        """
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as error:
+            raise ImportError("pyarrow is required for the aggregate cache: pip install pyarrow") from error
+        self.cache_path = Path(cache_path)
+        self.name = name
+        self.definition = json.loads(json.dumps(definition, default=str))
+        self.index_path = self.cache_path / f"{name}_cache_index.json"
+        self.files = {}
+        if self.index_path.exists():
+            index = load_json_to_dict(self.index_path)
+            if index.get("definition") == self.definition:
+                self.files = index["files"]
+
+    @staticmethod
+    def get_file_fingerprint(file_path):
+        """
+        Function to get the fingerprint of a source file
+        :param file_path: source file path
+        :return: dict of file size and modification time
+        """
+        file_stat = os.stat(file_path)
+        return {"size": file_stat.st_size, "mtime_ns": file_stat.st_mtime_ns}
+
+    def get_cache_file_path(self, file_path):
+        path_hash = hashlib.sha1(os.path.abspath(file_path).encode()).hexdigest()
+        return self.cache_path / f"{self.name}_{path_hash}.parquet"
+
+    def get(self, file_path):
+        """
+        Function to get the cached partial aggregate of a source file
+        :param file_path: source file path
+        :return: DataFrame, or None if the file is not cached or has changed since it was cached
+        """
+        entry = self.files.get(os.path.abspath(file_path))
+        cache_file_path = self.get_cache_file_path(file_path)
+        if entry != self.get_file_fingerprint(file_path) or not cache_file_path.exists():
+            return None
+        return pd.read_parquet(cache_file_path)
+
+    def put(self, file_path, partial_aggregate):
+        """
+        Method to store the partial aggregate of a source file
+        :param file_path: source file path
+        :param partial_aggregate: DataFrame with a default index
+        :return: None
+        """
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+        partial_aggregate.to_parquet(self.get_cache_file_path(file_path), index=False)
+        self.files[os.path.abspath(file_path)] = self.get_file_fingerprint(file_path)
+
+    def save(self, file_paths):
+        """
+        Method to write the cache index, files not in file_paths are removed from the cache
+        :param file_paths: list of the current source file paths
+        :return: None
+        """
+        current_file_paths = {os.path.abspath(file_path) for file_path in file_paths}
+        for file_path in [file_path for file_path in self.files if file_path not in current_file_paths]:
+            del self.files[file_path]
+            self.get_cache_file_path(file_path).unlink(missing_ok=True)
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+        dict_to_json_file({"definition": self.definition, "files": self.files}, self.index_path)
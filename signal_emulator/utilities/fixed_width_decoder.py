@@ -0,0 +1,173 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+from signal_emulator.utilities.log_file_reader import read_log_file_bytes
+
+SPACE = ord(" ")
+NEWLINE = ord("\n")
+CARRIAGE_RETURN = ord("\r")
+MINUS = ord("-")
+ZERO = ord("0")
+
+
+def get_line_bounds(file_bytes, header_rows=()):
+    """
+    Function to get the start and end offsets of the lines of a file
+    :param file_bytes: numpy array of uint8
+    :param header_rows: indices of the lines to skip
+    :return: tuple of arrays of line start offsets and line end offsets
+    """
+    newlines = np.flatnonzero(file_bytes == NEWLINE)
+    line_starts = np.concatenate(([0], newlines + 1))
+    line_ends = np.concatenate((newlines, [len(file_bytes)]))
+    if len(file_bytes) == 0 or file_bytes[-1] == NEWLINE:
+        line_starts = line_starts[:-1]
+        line_ends = line_ends[:-1]
+    keep = np.ones(len(line_starts), dtype=bool)
+    keep[[row for row in header_rows if row < len(keep)]] = False
+    return line_starts[keep], line_ends[keep]
+
+
+def slice_column(file_bytes, line_starts, line_ends, column_limits):
+    """
+    Function to slice a fixed width column from every line, positions beyond the end of a line are spaces
+    :param file_bytes: numpy array of uint8
+    :param line_starts: array of line start offsets
+    :param line_ends: array of line end offsets
+    :param column_limits: tuple of column start and end positions
+    :return: 2D numpy array of uint8, one row per line
+    """
+    start, end = column_limits
+    positions = line_starts[:, None] + np.arange(start, end)[None, :]
+    in_line = positions < line_ends[:, None]
+    column_bytes = np.where(in_line, file_bytes[np.minimum(positions, max(len(file_bytes) - 1, 0))], SPACE)
+    column_bytes[column_bytes == CARRIAGE_RETURN] = SPACE
+    return column_bytes.astype(np.uint8)
+
+
+def bytes_to_str(column_bytes):
+    """
+    Function to decode a fixed width column to strings with surrounding spaces removed
+    :param column_bytes: 2D numpy array of uint8
+    :return: numpy array of str
+    """
+    fixed_width_strings = np.ascontiguousarray(column_bytes).view(f"S{column_bytes.shape[1]}").ravel()
+    # log columns have few distinct values, so only the unique values are stripped and decoded
+    unique_strings, inverse = np.unique(fixed_width_strings, return_inverse=True)
+    return np.char.decode(np.char.strip(unique_strings), "ascii")[inverse]
+
+
+def bytes_to_int(column_bytes):
+    """
+    Function to decode a fixed width column of integers, blank values are missing
+    :param column_bytes: 2D numpy array of uint8
+    :return: pandas IntegerArray
+    """
+    is_digit = (column_bytes >= ZERO) & (column_bytes <= ZERO + 9)
+    is_minus = column_bytes == MINUS
+    if not (is_digit | is_minus | (column_bytes == SPACE)).all():
+        raise ValueError("Fixed width integer column contains non numeric characters")
+    # the place value of each digit is the number of digits to its right
+    digits_to_right = np.cumsum(is_digit[:, ::-1], axis=1)[:, ::-1] - is_digit
+    values = np.where(is_digit, (column_bytes.astype(np.int64) - ZERO) * 10 ** digits_to_right, 0).sum(axis=1)
+    values = np.where(is_minus.any(axis=1), -values, values)
+    return pd.arrays.IntegerArray(values, ~is_digit.any(axis=1))
+
+
+def bytes_to_time(column_bytes):
+    """
+    Function to decode a fixed width column of HH:MM:SS times of day
+    :param column_bytes: 2D numpy array of uint8
+    :return: numpy array of timedelta64[ns]
+    """
+    digits = column_bytes[:, [0, 1, 3, 4, 6, 7]].astype(np.int64) - ZERO
+    if ((digits < 0) | (digits > 9)).any():
+        raise ValueError("Fixed width time column is not in the format HH:MM:SS")
+    seconds = (digits[:, 0] * 10 + digits[:, 1]) * 3600 + (digits[:, 2] * 10 + digits[:, 3]) * 60
+    seconds += digits[:, 4] * 10 + digits[:, 5]
+    return seconds.astype("timedelta64[s]").astype("timedelta64[ns]")
+
+
+COLUMN_DECODERS = {"str": bytes_to_str, "int": bytes_to_int, "time": bytes_to_time}
+
+
+def decode_fixed_width_file(
+    file_path, column_limits, column_names, column_types, filter_column, filter_value, header_rows=()
+):
+    """
+    Function to decode a fixed width log file, such as an lsg file of M16 or M37 messages. Uncompressed files are
+    memory mapped, gzip and zstd files are decompressed to memory. The filter column is compared for every line, the
+    other columns are only decoded for the lines that match the filter value
+    :param file_path: file path
+    :param column_limits: list of tuples of column start and end positions
+    :param column_names: list of column names
+    :param column_types: dict of column name to type, one of str, int or time. Columns without a type are skipped
+    :param filter_column: name of the column to filter lines on
+    :param filter_value: str value of the filter column of the lines to decode
+    :param header_rows: indices of the lines to skip
+    :return: dict of column name to array
+    """
+    with read_log_file_bytes(file_path) as file_bytes:
+        # the decoded columns are copies, so no view of a memory map is held when it is closed
+        return decode_fixed_width_bytes(
+            np.frombuffer(file_bytes, dtype=np.uint8),
+            column_limits,
+            column_names,
+            column_types,
+            filter_column,
+            filter_value,
+            header_rows,
+        )
+
+
+def decode_fixed_width_bytes(
+    file_bytes, column_limits, column_names, column_types, filter_column, filter_value, header_rows=()
+):
+    """
+    Function to decode the contents of a fixed width log file, see decode_fixed_width_file
+    :param file_bytes: numpy array of uint8
+    :return: dict of column name to array
+    """
+    column_limits = dict(zip(column_names, column_limits))
+    line_starts, line_ends = get_line_bounds(file_bytes, header_rows)
+    filter_values = bytes_to_str(slice_column(file_bytes, line_starts, line_ends, column_limits[filter_column]))
+    matched = filter_values == filter_value
+    line_starts, line_ends = line_starts[matched], line_ends[matched]
+    return {
+        column_name: COLUMN_DECODERS[column_types[column_name]](
+            slice_column(file_bytes, line_starts, line_ends, column_limits[column_name])
+        )
+        for column_name in column_names
+        if column_name in column_types
+    }
+
+
+def decode_fixed_width_files(file_paths, processes=1, **decode_kwargs):
+    """
+    Generator of the decoded contents of fixed width log files, in the order of file_paths. Files are decoded in a
+    process pool if processes is greater than 1, with a limited number of files decoded ahead of the consumer
+    :param file_paths: list of file paths
+    :param processes: number of worker processes
+    :param decode_kwargs: keyword arguments of decode_fixed_width_file
+    :return: tuple of file path and dict of column name to array
+    """
+    if processes <= 1:
+        for file_path in file_paths:
+            yield file_path, decode_fixed_width_file(file_path, **decode_kwargs)
+        return
+    file_paths = iter(file_paths)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [
+            (file_path, executor.submit(decode_fixed_width_file, file_path, **decode_kwargs))
+            for file_path in islice(file_paths, processes * 2)
+        ]
+        while futures:
+            file_path, future = futures.pop(0)
+            for next_file_path in islice(file_paths, 1):
+                futures.append(
+                    (next_file_path, executor.submit(decode_fixed_width_file, next_file_path, **decode_kwargs))
+                )
+            yield file_path, future.result()
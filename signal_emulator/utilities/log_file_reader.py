@@ -0,0 +1,207 @@
+import csv
+import glob
+import gzip
+import mmap
+import queue
+import threading
+from contextlib import contextmanager
+
+# size of the binary blocks files are read and decoded in
+BLOCK_SIZE = 1 << 22
+# number of decompressed blocks read ahead of the consumer by the prefetch thread
+PREFETCH_BLOCKS = 4
+COMPRESSION_SUFFIXES = {".gz": "gzip", ".zst": "zstd", ".zstd": "zstd"}
+
+
+def get_compression(file_path):
+    """
+    Function to get the compression of a log file from its suffix
+    :param file_path: file path
+    :return: "gzip", "zstd" or None for uncompressed files
+    """
+    file_path = str(file_path)
+    for suffix, compression in COMPRESSION_SUFFIXES.items():
+        if file_path.endswith(suffix):
+            return compression
+    return None
+
+
+def strip_compression_suffix(file_path):
+    """
+    Function to remove the compression suffix of a file path, so "m37.csv.gz" can be matched as a csv file
+    :param file_path: file path
+    :return: str file path without compression suffix
+    """
+    file_path = str(file_path)
+    for suffix in COMPRESSION_SUFFIXES:
+        if file_path.endswith(suffix):
+            return file_path[: -len(suffix)]
+    return file_path
+
+
+def find_log_files(directory, extension):
+    """
+    Function to find all files in subdirectories with extension, uncompressed or with a compression suffix
+    :param directory: base directory
+    :param extension: extension, without compression suffix
+    :return: list of file paths
+    """
+    file_paths = []
+    for suffix in ("", *COMPRESSION_SUFFIXES):
+        file_paths.extend(glob.glob(f"{directory}/**/*.{extension}{suffix}", recursive=True))
+    return file_paths
+
+
+def open_log_file(file_path):
+    """
+    Function to open a plain, gzip or zstd log file for binary reading. zstandard is an optional dependency, required
+    to read zstd files
+    :param file_path: file path
+    :return: binary file object of the decompressed contents
+    """
+    compression = get_compression(file_path)
+    if compression == "gzip":
+        return gzip.open(file_path, "rb")
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError as error:
+            raise ImportError("zstandard is required to read zstd files: pip install zstandard") from error
+        return zstandard.ZstdDecompressor().stream_reader(open(file_path, "rb"), closefd=True)
+    return open(file_path, "rb")
+
+
+@contextmanager
+def read_log_file_bytes(file_path):
+    """
+    Context manager of the full contents of a log file. Uncompressed files are memory mapped, so pages are read by
+    the operating system as they are used, compressed files are decompressed in blocks to memory. The buffer is only
+    valid inside the context, so no views of it should be held after it is closed
+    :param file_path: file path
+    :return: bytes-like object
+    """
+    if get_compression(file_path):
+        yield b"".join(iter_log_file_blocks(file_path))
+        return
+    with open(file_path, "rb") as file:
+        try:
+            memory_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can not be memory mapped
+            yield b""
+            return
+        with memory_map:
+            yield memory_map
+
+
+def iter_log_file_blocks(file_path, block_size=BLOCK_SIZE, prefetch=None):
+    """
+    Generator of the decompressed contents of a log file in binary blocks. Uncompressed files are read from a
+    memory map. gzip and zstd decompression release the GIL, so compressed files are decompressed by a prefetch
+    thread in parallel with the consumer by default
+    :param file_path: file path
+    :param block_size: maximum number of bytes in each block
+    :param prefetch: bool, decompress in a prefetch thread, defaults to True for compressed files
+    :return: bytes block
+    """
+    compression = get_compression(file_path)
+    if compression is None:
+        with read_log_file_bytes(file_path) as file_bytes:
+            for start in range(0, len(file_bytes), block_size):
+                yield file_bytes[start:start + block_size]
+        return
+    if prefetch is None:
+        prefetch = True
+    blocks = _read_blocks(file_path, block_size)
+    yield from _prefetch_blocks(blocks) if prefetch else blocks
+
+
+def _read_blocks(file_path, block_size):
+    with open_log_file(file_path) as file:
+        while block := file.read(block_size):
+            yield block
+
+
+def _prefetch_blocks(blocks):
+    """
+    Generator of blocks read ahead of the consumer by a thread, exceptions raised by the thread are raised here
+    :param blocks: generator of bytes blocks
+    :return: bytes block
+    """
+    block_queue = queue.Queue(maxsize=PREFETCH_BLOCKS)
+    stop_event = threading.Event()
+
+    def put(item):
+        # the consumer may stop early, so the thread checks for the stop event rather than blocking forever
+        while not stop_event.is_set():
+            try:
+                block_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read_ahead():
+        try:
+            for block in blocks:
+                if not put((block, None)):
+                    return
+            put((None, None))
+        except Exception as error:
+            put((None, error))
+        finally:
+            blocks.close()
+
+    thread = threading.Thread(target=read_ahead, daemon=True)
+    thread.start()
+    try:
+        while True:
+            block, error = block_queue.get()
+            if error is not None:
+                raise error
+            if block is None:
+                return
+            yield block
+    finally:
+        stop_event.set()
+        thread.join()
+
+
+def iter_log_file_lines(file_path, encoding="utf-8", block_size=BLOCK_SIZE, prefetch=None):
+    """
+    Generator of the lines of a log file, without line endings. Lines are decoded a block at a time, which is faster
+    than reading them one at a time from a text file object
+    :param file_path: file path
+    :param encoding: text encoding
+    :param block_size: number of bytes decoded at a time
+    :param prefetch: bool, decompress in a prefetch thread, defaults to True for compressed files
+    :return: str line
+    """
+    remainder = b""
+    for block in iter_log_file_blocks(file_path, block_size, prefetch):
+        # blocks are split after the last newline, so multibyte characters and lines are not split between blocks
+        last_newline = block.rfind(b"\n")
+        if last_newline == -1:
+            remainder += block
+            continue
+        text = (remainder + block[:last_newline + 1]).decode(encoding)
+        remainder = block[last_newline + 1:]
+        if "\r" in text:
+            text = text.replace("\r\n", "\n")
+        # the text ends with a newline, which is removed so no empty line is yielded after it
+        yield from text[:-1].split("\n")
+    if remainder:
+        yield remainder.decode(encoding).rstrip("\r")
+
+
+def iter_log_file_records(file_path, delimiter=",", encoding="utf-8", block_size=BLOCK_SIZE, prefetch=None):
+    """
+    Generator of the delimited records of a log file, such as the rows of a SAD csv file
+    :param file_path: file path
+    :param delimiter: field delimiter
+    :param encoding: text encoding
+    :param block_size: number of bytes decoded at a time
+    :param prefetch: bool, decompress in a prefetch thread, defaults to True for compressed files
+    :return: list of str fields
+    """
+    yield from csv.reader(iter_log_file_lines(file_path, encoding, block_size, prefetch), delimiter=delimiter)
@@ -1,17 +1,33 @@
+import hashlib
+import io
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
 import pandas as pd
 import psycopg2
 from psycopg2 import OperationalError
+from psycopg2.pool import ThreadedConnectionPool
 from sqlalchemy import create_engine
-from psycopg2 import OperationalError
+from sqlalchemy.dialects import postgresql
 
 
 class PostgresConnection:
-    def __init__(self, host, database, user, port, schema=None):
+    # table holding the partition fingerprints of the incremental writes of a schema
+    FINGERPRINT_TABLE_NAME = "export_fingerprints"
+
+    def __init__(self, host, database, user, port, schema=None, max_connections=8):
         self.host = host
         self.database = database
         self.user = user
         self.port = port
         self.schema = schema
+        self.max_connections = max_connections
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        # tables read ahead of the collections being built, keyed by schema and table name
+        self.prefetched_tables = {}
         try:
             self.conn = psycopg2.connect(host=host, port=port, database=database, user=user)
         except OperationalError as e:
@@ -25,12 +41,53 @@ class PostgresConnection:
     def __repr__(self):
         return f"host:{self.host} database:{self.database} schema:{self.schema}"
 
+    def __getstate__(self):
+        # connections cannot be pickled, they are recreated when unpickled in a worker process
+        state = self.__dict__.copy()
+        del state["conn"]
+        del state["engine"]
+        del state["_pool"]
+        del state["_pool_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.conn = None
+        self.engine = create_engine(self.connection_uri)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
     @property
     def connection(self):
         return psycopg2.connect(
             host=self.host, database=self.database, user=self.user, port=self.port
         )
 
+    @property
+    def pool(self):
+        """
+        Pool of connections shared by the queries of this PostgresConnection, created on first use
+        :return: ThreadedConnectionPool
+        """
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadedConnectionPool(
+                    1, self.max_connections, host=self.host, database=self.database, user=self.user, port=self.port
+                )
+        return self._pool
+
+    @contextmanager
+    def pooled_connection(self):
+        """
+        Context manager yielding a connection from the pool, the connection is returned to the pool on exit
+        :return: psycopg2 connection
+        """
+        connection = self.pool.getconn()
+        try:
+            yield connection
+        finally:
+            self.pool.putconn(connection)
+
     @property
     def connection_uri(self):
         return f"postgresql+psycopg2://{self.user}@{self.host}:{self.port}/{self.database}"
@@ -41,28 +98,299 @@ class PostgresConnection:
         self.execute_sql(f'CREATE SCHEMA IF NOT EXISTS "{schema_name}";')
 
     def execute_sql(self, sql_query, return_data=False):
-        with self.connection as connection:
-            with connection.cursor() as cursor:
-                cursor.execute(sql_query)
-                if return_data:
-                    return cursor.fetchall()
+        with self.transaction() as cursor:
+            cursor.execute(sql_query)
+            if return_data:
+                return cursor.fetchall()
 
     def read_table_from_df(self, schema, table):
         return pd.read_sql_query(f"SELECT * FROM {schema}.{table}", self.engine)
 
-    def write_df_to_table(self, df, table, schema=None, dtypes=None):
+    @contextmanager
+    def transaction(self):
+        """
+        Context manager yielding a cursor. The statements executed on the cursor are committed together when the
+        context exits, or rolled back if an exception is raised
+        :return: psycopg2 cursor
+        """
+        with self.pooled_connection() as connection:
+            with connection:
+                with connection.cursor() as cursor:
+                    yield cursor
+
+    def write_df_to_table(self, df, table, schema=None, dtypes=None, cursor=None):
+        """
+        Method to replace a table with the contents of a DataFrame. The table is created with the column types in
+        dtypes, or types inferred from the DataFrame, and the rows are bulk loaded with COPY FROM STDIN
+        :param df: DataFrame to write
+        :param table: table name
+        :param schema: schema name, defaults to the connection schema
+        :param dtypes: dict of column name to sqlalchemy type
+        :param cursor: cursor of an open transaction, a new transaction is used if None
+        :return: None
+        """
+        if cursor is None:
+            with self.transaction() as cursor:
+                self.write_df_to_table(df, table, schema, dtypes, cursor)
+            return
+        if schema is None:
+            schema = self.schema
+        column_types = self.get_column_types(df, dtypes)
+        table_name = f'"{schema}"."{table}"'
+        cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
+        column_definitions = ", ".join(f'"{column}" {sql_type}' for column, sql_type in column_types.items())
+        cursor.execute(f"CREATE TABLE {table_name} ({column_definitions})")
+        if len(df) == 0 or len(df.columns) == 0:
+            return
+        column_names = ", ".join(f'"{column}"' for column in column_types)
+        cursor.copy_expert(
+            f"COPY {table_name} ({column_names}) FROM STDIN", self.get_copy_buffer(df, column_types)
+        )
+
+    @staticmethod
+    def get_column_types(df, dtypes=None):
+        """
+        Function to get the Postgres column type of each DataFrame column
+        :param df: DataFrame
+        :param dtypes: dict of column name to sqlalchemy type, columns not in dtypes are inferred from the DataFrame.
+            Columns holding bools are BOOLEAN whatever their dtype, as their values are not valid input for others
+        :return: dict of column name to Postgres type name
+        """
+        dtypes = dtypes or {}
+        column_types = {}
+        for column in df.columns:
+            if pd.api.types.is_bool_dtype(df[column]):
+                column_types[column] = "BOOLEAN"
+            elif column in dtypes:
+                column_types[column] = dtypes[column].compile(dialect=postgresql.dialect())
+            elif pd.api.types.is_integer_dtype(df[column]):
+                column_types[column] = "BIGINT"
+            elif pd.api.types.is_float_dtype(df[column]):
+                column_types[column] = "FLOAT(53)"
+            elif pd.api.types.is_datetime64_any_dtype(df[column]):
+                column_types[column] = "TIMESTAMP"
+            else:
+                column_types[column] = "TEXT"
+        return column_types
+
+    def get_copy_buffer(self, df, column_types):
+        """
+        Function to get the rows of a DataFrame in the COPY text format
+        :param df: DataFrame
+        :param column_types: dict of column name to Postgres type name
+        :return: StringIO buffer
+        """
+        return self.lines_to_buffer(self.get_copy_lines(self.get_copy_columns(df, column_types)))
+
+    def get_copy_columns(self, df, column_types):
+        """
+        Function to get the values of each DataFrame column in the COPY text format
+        :param df: DataFrame
+        :param column_types: dict of column name to Postgres type name
+        :return: dict of column name to Series of str
+        """
+        columns = {}
+        for column, sql_type in column_types.items():
+            series = df[column]
+            if sql_type == "BIGINT" and pd.api.types.is_float_dtype(series):
+                # integer columns with missing values are held as floats by pandas
+                series = series.astype("Int64")
+            nulls = series.isna()
+            if pd.api.types.is_numeric_dtype(series):
+                text = series.astype(str)
+            else:
+                text = series.map(self.format_copy_value)
+            columns[column] = text.mask(nulls, r"\N")
+        return columns
+
+    @staticmethod
+    def get_copy_lines(copy_columns):
+        """
+        Function to join the COPY text format columns into rows
+        :param copy_columns: dict of column name to Series of str
+        :return: list of str
+        """
+        return list(map("\t".join, zip(*copy_columns.values())))
+
+    @staticmethod
+    def lines_to_buffer(lines):
+        buffer = io.StringIO()
+        buffer.writelines(f"{line}\n" for line in lines)
+        buffer.seek(0)
+        return buffer
+
+    def write_df_to_table_incremental(
+        self, df, table, schema=None, dtypes=None, partition_column=None, cursor=None
+    ):
+        """
+        Method to update a table with the contents of a DataFrame, writing only the partitions that changed since
+        the last incremental write. The rows are partitioned by partition_column, typically the controller key,
+        and a fingerprint of each partition is stored in the fingerprint table. Changed partitions are deleted and
+        copied in again, partitions no longer in the DataFrame are deleted. The table is rewritten in full if it
+        does not exist or its column types have changed
+        :param df: DataFrame to write
+        :param table: table name
+        :param schema: schema name, defaults to the connection schema
+        :param dtypes: dict of column name to sqlalchemy type
+        :param partition_column: column to partition the rows by, the table is a single partition if None
+        :param cursor: cursor of an open transaction, a new transaction is used if None
+        :return: number of partitions written or deleted
+        """
+        if cursor is None:
+            with self.transaction() as cursor:
+                return self.write_df_to_table_incremental(df, table, schema, dtypes, partition_column, cursor)
         if schema is None:
             schema = self.schema
-        df.to_sql(
-            table, con=self.engine, if_exists="replace", index=False, schema=schema, dtype=dtypes
+        if partition_column not in df.columns:
+            partition_column = None
+        column_types = self.get_column_types(df, dtypes)
+        copy_columns = self.get_copy_columns(df, column_types)
+        lines = self.get_copy_lines(copy_columns)
+        partition_keys = copy_columns[partition_column] if partition_column else [""] * len(lines)
+        partition_lines = defaultdict(list)
+        for partition_key, line in zip(partition_keys, lines):
+            partition_lines[partition_key].append(line)
+        # rows are sorted so the fingerprint does not depend on the order of the collection
+        fingerprints = {
+            partition_key: hashlib.sha1("\n".join(sorted(rows)).encode()).hexdigest()
+            for partition_key, rows in partition_lines.items()
+        }
+        definition_fingerprint = hashlib.sha1(repr(list(column_types.items())).encode()).hexdigest()
+
+        fingerprint_table_name = f'"{schema}"."{self.FINGERPRINT_TABLE_NAME}"'
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {fingerprint_table_name} "
+            f"(table_name TEXT, partition_key TEXT, fingerprint TEXT)"
+        )
+        cursor.execute(
+            f"SELECT partition_key, fingerprint FROM {fingerprint_table_name} WHERE table_name = %s", (table,)
+        )
+        stored_fingerprints = dict(cursor.fetchall())
+        table_name = f'"{schema}"."{table}"'
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (table_name,))
+        table_exists = cursor.fetchall()[0][0]
+        if stored_fingerprints.pop(None, None) != definition_fingerprint or not table_exists:
+            self.write_df_to_table(df, table, schema, dtypes, cursor)
+            cursor.execute(f"DELETE FROM {fingerprint_table_name} WHERE table_name = %s", (table,))
+            self.insert_fingerprints(cursor, fingerprint_table_name, table, fingerprints, definition_fingerprint)
+            return len(fingerprints)
+
+        changed_keys = [
+            partition_key
+            for partition_key, fingerprint in fingerprints.items()
+            if stored_fingerprints.get(partition_key) != fingerprint
+        ]
+        removed_keys = [partition_key for partition_key in stored_fingerprints if partition_key not in fingerprints]
+        if not changed_keys and not removed_keys:
+            return 0
+        if partition_column:
+            cursor.execute(
+                f"DELETE FROM {table_name} WHERE COALESCE(\"{partition_column}\"::text, %s) = ANY(%s)",
+                (r"\N", changed_keys + removed_keys),
+            )
+        else:
+            cursor.execute(f"DELETE FROM {table_name}")
+        changed_lines = [line for key in changed_keys for line in partition_lines[key]]
+        if changed_lines:
+            column_names = ", ".join(f'"{column}"' for column in column_types)
+            cursor.copy_expert(
+                f"COPY {table_name} ({column_names}) FROM STDIN", self.lines_to_buffer(changed_lines)
+            )
+        cursor.execute(
+            f"DELETE FROM {fingerprint_table_name} WHERE table_name = %s AND partition_key = ANY(%s)",
+            (table, changed_keys + removed_keys),
         )
+        self.insert_fingerprints(
+            cursor, fingerprint_table_name, table, {key: fingerprints[key] for key in changed_keys}
+        )
+        return len(changed_keys) + len(removed_keys)
+
+    def insert_fingerprints(self, cursor, fingerprint_table_name, table, fingerprints, definition_fingerprint=None):
+        """
+        Method to insert partition fingerprints into the fingerprint table
+        :param cursor: cursor of an open transaction
+        :param fingerprint_table_name: qualified name of the fingerprint table
+        :param table: name of the table the fingerprints belong to
+        :param fingerprints: dict of partition key to fingerprint
+        :param definition_fingerprint: fingerprint of the table column types, stored with a null partition key
+        :return: None
+        """
+        lines = [
+            "\t".join(self.format_copy_value(value) for value in (table, partition_key, fingerprint))
+            for partition_key, fingerprint in fingerprints.items()
+        ]
+        if definition_fingerprint:
+            lines.append(f"{self.format_copy_value(table)}\t\\N\t{definition_fingerprint}")
+        if lines:
+            cursor.copy_expert(
+                f"COPY {fingerprint_table_name} (table_name, partition_key, fingerprint) FROM STDIN",
+                self.lines_to_buffer(lines),
+            )
+
+    @staticmethod
+    def format_copy_value(value):
+        """
+        Function to format a value in the COPY text format, lists are formatted as array literals
+        :param value: value to format
+        :return: str
+        """
+        if isinstance(value, (list, tuple)):
+            elements = (str(element).replace("\\", "\\\\").replace('"', '\\"') for element in value)
+            value = "{" + ",".join(f'"{element}"' for element in elements) + "}"
+        return (
+            str(value)
+            .replace("\\", "\\\\")
+            .replace("\t", "\\t")
+            .replace("\n", "\\n")
+            .replace("\r", "\\r")
+        )
+
+    def read_query_to_df(self, sql_query):
+        """
+        Function to read the result of a query to a DataFrame using a pooled connection
+        :param sql_query: SELECT query
+        :return: DataFrame
+        """
+        with self.transaction() as cursor:
+            cursor.execute(sql_query)
+            columns = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+        return pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+
+    def prefetch_tables(self, table_names, schema=None):
+        """
+        Method to read tables of a schema concurrently over the connection pool. The tables are held until they are
+        read by read_table_to_df, so the collections can then be built one after another without waiting on the
+        database. Tables that do not exist in the schema are skipped
+        :param table_names: list of names of the tables to read
+        :param schema: schema name, defaults to the connection schema
+        :return: None
+        """
+        if not schema:
+            schema = self.schema
+        existing_table_names = {
+            row[0]
+            for row in self.execute_sql(
+                f"SELECT table_name FROM information_schema.tables WHERE table_schema = '{schema}'",
+                return_data=True,
+            )
+        }
+        table_names = [table_name for table_name in dict.fromkeys(table_names) if table_name in existing_table_names]
+        with ThreadPoolExecutor(max_workers=self.max_connections) as executor:
+            dfs = executor.map(
+                self.read_query_to_df,
+                [f'SELECT * FROM "{schema}"."{table_name}"' for table_name in table_names],
+            )
+            for table_name, df in zip(table_names, dfs):
+                self.prefetched_tables[(schema, table_name)] = df
 
     def read_table_to_df(self, table, schema=None, to_dict=False):
         if not schema:
             schema = self.schema
-        table_exists = self.table_exists(schema, table)
-        if table_exists:
-            df = pd.read_sql_query(f"SELECT * FROM {schema}.{table}", con=self.engine)
+        if (schema, table) in self.prefetched_tables:
+            df = self.prefetched_tables.pop((schema, table))
+        elif self.table_exists(schema, table):
+            df = self.read_query_to_df(f'SELECT * FROM "{schema}"."{table}"')
         else:
             df = pd.DataFrame()
         if to_dict:
@@ -3,6 +3,8 @@ import glob
 import json
 from datetime import datetime, timedelta
 
+import numpy as np
+
 
 def load_json_to_dict(json_file_path) -> dict:
     """
@@ -107,6 +109,18 @@ def list_to_txt(data, file_path):
             file.write(str(row) + "\n")
 
 
+def text_to_file(text, file_path, newline=None):
+    """
+    Method to write rendered text to a file with a single buffered write
+    :param text: str file contents
+    :param file_path: output file path
+    :param newline: newline translation of the file object, "" to write line endings unchanged
+    :return: None
+    """
+    with open(file_path, "w", newline=newline) as file:
+        file.write(text)
+
+
 def str_to_int(value) -> int | float | None:
     """
     Function to convert numeric strings to int or float
@@ -152,6 +166,28 @@ def clean_site_number(site_number) -> str:
     return f"{parts[0]}/{parts[1][-3:]}"
 
 
+def round_preserving_row_totals(values) -> np.ndarray:
+    """
+    Function to round each row of a 2D array to whole numbers while maintaining the row total, using the largest
+    remainder method. Values are rounded half to even, then the values with the largest rounding differences, first
+    column first for equal differences, are adjusted by one until the rounded total matches the original total
+    truncated to a whole number. NaNs are ignored and returned as NaN
+    :param values: 2D array of floats
+    :return: 2D array of rounded floats
+    """
+    values = np.asarray(values, dtype=float)
+    nans = np.isnan(values)
+    rounded = np.rint(values)
+    original_totals = np.trunc(np.round(np.nansum(values, axis=1), 4))
+    differences = original_totals - np.nansum(rounded, axis=1)
+    remainders = np.where(nans, -np.inf, np.abs(values - rounded))
+    order = np.argsort(-remainders, axis=1, kind="stable")
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(values.shape[1])[None, :], axis=1)
+    adjust = (ranks < np.abs(differences)[:, None]) & ~nans
+    return rounded + adjust * np.sign(differences)[:, None]
+
+
 def read_fixed_width_file(file_path, column_widths):
     """
     Function to read a text file with fixed width columns
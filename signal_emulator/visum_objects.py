@@ -1,11 +1,13 @@
+import csv
+import io
 import os
-from copy import copy
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
+from operator import attrgetter
 from pathlib import Path
 from typing import Optional
 
 from signal_emulator.controller import BaseCollection, BaseItem
-from signal_emulator.utilities.utility_functions import list_to_csv
+from signal_emulator.parallel_exporter import ParallelExporter
 
 
 class VisumCollection(BaseCollection):
@@ -16,60 +18,122 @@ class VisumCollection(BaseCollection):
         [],
     ]
     COLUMNS = {}
+    # attributes the rows of a time period net file are sorted by
+    SORT_COLUMNS = ()
     VISUM_TABLE_NAME = None
 
     def __init__(self, item_data, signal_emulator, output_directory):
+        # time period id to dict of key to item, in the order of self.data. Created before the base constructor, which
+        # indexes the initial items
+        self.data_by_time_period_id = {}
         super().__init__(
             item_data=item_data
         )
         self.signal_emulator = signal_emulator
         self.output_directory = output_directory
+        # getters of the net file row and sort values of an item, compiled once rather than per value
+        self.row_getter = attrgetter(*self.COLUMNS.values()) if self.COLUMNS else None
+        self.sort_getter = attrgetter(*self.SORT_COLUMNS) if self.SORT_COLUMNS else None
+
+    @staticmethod
+    def get_time_period_id(item):
+        # items without a time period, such as signal groups with timings of every period, are partitioned under None
+        return getattr(item, "time_period_id", None)
+
+    def add_to_index(self, item):
+        self.data_by_time_period_id.setdefault(self.get_time_period_id(item), {})[item.get_key()] = item
+
+    def remove_from_index(self, item):
+        time_period_id = self.get_time_period_id(item)
+        items = self.data_by_time_period_id[time_period_id]
+        del items[item.get_key()]
+        if not items:
+            del self.data_by_time_period_id[time_period_id]
 
     def export_all_to_net_files(self, output_path=None):
         if not output_path:
-            output_path = os.path.join(
-                self.output_directory,
-                f"VISUM_{self.VISUM_TABLE_NAME}_ALL.net",
-            )
-        output_data = copy(self.OUTPUT_HEADER)
-        output_data.append(self.add_column_header())
-        for item in self:
-            output_data.append([getattr(item, attr_name) for attr_name in self.COLUMNS.values()])
-        Path(output_path).parent.mkdir(exist_ok=True, parents=True)
-        list_to_csv(output_data, output_path, delimiter=";")
-        self.signal_emulator.logger.info(
-            f"VISUM {self.VISUM_TABLE_NAME} output to net file: {output_path}"
+            output_path = self.get_net_output_path()
+        self.write_net_file_to_path(output_path)
+
+    def export_to_net_files(self, time_periods=None, processes=None):
+        """
+        Method to export a net file for each time period. Files are rendered in a process pool if processes is
+        greater than 1
+        :param time_periods: list of TimePeriod, all time periods if None
+        :param processes: number of worker processes, defaults to the SignalEmulator processes
+        :return: None
+        """
+        ParallelExporter(self.signal_emulator, processes).export_net_files(
+            [self.TABLE_NAME], time_periods, include_all_periods=False
         )
 
-    def export_to_net_files(self, time_periods=None):
-        if time_periods is None:
-            time_periods = self.signal_emulator.time_periods.get_all()
-        for time_period in time_periods:
-            self.export_to_net_file(time_period)
-
     def export_to_net_file(self, time_period, output_path=None):
         if not output_path:
-            output_path = os.path.join(
-                self.output_directory,
-                f"VISUM_{self.VISUM_TABLE_NAME}_{time_period.name}.net",
-            )
-        output_data = []
-        for item in self:
-            if item.time_period_id == time_period.name:
-                output_data.append([getattr(item, attr_name) for attr_name in self.COLUMNS.values()])
-        if self.TABLE_NAME == "visum_signal_groups":
-            output_data = sorted(output_data, key=lambda k: (k[0], k[1]))
-        elif self.TABLE_NAME == "visum_signal_controllers":
-            output_data = sorted(output_data, key=lambda k: k[0])
-        else:
-            raise ValueError
-        output_data = copy(self.OUTPUT_HEADER) + [self.add_column_header()] + output_data
+            output_path = self.get_net_output_path(time_period.name)
+        self.write_net_file_to_path(output_path, time_period.name)
+
+    def write_net_file_to_path(self, output_path, time_period_id=None):
         Path(output_path).parent.mkdir(exist_ok=True, parents=True)
-        list_to_csv(output_data, output_path, delimiter=";")
+        with open(output_path, "w", newline="") as net_file:
+            self.write_net_file(net_file, time_period_id)
         self.signal_emulator.logger.info(
             f"VISUM {self.VISUM_TABLE_NAME} output to net file: {output_path}"
         )
 
+    def get_net_output_path(self, time_period_id=None):
+        return os.path.join(self.output_directory, f"VISUM_{self.VISUM_TABLE_NAME}_{time_period_id or 'ALL'}.net")
+
+    def render_net_file(self, time_period_id=None):
+        """
+        Function to render a VISUM net file, see write_net_file
+        :param time_period_id: time period id, all items if None
+        :return: str net file contents
+        """
+        net_file = io.StringIO()
+        self.write_net_file(net_file, time_period_id)
+        return net_file.getvalue()
+
+    def write_net_file(self, net_file, time_period_id=None):
+        """
+        Method to write a VISUM net file of the items of a time period, sorted by SORT_COLUMNS, or of all items.
+        Rows are streamed to the file object as they are generated, so no list of rows is built
+        :param net_file: text file object, opened with newline=""
+        :param time_period_id: time period id, all items if None
+        :return: None
+        """
+        writer = csv.writer(net_file, delimiter=";")
+        writer.writerows(self.OUTPUT_HEADER)
+        writer.writerow(self.add_column_header())
+        writer.writerows(map(self.row_getter, self.get_net_file_items(time_period_id)))
+
+    def get_net_file_items(self, time_period_id=None):
+        """
+        Function to get the items of a net file, in the order they are written
+        :param time_period_id: time period id, all items if None
+        :return: iterable of items
+        """
+        if time_period_id is None:
+            return iter(self)
+        self.validate_net_file_time_period_id(time_period_id)
+        return sorted(self.data_by_time_period_id.get(time_period_id, {}).values(), key=self.sort_getter)
+
+    def validate_net_file_time_period_id(self, time_period_id):
+        """
+        Method to check that a net file can be exported for a time period, the items must have a time period and
+        the collection SORT_COLUMNS
+        :param time_period_id: time period id, None for the net file of all time periods
+        :return: None
+        """
+        if time_period_id is None:
+            return
+        if not any(field.name == "time_period_id" for field in fields(self.ITEM_CLASS)):
+            raise ValueError(
+                f"Collection: {self.__class__.__name__} items have no time period, only the net file of all time "
+                f"periods can be exported"
+            )
+        if self.sort_getter is None:
+            raise ValueError(f"Collection: {self.__class__.__name__} has no SORT_COLUMNS for time period net files")
+
     def add_column_header(self):
         return [
             a if i > 0 else f"${self.VISUM_TABLE_NAME}:{a}" for i, a in enumerate(self.COLUMNS.keys())
@@ -151,6 +215,7 @@ class VisumSignalGroups(VisumCollection):
         "PHASE_TERMINATION_TYPE": "phase_termination_type",
         "PHASE_APPEARANCE_TYPE": "phase_appearance_type"
     }
+    SORT_COLUMNS = ("signal_controller_number", "phase_number")
     VISUM_TABLE_NAME = "SIGNALGROUP"
 
     def __init__(self, item_data, signal_emulator, output_directory):
@@ -172,7 +237,7 @@ class VisumSignalGroups(VisumCollection):
             source_data=phase_timing.signal_emulator.run_datestamp,
             signal_emulator=self.signal_emulator
         )
-        self.data[visum_signal_group.get_key()] = visum_signal_group
+        self.add_instance(visum_signal_group)
 
 
 @dataclass(eq=False)
@@ -240,17 +305,21 @@ class VisumSignalControllers(VisumCollection):
     ITEM_CLASS = VisumSignalController
     TABLE_NAME = "visum_signal_controllers"
     WRITE_TO_DATABASE = True
+    SORT_COLUMNS = ("signal_controller_number",)
     VISUM_TABLE_NAME = "SIGNALCONTROL"
 
     def __init__(self, item_data, signal_emulator, output_directory, sld_directory, timing_sheet_directory):
+        # signal controller number to dict of key to VisumSignalController, in the order of self.data. Created before
+        # the base constructor, which indexes the initial items
+        self.data_by_signal_controller_number = {}
         super().__init__(
             item_data=item_data,
             signal_emulator=signal_emulator,
             output_directory=output_directory
         )
         self.signal_emulator = signal_emulator
-        self.sld_directory = Path(sld_directory)
-        self.timing_sheet_directory = Path(timing_sheet_directory)
+        self.sld_directory = Path(sld_directory) if sld_directory else None
+        self.timing_sheet_directory = Path(timing_sheet_directory) if timing_sheet_directory else None
 
     def add_visum_signal_controller(self, controller_key, name, cycle_time, time_period_id, source_data, mode):
         signal_controller = VisumSignalController(
@@ -265,4 +334,24 @@ class VisumSignalControllers(VisumCollection):
             cycle_time_pm=None,
             mode=mode
         )
-        self.data[signal_controller.get_key()] = signal_controller
+        self.add_instance(signal_controller)
+
+    def add_to_index(self, item):
+        super().add_to_index(item)
+        self.data_by_signal_controller_number.setdefault(item.signal_controller_number, {})[item.get_key()] = item
+
+    def remove_from_index(self, item):
+        super().remove_from_index(item)
+        signal_controllers = self.data_by_signal_controller_number[item.signal_controller_number]
+        del signal_controllers[item.get_key()]
+        if not signal_controllers:
+            del self.data_by_signal_controller_number[item.signal_controller_number]
+
+    def get_by_signal_controller_number(self, signal_controller_number):
+        """
+        Function to get the first VisumSignalController with a signal controller number
+        :param signal_controller_number: int signal controller number
+        :return: VisumSignalController or None
+        """
+        signal_controllers = self.data_by_signal_controller_number.get(signal_controller_number)
+        return next(iter(signal_controllers.values())) if signal_controllers else None
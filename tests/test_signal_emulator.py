@@ -1,9 +1,29 @@
+import gzip
 import os
+import re
+import threading
+from operator import attrgetter
 
+import numpy as np
+import pandas as pd
 import pytest
+import sqlalchemy
 
+from signal_emulator.controller import PhaseTiming
+from signal_emulator.emulation_context import EmulationContext
 from signal_emulator.emulator import SignalEmulator
-from signal_emulator.utilities.utility_functions import load_json_to_dict, clean_site_number
+from signal_emulator.file_parsers.signal_event_parser import SignalEventParser
+from signal_emulator.parallel_exporter import ParallelExporter
+from signal_emulator.saturn_objects import PhaseToSaturnTurn, SaturnSignalGroup
+from signal_emulator.utilities.fixed_width_decoder import decode_fixed_width_file
+from signal_emulator.utilities.log_file_reader import find_log_files, iter_log_file_lines
+from signal_emulator.utilities.postgres_connection import PostgresConnection
+from signal_emulator.utilities.utility_functions import (
+    load_json_to_dict,
+    clean_site_number,
+    round_preserving_row_totals,
+)
+from signal_emulator.visum_objects import VisumSignalController
 
 
 @pytest.fixture(scope="module")
@@ -85,3 +105,755 @@ def test_stage_sequence(
 )
 def test_clean_site_number(site_number_input, expected_output):
     assert clean_site_number(site_number_input) == expected_output
+
+
+@pytest.mark.parametrize(
+    "plan_path, timing_sheet_path",
+    [
+        ("tests/resources/plans/j00004.pln", "tests/resources/timing_sheets/00_000004_Junc.csv"),
+        ("tests/resources/plans/j03193.pln", "tests/resources/timing_sheets/03_000193_Junc.csv"),
+    ],
+)
+def test_parallel_emulation_matches_serial(plan_path, timing_sheet_path):
+    phase_timings = []
+    for processes in (1, 2):
+        signal_emulator = SignalEmulator(
+            config=load_json_to_dict(json_file_path="tests/resources/signal_emulator_empty_config.json")
+        )
+        signal_emulator.load_timing_sheet_csv(timing_sheet_path)
+        signal_emulator.load_plan_from_pln(plan_path)
+        signal_emulator.generate_signal_plans(processes=processes)
+        signal_emulator.generate_phase_timings(processes=processes)
+        phase_timings.append(
+            {pt.get_key(): (pt.start_time, pt.end_time) for pt in signal_emulator.phase_timings}
+        )
+    assert len(phase_timings[0]) > 0
+    assert phase_timings[0] == phase_timings[1]
+
+
+def test_emulation_contexts_are_independent(signal_emulator):
+    signal_emulator.load_timing_sheet_csv("tests/resources/timing_sheets/03_000193_Junc.csv")
+    signal_emulator.load_plan_from_pln("tests/resources/plans/j03193.pln")
+    stream = signal_emulator.streams.get_by_key(("J03/193", 0))
+    plan = signal_emulator.plans.get_by_key((stream.site_number, 3))
+    am_context = EmulationContext(time_period_id="AM")
+    pm_context = EmulationContext(time_period_id="PM")
+    am_sequence = plan.get_stage_sequence(set(), stream, context=am_context)
+    pm_sequence = plan.get_stage_sequence(set(), stream, context=pm_context)
+    assert [ssi.stage.stage_number for ssi in am_sequence] == [1, 2, 3, 4, 5]
+    assert [ssi.stage.stage_number for ssi in pm_sequence] == [1, 2, 3, 4, 5]
+    am_context.set_active_stage_key(stream, ("J03/193", 2))
+    assert pm_context.get_active_stage_key(stream) != am_context.get_active_stage_key(stream)
+    assert signal_emulator.time_periods.active_period_id is None
+
+
+def test_interstage_table_matches_phase_lookups(signal_emulator):
+    signal_emulator.load_timing_sheet_csv("tests/resources/timing_sheets/00_000004_Junc.csv")
+    controller = signal_emulator.controllers.get_by_key("J00/004")
+    context = EmulationContext(time_period_id="AM")
+    table = signal_emulator.interstage_tables.get_table("J00/004", context=context)
+    for end_stage in controller.stages:
+        for start_stage in controller.stages:
+            end_phases = signal_emulator.stages.get_end_phases(end_stage, start_stage)
+            start_phases = signal_emulator.stages.get_start_phases(end_stage, start_stage)
+            expected_interstage_time = 0
+            for start_phase in start_phases:
+                max_start_time = 0
+                for end_phase in end_phases:
+                    end_phase_delay = signal_emulator.phase_delays.get_delay_time_by_stage_and_phase_keys(
+                        "J00/004", end_stage.stage_number, start_stage.stage_number, end_phase.phase_ref
+                    )
+                    intergreen = signal_emulator.intergreens.get_intergreen_time_by_phase_keys(
+                        "J00/004", end_phase.phase_ref, start_phase.phase_ref
+                    )
+                    start_phase_delay = signal_emulator.phase_delays.get_delay_time_by_stage_and_phase_keys(
+                        "J00/004", end_stage.stage_number, start_stage.stage_number, start_phase.phase_ref
+                    )
+                    max_start_time = max(max_start_time, end_phase_delay + intergreen, start_phase_delay)
+                assert (
+                    table.get_max_start_time(end_stage.stage_number, start_stage.stage_number, start_phase.phase_ref)
+                    == max_start_time
+                )
+                expected_interstage_time = max(expected_interstage_time, max_start_time)
+            assert (
+                table.get_interstage_time(end_stage.stage_number, start_stage.stage_number)
+                == expected_interstage_time
+            )
+
+
+def test_interstage_table_invalidated_by_modified_intergreen(signal_emulator):
+    signal_emulator.load_timing_sheet_csv("tests/resources/timing_sheets/00_000004_Junc.csv")
+    context = EmulationContext(time_period_id="AM")
+    controller = signal_emulator.controllers.get_by_key("J00/004")
+    intergreen = next(ig for ig in controller.intergreens if ig.intergreen_time > 1)
+    table = signal_emulator.interstage_tables.get_table("J00/004", context=context)
+    signal_emulator.modified_intergreens.add_item(
+        {
+            "controller_key": intergreen.controller_key,
+            "end_phase_key": intergreen.end_phase_key,
+            "start_phase_key": intergreen.start_phase_key,
+            "time_period_id": "AM",
+            "intergreen_time": 1,
+            "original_time": intergreen.intergreen_time,
+        },
+        signal_emulator=signal_emulator,
+    )
+    modified_table = signal_emulator.interstage_tables.get_table("J00/004", context=context)
+    assert modified_table is not table
+    assert (
+        modified_table.intergreen_times[
+            modified_table.phase_index[intergreen.end_phase_key], modified_table.phase_index[intergreen.start_phase_key]
+        ]
+        == 1
+    )
+    assert intergreen.get_modified_intergreen_time(context) == 1
+    assert intergreen.get_modified_intergreen_time(EmulationContext(time_period_id="PM")) == intergreen.intergreen_time
+    signal_emulator.modified_intergreens.remove_by_key(intergreen.get_key() + ("AM",))
+
+
+
+def test_interstage_table_invalidated_by_intergreen(signal_emulator):
+    signal_emulator.load_timing_sheet_csv("tests/resources/timing_sheets/00_000004_Junc.csv")
+    context = EmulationContext(time_period_id="AM")
+    controller = signal_emulator.controllers.get_by_key("J00/004")
+    intergreen = next(ig for ig in controller.intergreens if ig.intergreen_time > 1)
+    table = signal_emulator.interstage_tables.get_table("J00/004", context=context)
+    unmodified_table = signal_emulator.interstage_tables.get_table("J00/004", modified=False)
+    signal_emulator.intergreens.remove_by_key(intergreen.get_key())
+    assert signal_emulator.interstage_tables.get_table("J00/004", context=context) is not table
+    assert signal_emulator.interstage_tables.get_table("J00/004", modified=False) is not unmodified_table
+    table = signal_emulator.interstage_tables.get_table("J00/004", context=context)
+    assert table.intergreen_times[
+        table.phase_index[intergreen.end_phase_key], table.phase_index[intergreen.start_phase_key]
+    ] == 0
+    signal_emulator.intergreens.add_instance(intergreen)
+    table = signal_emulator.interstage_tables.get_table("J00/004", context=context)
+    assert table.intergreen_times[
+        table.phase_index[intergreen.end_phase_key], table.phase_index[intergreen.start_phase_key]
+    ] == intergreen.intergreen_time
+
+def test_linked_references_invalidated_on_load(signal_emulator):
+    signal_emulator.load_timing_sheet_csv("tests/resources/timing_sheets/00_000004_Junc.csv")
+    signal_emulator.link_objects()
+    stream = signal_emulator.streams.get_by_key(("J00/004", 0))
+    stages_in_stream = stream.stages_in_stream
+    assert stream.stages_in_stream is stages_in_stream
+    signal_emulator.load_timing_sheet_csv("tests/resources/timing_sheets/00_000004_Junc.csv")
+    reloaded_stream = signal_emulator.streams.get_by_key(("J00/004", 0))
+    assert reloaded_stream is not stream
+    assert reloaded_stream.controller.streams[0] is reloaded_stream
+    assert [stage.stage_number for stage in reloaded_stream.stages_in_stream] == [
+        stage.stage_number for stage in stages_in_stream
+    ]
+    assert all(
+        stage is signal_emulator.stages.get_by_key(stage.get_key()) for stage in reloaded_stream.stages_in_stream
+    )
+
+
+def test_phase_timings_are_slotted(signal_emulator):
+    phase_timing = PhaseTiming(
+        signal_emulator=signal_emulator,
+        controller_key="J00/004",
+        site_id="J00/004",
+        phase_ref="A",
+        index=0,
+        time_period_id="AM",
+        start_time=0,
+        end_time=10,
+    )
+    assert not hasattr(phase_timing, "__dict__")
+    signal_emulator.phase_timings.add_instance(phase_timing)
+    phase_timings = signal_emulator.phase_timings.get_by_controller_key_phase_ref_time_period_id(
+        "J00/004", "A", "AM"
+    )
+    assert phase_timings[-1] is phase_timing
+    signal_emulator.phase_timings.remove_by_key(phase_timing.get_key())
+
+
+
+def test_replaced_phase_timing_is_reindexed(signal_emulator):
+    phase_timings = [
+        PhaseTiming(
+            signal_emulator=signal_emulator,
+            controller_key="J00/004",
+            site_id="J00/004",
+            phase_ref="B",
+            index=0,
+            time_period_id="AM",
+            start_time=start_time,
+            end_time=start_time + 10,
+        )
+        for start_time in (0, 5)
+    ]
+    for phase_timing in phase_timings:
+        signal_emulator.phase_timings.add_instance(phase_timing)
+    assert signal_emulator.phase_timings.get_by_controller_key_phase_ref_time_period_id("J00/004", "B", "AM") == [
+        phase_timings[1]
+    ]
+    signal_emulator.phase_timings.remove_by_key(phase_timings[1].get_key())
+    assert signal_emulator.phase_timings.get_by_controller_key_phase_ref_time_period_id("J00/004", "B", "AM") == []
+
+def test_collection_to_dataframe(signal_emulator):
+    signal_emulator.load_timing_sheet_csv("tests/resources/timing_sheets/00_000004_Junc.csv")
+    df = signal_emulator.phases.to_dataframe()
+    assert list(df.columns) == [
+        "controller_key",
+        "phase_ref",
+        "min_time",
+        "phase_type_str",
+        "appearance_type_int",
+        "termination_type_int",
+        "text",
+        "associated_phase_ref",
+    ]
+    assert len(df) == len(signal_emulator.phases)
+    phase = signal_emulator.phases.get_by_key(("J00/004", "A"))
+    row = df[(df["controller_key"] == "J00/004") & (df["phase_ref"] == "A")].iloc[0]
+    assert row["min_time"] == phase.min_time
+    assert row["text"] == phase.text
+
+
+def test_collection_to_arrow(signal_emulator):
+    pytest.importorskip("pyarrow")
+    signal_emulator.load_timing_sheet_csv("tests/resources/timing_sheets/00_000004_Junc.csv")
+    table = signal_emulator.stages.to_arrow()
+    assert table.num_rows == len(signal_emulator.stages)
+    assert str(table.schema.field("stage_number").type) == "int64"
+    assert table.column("controller_key").to_pylist() == [
+        stage.controller_key for stage in signal_emulator.stages
+    ]
+
+
+class RecordingCursor:
+    """
+    Stand-in for a psycopg2 cursor that records the statements and COPY data
+    """
+
+    def __init__(self):
+        self.statements = []
+        self.copy_data = None
+
+    def execute(self, sql_query):
+        self.statements.append(sql_query)
+
+    def copy_expert(self, sql_query, buffer):
+        self.statements.append(sql_query)
+        self.copy_data = buffer.read()
+
+
+def test_write_to_database_uses_copy():
+    signal_emulator = SignalEmulator(
+        config=load_json_to_dict(json_file_path="tests/resources/signal_emulator_empty_config.json")
+    )
+    signal_emulator.load_timing_sheet_csv("tests/resources/timing_sheets/00_000004_Junc.csv")
+    signal_emulator.load_plan_from_pln("tests/resources/plans/j00004.pln")
+    signal_emulator.generate_signal_plans()
+    signal_emulator.generate_phase_timings()
+    signal_emulator.generate_visum_signal_groups()
+    signal_emulator.generate_saturn_signal_groups()
+    postgres_connection = PostgresConnection.__new__(PostgresConnection)
+    postgres_connection.schema = "signal_emulator"
+    signal_emulator.postgres_connection = postgres_connection
+    value_patterns = {
+        "BIGINT": re.compile(r"-?\d+"),
+        "BOOLEAN": re.compile(r"True|False"),
+        "FLOAT(53)": re.compile(r"-?(\d+(\.\d*)?(e[-+]\d+)?|nan|inf)"),
+    }
+    rows_by_table_name = {}
+    for collection in signal_emulator.base_collection_iterator():
+        if not collection.WRITE_TO_DATABASE or len(collection) == 0:
+            continue
+        cursor = RecordingCursor()
+        collection.write_to_database(cursor=cursor)
+        drop_table, create_table, copy = cursor.statements
+        assert drop_table == f'DROP TABLE IF EXISTS "signal_emulator"."{collection.TABLE_NAME}"'
+        assert copy.startswith(f'COPY "signal_emulator"."{collection.TABLE_NAME}"')
+        column_types = re.findall(r'"(\w+)" ([A-Z]+(?:\(\d+\))?(?:\[\])?)', create_table)
+        rows = [line.split("\t") for line in cursor.copy_data.splitlines()]
+        assert len(rows) == len(collection)
+        assert len(column_types) == len(rows[0])
+        rows_by_table_name[collection.TABLE_NAME] = rows
+        for index, (column, sql_type) in enumerate(column_types):
+            if sql_type not in value_patterns:
+                continue
+            for row in rows:
+                assert row[index] == r"\N" or value_patterns[sql_type].fullmatch(row[index]), (
+                    f"{collection.TABLE_NAME}.{column} {sql_type} value: {row[index]}"
+                )
+    assert {"stages", "signal_plan_stages", "phase_timings", "visum_signal_groups"} <= set(rows_by_table_name)
+    stage_rows = rows_by_table_name["stages"]
+    stage = next(iter(signal_emulator.stages))
+    assert stage_rows[0][:2] == [stage.controller_key, str(stage.stage_number)]
+    assert "{" + ",".join(f'"{phase_key}"' for phase_key in stage.phase_keys_in_stage) + "}" in stage_rows[0]
+
+
+def test_copy_buffer_formats_nulls_and_escapes():
+    df = pd.DataFrame({"a": [1, None], "b": ["x\ty", None], "c": [0.5, 1.5]})
+    column_types = PostgresConnection.get_column_types(df, {"a": sqlalchemy.types.BigInteger()})
+    assert column_types == {"a": "BIGINT", "b": "TEXT", "c": "FLOAT(53)"}
+    buffer = PostgresConnection.__new__(PostgresConnection).get_copy_buffer(df, column_types)
+    assert buffer.read() == "1\tx\\ty\t0.5\n\\N\t\\N\t1.5\n"
+
+
+class StandInDatabase:
+    """
+    Stand-in for a psycopg2 connection pool serving canned tables, counts the connections in use
+    """
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.connections_in_use = 0
+        self.statements = []
+
+    def getconn(self):
+        self.connections_in_use += 1
+        return self
+
+    def putconn(self, connection):
+        self.connections_in_use -= 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def cursor(self):
+        return StandInCursor(self)
+
+
+class StandInCursor:
+    def __init__(self, database):
+        self.database = database
+        self.description = None
+        self.result = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, sql_query):
+        self.database.statements.append(sql_query)
+        if "information_schema" in sql_query:
+            self.description = [("table_name",)]
+            self.result = [(table_name,) for table_name in self.database.tables]
+        else:
+            table_name = sql_query.split(".")[-1].strip('"')
+            self.description = [(column,) for column in self.database.tables[table_name][0]]
+            self.result = self.database.tables[table_name][1]
+
+    def fetchall(self):
+        return self.result
+
+
+def test_prefetched_tables_are_read_without_querying():
+    stand_in_database = StandInDatabase(
+        {
+            "time_periods": (["name", "index"], [("AM", 1), ("PM", 3)]),
+            "stages": (["controller_key", "stage_number"], [("J00/004", 1)]),
+        }
+    )
+    postgres_connection = PostgresConnection.__new__(PostgresConnection)
+    postgres_connection.schema = "signal_emulator"
+    postgres_connection.max_connections = 2
+    postgres_connection._pool = stand_in_database
+    postgres_connection._pool_lock = threading.Lock()
+    postgres_connection.prefetched_tables = {}
+    postgres_connection.prefetch_tables(["time_periods", "controllers"])
+    assert len(stand_in_database.statements) == 2
+    assert stand_in_database.connections_in_use == 0
+    assert ("signal_emulator", "stages") not in postgres_connection.prefetched_tables
+    records = postgres_connection.read_table_to_df("time_periods", to_dict=True)
+    assert records == [{"name": "AM", "index": 1}, {"name": "PM", "index": 3}]
+    assert len(stand_in_database.statements) == 2
+    assert ("signal_emulator", "time_periods") not in postgres_connection.prefetched_tables
+
+
+class FingerprintingCursor:
+    """
+    Stand-in for a psycopg2 cursor that holds the fingerprint table in memory and records the other statements
+    """
+
+    def __init__(self):
+        self.fingerprint_rows = []
+        self.statements = []
+        self.copied_lines = []
+        self.result = None
+
+    def execute(self, sql_query, params=None):
+        if "export_fingerprints" not in sql_query:
+            self.statements.append((sql_query, params))
+            self.result = [(True,)]
+        elif sql_query.startswith("SELECT"):
+            self.result = [row[1:] for row in self.fingerprint_rows if row[0] == params[0]]
+        elif sql_query.startswith("DELETE"):
+            self.fingerprint_rows = [
+                row
+                for row in self.fingerprint_rows
+                if row[0] != params[0] or (len(params) > 1 and row[1] not in params[1])
+            ]
+
+    def fetchall(self):
+        return self.result
+
+    def copy_expert(self, sql_query, buffer):
+        lines = buffer.read().splitlines()
+        if "export_fingerprints" in sql_query:
+            for line in lines:
+                table, partition_key, fingerprint = line.split("\t")
+                self.fingerprint_rows.append((table, None if partition_key == r"\N" else partition_key, fingerprint))
+        else:
+            self.copied_lines = lines
+
+
+def test_incremental_write_to_database(signal_emulator):
+    signal_emulator.load_timing_sheet_csv("tests/resources/timing_sheets/00_000004_Junc.csv")
+    signal_emulator.load_timing_sheet_csv("tests/resources/timing_sheets/03_000193_Junc.csv")
+    postgres_connection = PostgresConnection.__new__(PostgresConnection)
+    postgres_connection.schema = "signal_emulator"
+    signal_emulator.postgres_connection = postgres_connection
+    cursor = FingerprintingCursor()
+    signal_emulator.phases.write_to_database(cursor=cursor, incremental=True)
+    assert len(cursor.copied_lines) == len(signal_emulator.phases)
+
+    cursor.copied_lines = []
+    signal_emulator.phases.write_to_database(cursor=cursor, incremental=True)
+    assert cursor.copied_lines == []
+
+    signal_emulator.phases.get_by_key(("J00/004", "A")).min_time += 1
+    for phase_key in [key for key in signal_emulator.phases.data if key[0] == "J03/193"]:
+        signal_emulator.phases.remove_by_key(phase_key)
+    cursor.statements = []
+    signal_emulator.phases.write_to_database(cursor=cursor, incremental=True)
+    assert {line.split("\t")[0] for line in cursor.copied_lines} == {"J00/004"}
+    delete_sql, (_, deleted_keys) = cursor.statements[-1]
+    assert delete_sql.startswith('DELETE FROM "signal_emulator"."phases"')
+    assert sorted(deleted_keys) == ["J00/004", "J03/193"]
+
+
+@pytest.mark.parametrize(
+    "values, expected_values",
+    [
+        ([[1.4, 1.4, 1.2, np.nan]], [[2, 1, 1, np.nan]]),
+        ([[2.5, 2.5], [3.5, 0.5]], [[3, 2], [4, 0]]),
+        ([[10.6, 10.6, 10.8]], [[10, 11, 11]]),
+        ([[np.nan, np.nan]], [[np.nan, np.nan]]),
+    ],
+)
+def test_round_preserving_row_totals(values, expected_values):
+    rounded_values = round_preserving_row_totals(values)
+    np.testing.assert_array_equal(rounded_values, expected_values)
+
+
+def test_m37_label_periods_includes_boundaries(signal_emulator):
+    m37_data = pd.DataFrame(
+        {
+            "timestamp": pd.to_datetime(["2023-05-10 07:59:59", "2023-05-10 09:00:00", "2023-05-10 16:00:00"]),
+            "node_id": "N00/004",
+            "site_id": "J00/004",
+            "utc_stage_id": "G1",
+            "intergreen_time": 5,
+            "green_time": 20,
+        }
+    ).set_index("timestamp")
+    m37_labelled = signal_emulator.m37s.label_periods(m37_data)
+    assert list(m37_labelled["period_id"]) == ["AM", "OP", "PM"]
+    assert list(m37_labelled["green_time"]) == [20, 20, 20]
+
+
+def test_m37_chunked_aggregation_matches_in_memory(signal_emulator, tmp_path, monkeypatch):
+    m37_data = pd.DataFrame(
+        {
+            "timestamp": pd.date_range("2023-05-10 07:55:00", "2023-05-10 16:05:00", freq="37s"),
+            "node_id": "N00/004",
+            "site_id": "J00/004",
+        }
+    )
+    m37_data["utc_stage_id"] = ["G1", "G2", "G3"] * (len(m37_data) // 3) + ["G1"] * (len(m37_data) % 3)
+    m37_data["intergreen_time"] = 5
+    m37_data["green_time"] = m37_data.index % 40
+    m37_data.iloc[:400].to_csv(tmp_path / "m37_1.csv", index=False)
+    m37_data.iloc[400:].to_csv(tmp_path / "m37_2.csv", index=False)
+    m37s = signal_emulator.m37s
+    monkeypatch.setattr(m37s, "CHUNK_SIZE", 150)
+    monkeypatch.setattr(m37s, "MAX_PARTIAL_AGGREGATES", 2)
+    chunked_aggregates = m37s.aggregate_all_m37_in_directory(tmp_path).reset_index()
+    in_memory_aggregates = m37s.aggregate_stage_times(m37s.load_all_m37_in_directory_df(tmp_path)).reset_index()
+    key_dtypes = {key: object for key in m37s.STAGE_KEYS}
+    assert len(chunked_aggregates) == 9
+    pd.testing.assert_frame_equal(chunked_aggregates.astype(key_dtypes), in_memory_aggregates.astype(key_dtypes))
+
+
+def test_decode_fixed_width_file_matches_read_fwf(tmp_path):
+    lsg_path = tmp_path / "test.lsg"
+    lsg_path.write_text(
+        "HEADER\n"
+        "08:00:01  M37 J00/004  12  -3\r\n"
+        "08:00:02  M16 N00/004   7\n"
+        "08:00:05  M37 J00/005   9\n"
+        "08:00:09  M37 J00/006\n"
+    )
+    column_limits = [(0, 8), (10, 13), (14, 21), (22, 25), (26, 30)]
+    column_names = ["timestamp", "message_id", "site_id", "green_time", "offset"]
+    decoded = decode_fixed_width_file(
+        lsg_path,
+        column_limits=column_limits,
+        column_names=column_names,
+        column_types={"timestamp": "time", "site_id": "str", "green_time": "int", "offset": "int"},
+        filter_column="message_id",
+        filter_value="M37",
+        header_rows=[0],
+    )
+    expected = pd.read_fwf(lsg_path, colspecs=column_limits, names=column_names, skiprows=[0])
+    expected = expected[expected["message_id"] == "M37"].reset_index(drop=True)
+    assert list(decoded) == ["timestamp", "site_id", "green_time", "offset"]
+    assert (decoded["timestamp"] == pd.to_timedelta(expected["timestamp"]).values).all()
+    assert list(decoded["site_id"]) == list(expected["site_id"])
+    pd.testing.assert_series_equal(
+        pd.Series(decoded["green_time"], name="green_time"), expected["green_time"].astype("Int64")
+    )
+    pd.testing.assert_series_equal(pd.Series(decoded["offset"], name="offset"), expected["offset"].astype("Int64"))
+
+
+@pytest.mark.parametrize("block_size", [5, 64, 1 << 22])
+def test_log_file_lines_match_for_plain_and_gzip_files(tmp_path, block_size):
+    lines = ["MAY102023,08:00:01.2,J00/004", "", "MAY102023,08:00:02.4,J00/005\r", "£ last line without newline"]
+    plain_path = tmp_path / "test.csv"
+    plain_path.write_bytes("\n".join(lines).encode())
+    gzip_path = tmp_path / "test.csv.gz"
+    gzip_path.write_bytes(gzip.compress(plain_path.read_bytes()))
+    expected = [line.rstrip("\r") for line in lines]
+    assert list(iter_log_file_lines(plain_path, block_size=block_size)) == expected
+    assert list(iter_log_file_lines(gzip_path, block_size=block_size)) == expected
+    assert list(iter_log_file_lines(gzip_path, block_size=block_size, prefetch=False)) == expected
+    assert find_log_files(tmp_path, "csv") == [str(plain_path), str(gzip_path)]
+
+
+def test_m16_modal_cycle_times(signal_emulator, monkeypatch):
+    m16s = signal_emulator.m16s
+    monkeypatch.setattr(m16s, "get_region_id", lambda node_id, time_period_id: "0001")
+    monkeypatch.setattr(
+        m16s,
+        "m16_raw_df",
+        pd.DataFrame(
+            {
+                "timestamp": pd.to_datetime(["2023-05-10 08:00:00"] * 7 + ["2023-05-10 09:30:00"]),
+                "node_id": ["N00/001"] * 3 + ["N00/002"] * 2 + ["N00/003"] * 3,
+                "node_cycle_time": [48, 48, 96, 60, 32, 120, 120, 40],
+            }
+        ),
+        raising=False,
+    )
+    modal_cycle_times = m16s.calculate_modal_cycle_times()
+    # 09:30 is outside all periods, the N00/002 tie is resolved to the smallest cycle time
+    assert modal_cycle_times["node_cycle_time"].tolist() == [48, 32, 120]
+    assert modal_cycle_times["region_cycle_time"].tolist() == [120, 120, 120]
+    assert modal_cycle_times["cycle_time_independent"].tolist() == [True, True, False]
+
+
+def test_m37_aggregate_cache_reads_only_modified_files(signal_emulator, tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    m37_path = tmp_path / "m37"
+    m37_path.mkdir()
+    m37_data = pd.DataFrame(
+        {
+            "timestamp": pd.date_range("2023-05-10 07:55:00", "2023-05-10 16:05:00", freq="37s"),
+            "node_id": "N00/004",
+            "site_id": "J00/004",
+            "utc_stage_id": "G1",
+            "intergreen_time": 5,
+        }
+    )
+    m37_data["green_time"] = m37_data.index % 40
+    m37_data.iloc[:400].to_csv(m37_path / "m37_1.csv", index=False)
+    m37_data.iloc[400:].to_csv(m37_path / "m37_2.csv", index=False)
+    m37s = signal_emulator.m37s
+    monkeypatch.setattr(m37s, "cache_path", tmp_path / "cache")
+    uncached_aggregates = m37s.aggregate_all_m37_in_directory(m37_path)
+    read_file_paths = []
+    read_m37_csv_file_chunks = m37s.read_m37_csv_file_chunks
+
+    def recording_read_m37_csv_file_chunks(file_path):
+        read_file_paths.append(os.path.basename(file_path))
+        return read_m37_csv_file_chunks(file_path)
+
+    monkeypatch.setattr(m37s, "read_m37_csv_file_chunks", recording_read_m37_csv_file_chunks)
+    pd.testing.assert_frame_equal(m37s.aggregate_all_m37_in_directory(m37_path), uncached_aggregates)
+    assert read_file_paths == []
+    m37_data.iloc[400:500].to_csv(m37_path / "m37_2.csv", index=False)
+    m37s.aggregate_all_m37_in_directory(m37_path)
+    assert read_file_paths == ["m37_2.csv"]
+
+
+def test_m37_signal_event_aggregates_match_converted_m37s(signal_emulator, tmp_path):
+    m37s = signal_emulator.m37s
+    SignalEventParser().process_signal_event_folder("tests/resources/signal_events", tmp_path)
+    pd.testing.assert_frame_equal(
+        m37s.aggregate_signal_events_in_directory("tests/resources/signal_events"),
+        m37s.aggregate_all_m37_in_directory(tmp_path),
+    )
+
+
+def test_rgs_export_stage_records(tmp_path):
+    signal_emulator = SignalEmulator(
+        config=load_json_to_dict(json_file_path="tests/resources/signal_emulator_empty_config.json")
+    )
+    signal_emulator.visum_signal_controllers.add_instance(
+        VisumSignalController("J00/004", "J00/004", 60, "AM", "test", "VA", signal_emulator, cycle_time_am=60)
+    )
+    for phase_ref, saturn_a_node, saturn_c_node in (("A", 1, 2), ("B", 3, 4)):
+        signal_emulator.phase_to_saturn_turns.add_instance(
+            PhaseToSaturnTurn(signal_emulator, "00/004", phase_ref, 1, saturn_a_node, 100, saturn_c_node)
+        )
+    # phase A wraps around the end of the cycle
+    for phase_name, green_time_start, green_time_end in (("A", 50, 20), ("B", 25, 45)):
+        signal_emulator.saturn_signal_groups.add_instance(
+            SaturnSignalGroup(4, 1, phase_name, green_time_start, green_time_end, "AM")
+        )
+    rgs_path = tmp_path / "test.rgs"
+    signal_emulator.saturn_signal_groups.export_to_rgs_file(signal_emulator.time_periods.get_by_key("AM"), rgs_path)
+    assert rgs_path.read_text().splitlines()[3:] == [
+        "* LoHAM P6 Signal. UTC:4",
+        "  100         3    2    5   60",
+        "             20    5    2    3    4",
+        "             30    5    2    1    2",
+        "",
+    ]
+
+
+def test_saturn_lookup_indexes_follow_collection_changes():
+    signal_emulator = SignalEmulator(
+        config=load_json_to_dict(json_file_path="tests/resources/signal_emulator_empty_config.json")
+    )
+    phase_to_saturn_turns = signal_emulator.phase_to_saturn_turns
+    for phase_ref, turn, saturn_b_node in (("A", 1, 100), ("A", 2, 100), ("B", 1, 200)):
+        phase_to_saturn_turns.add_instance(
+            PhaseToSaturnTurn(signal_emulator, "00/004", phase_ref, turn, turn, saturn_b_node, turn + 10)
+        )
+    assert phase_to_saturn_turns.get_saturn_b_nodes(4) == [100, 200]
+    assert phase_to_saturn_turns.get_saturn_turns(4, 100) == {"A": [[1, 11], [2, 12]]}
+    phase_to_saturn_turns.remove_by_key(("00/004", "B", 200, 1))
+    assert phase_to_saturn_turns.get_saturn_b_nodes(4) == [100]
+    assert phase_to_saturn_turns.get_saturn_turns(4, 200) == {}
+    visum_signal_controllers = signal_emulator.visum_signal_controllers
+    visum_signal_controllers.add_visum_signal_controller("J00/004", "J00/004", 60, "AM", "test", "VA")
+    assert visum_signal_controllers.get_by_signal_controller_number(4).controller_key == "J00/004"
+    visum_signal_controllers.remove_by_key("J00/004")
+    assert visum_signal_controllers.get_by_signal_controller_number(4) is None
+
+
+def test_parallel_export_matches_serial(tmp_path):
+    signal_emulator = SignalEmulator(
+        config=load_json_to_dict(json_file_path="tests/resources/signal_emulator_empty_config.json")
+    )
+    signal_emulator.load_timing_sheet_csv("tests/resources/timing_sheets/00_000004_Junc.csv")
+    signal_emulator.load_plan_from_pln("tests/resources/plans/j00004.pln")
+    signal_emulator.generate_signal_plans()
+    signal_emulator.generate_phase_timings()
+    signal_emulator.generate_visum_signal_groups()
+    signal_emulator.generate_saturn_signal_groups()
+    signal_emulator.visum_signal_controllers.add_instance(
+        VisumSignalController(
+            "J00/004", "J00/004", 88, "AM", "test", "VA", signal_emulator,
+            cycle_time_am=88, cycle_time_op=96, cycle_time_pm=104,
+        )
+    )
+    for turn, phase in enumerate(signal_emulator.controllers.get_by_key("J00/004").phases):
+        signal_emulator.phase_to_saturn_turns.add_instance(
+            PhaseToSaturnTurn(signal_emulator, "00/004", phase.phase_ref, 1, turn, 100 + turn % 2, turn + 50)
+        )
+    output_files = []
+    for processes in (1, 2):
+        output_directory = tmp_path / str(processes)
+        signal_emulator.saturn_signal_groups.output_directory = output_directory
+        signal_emulator.visum_signal_groups.output_directory = output_directory
+        exporter = ParallelExporter(signal_emulator, processes)
+        exporter.run(
+            exporter.get_rgs_export_files() + exporter.get_net_export_files(["visum_signal_groups"], [None])
+        )
+        output_files.append({path.name: path.read_text() for path in output_directory.iterdir()})
+    assert len(output_files[0]) == 4
+    assert output_files[0] == output_files[1]
+
+
+def test_visum_net_file_time_period_partitions(tmp_path):
+    signal_emulator = SignalEmulator(
+        config=load_json_to_dict(json_file_path="tests/resources/signal_emulator_empty_config.json")
+    )
+    visum_signal_controllers = signal_emulator.visum_signal_controllers
+    visum_signal_controllers.COLUMNS = {"NO": "signal_controller_number", "NAME": "name"}
+    visum_signal_controllers.row_getter = attrgetter(*visum_signal_controllers.COLUMNS.values())
+    for controller_key, time_period_id in (("J03/193", "AM"), ("J00/004", "OP"), ("J00/004", "AM"), ("J01/001", "PM")):
+        visum_signal_controllers.add_visum_signal_controller(
+            controller_key, controller_key, 60, time_period_id, "test", "VA"
+        )
+    visum_signal_controllers.remove_by_key("J01/001")
+    assert {
+        time_period_id: list(items) for time_period_id, items in visum_signal_controllers.data_by_time_period_id.items()
+    } == {"AM": ["J03/193", "J00/004"]}
+    net_path = tmp_path / "test.net"
+    visum_signal_controllers.export_to_net_file(signal_emulator.time_periods.get_by_key("AM"), net_path)
+    assert net_path.read_text().splitlines()[4:] == ["$SIGNALCONTROL:NO;NAME", "4;J00/004", "3193;J03/193"]
+    with pytest.raises(ValueError):
+        signal_emulator.visum_signal_groups.get_net_file_items("AM")
+    with pytest.raises(ValueError):
+        ParallelExporter(signal_emulator).export_net_files(["visum_signal_groups"])
+
+
+def test_linsig_multi_scenario_file_shares_controller_sections():
+    signal_emulator = SignalEmulator(
+        config=load_json_to_dict(json_file_path="tests/resources/signal_emulator_empty_config.json")
+    )
+    signal_emulator.load_timing_sheet_csv("tests/resources/timing_sheets/00_000004_Junc.csv")
+    signal_emulator.load_plan_from_pln("tests/resources/plans/j00004.pln")
+    signal_emulator.generate_signal_plans()
+    controller = signal_emulator.controllers.get_by_key("J00/004")
+    single_plan_lines = [
+        signal_emulator.linsig.render_lsg_v236(signal_plan).splitlines() for signal_plan in controller.signal_plans
+    ]
+    assert list(signal_emulator.linsig.controller_sections) == ["J00/004"]
+    multi_scenario_lines = signal_emulator.linsig.render_multi_scenario_lsg_v236(controller.signal_plans).splitlines()
+    controller_sections = signal_emulator.linsig.controller_sections["J00/004"]
+    for lines in single_plan_lines + [multi_scenario_lines]:
+        assert set(controller_sections["phases"]) <= set(lines)
+    assert [line[:10] for line in multi_scenario_lines if line.startswith("SGPLN")] == [
+        "SGPLN    1", "SGPLN    2", "SGPLN    3"
+    ]
+    assert [line for line in multi_scenario_lines if line.startswith("TIMPD")] == [
+        "TIMPD    1    1    1    1¬", "TIMPD    2    2    2    1¬", "TIMPD    3    3    3    1¬"
+    ]
+
+
+def test_linsig_multi_scenario_file_requires_same_modified_intergreens():
+    signal_emulator = SignalEmulator(
+        config=load_json_to_dict(json_file_path="tests/resources/signal_emulator_empty_config.json")
+    )
+    signal_emulator.load_timing_sheet_csv("tests/resources/timing_sheets/00_000004_Junc.csv")
+    signal_emulator.load_plan_from_pln("tests/resources/plans/j00004.pln")
+    signal_emulator.generate_signal_plans()
+    controller = signal_emulator.controllers.get_by_key("J00/004")
+    intergreen = next(ig for ig in controller.intergreens if ig.intergreen_time > 1)
+    intergreen_line = (
+        f"INGRN{str(intergreen.end_phase.phase_number).rjust(5)}{str(intergreen.start_phase.phase_number).rjust(5)}"
+    )
+    for time_period_id in ("PM", "AM", "OP"):
+        signal_emulator.modified_intergreens.add_item(
+            {
+                "controller_key": intergreen.controller_key,
+                "end_phase_key": intergreen.end_phase_key,
+                "start_phase_key": intergreen.start_phase_key,
+                "time_period_id": time_period_id,
+                "intergreen_time": 1,
+                "original_time": intergreen.intergreen_time,
+            },
+            signal_emulator=signal_emulator,
+        )
+        if time_period_id == "PM":
+            with pytest.raises(ValueError):
+                signal_emulator.linsig.render_multi_scenario_lsg_v236(controller.signal_plans)
+            pm_signal_plan = next(sp for sp in controller.signal_plans if sp.time_period_id == "PM")
+            assert f"{intergreen_line}    1" in signal_emulator.linsig.render_lsg_v236(pm_signal_plan).splitlines()
+    multi_scenario_lines = signal_emulator.linsig.render_multi_scenario_lsg_v236(controller.signal_plans).splitlines()
+    assert [line for line in multi_scenario_lines if line.startswith(intergreen_line)] == [f"{intergreen_line}    1"]
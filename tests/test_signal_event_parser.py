@@ -1,10 +1,14 @@
+import filecmp
 import os
+import shutil
 
 import pandas as pd
 import pytest
 from pytz import UTC
 
-from signal_emulator.file_parsers.signal_event_parser import SignalEventParser
+from signal_emulator.enums import Cell
+from signal_emulator.file_parsers.sad_parser import SADParser
+from signal_emulator.file_parsers.signal_event_parser import CustomDatetime, SignalEventParser
 
 
 @pytest.fixture(scope="module")
@@ -85,3 +89,114 @@ def test_signal_event_parser_end_to_end(signal_event_parser):
     averaged_df.sort_values(by="green_abs_diff", ascending=False, inplace=True)
     # overall pass rate of 97%
     assert pass_rate > 0.97
+
+
+@pytest.mark.parametrize("output_format", ["csv", "parquet"])
+def test_process_sad_file_writes_m37s_in_time_order(signal_event_parser, tmp_path, output_format):
+    """
+    Test that M37s are written in time order when the SAD lines are ordered by site within each file
+    :param signal_event_parser: signal event parser object
+    :param tmp_path: pytest temporary directory
+    :param output_format: M37 output file format
+    :return: None
+    """
+    if output_format == "parquet":
+        pytest.importorskip("pyarrow")
+    header = (
+        "junction_id,timestamp,type,OTU,RP,TP,stage,Start_Stage,Control_Status,Group_Region,UCYT,NCYT,Error,"
+        "stage_length"
+    )
+    events_by_file = [
+        [
+            ("00/001", "08:00:00", 0),
+            ("00/001", "08:00:05", 1),
+            ("00/001", "08:00:30", 0),
+            ("00/001", "08:00:35", 2),
+            ("00/002", "08:00:01", 0),
+            ("00/002", "08:00:03", 1),
+            ("00/002", "08:00:20", 0),
+        ],
+        [("00/001", "08:05:10", 0)],
+    ]
+    file_paths = []
+    for file_index, events in enumerate(events_by_file):
+        file_path = tmp_path / f"sad_{file_index}.csv"
+        file_path.write_text(
+            "\n".join(
+                [header]
+                + [
+                    f"{site_id},2023-05-10 {time}, JUN,1,G1,G1,{stage},1,2,1,120,120,0,10"
+                    for site_id, time, stage in events
+                ]
+            )
+        )
+        file_paths.append(str(file_path))
+    signal_event_parser.process_sad_file(
+        Cell.CNTR,
+        signal_event_parser.get_csv_file_objects_from_paths(file_paths),
+        CustomDatetime(2023, 5, 10),
+        tmp_path,
+        output_format,
+    )
+    if output_format == "parquet":
+        m37_df = pd.read_parquet(tmp_path / "M37_20230510_CNTR.parquet")
+    else:
+        m37_df = pd.read_csv(tmp_path / "M37_20230510_CNTR.csv", dtype={"site_id": str}, parse_dates=["timestamp"])
+    assert m37_df["timestamp"].dt.strftime("%H:%M:%S").tolist() == ["08:00:21", "08:00:31", "08:05:11"]
+    assert m37_df["site_id"].tolist() == ["00/002", "00/001", "00/001"]
+    assert m37_df["green_time"].tolist() == [17, 25, 275]
+    assert m37_df["interstage_time"].tolist() == [2, 5, 5]
+
+
+def test_process_signal_event_folder_in_parallel(signal_event_parser, tmp_path):
+    """
+    Test that each cell and date is converted as an independent task by the process pool
+    :param signal_event_parser: signal event parser object
+    :param tmp_path: pytest temporary directory
+    :return: None
+    """
+    signal_event_folder = tmp_path / "signal_events"
+    signal_event_folder.mkdir()
+    for cell_name in ("CNTR", "NORT"):
+        for file_time in ("0800", "0805"):
+            shutil.copy(
+                f"tests/resources/signal_events/MAY102023_{file_time}_CNTR.csv",
+                signal_event_folder / f"MAY102023_{file_time}_{cell_name}.csv",
+            )
+    summaries = signal_event_parser.process_signal_event_folder(signal_event_folder, tmp_path, processes=2)
+    assert [(summary.cell, summary.num_files) for summary in summaries] == [(Cell.CNTR, 2), (Cell.NORT, 2)]
+    assert summaries[0].num_m37s == summaries[1].num_m37s > 0
+    assert filecmp.cmp(summaries[0].output_path, summaries[1].output_path, shallow=False)
+
+
+def test_process_unzipped_sad_file_to_output_folder(signal_event_parser, tmp_path):
+    """
+    Test that a single SAD file is converted into the given output folder
+    :param signal_event_parser: signal event parser object
+    :param tmp_path: pytest temporary directory
+    :return: None
+    """
+    sad_path = tmp_path / "MAY102023_0800_CNTRA.csv"
+    shutil.copy("tests/resources/signal_events/MAY102023_0800_CNTR.csv", sad_path)
+    num_lines, num_m37s = signal_event_parser.process_unzipped_sad_file(str(sad_path), output_folder=tmp_path)
+    assert num_lines > 0
+    assert num_m37s > 0
+    assert os.path.exists(tmp_path / "M37_20230510_CNTR.csv")
+
+
+def test_sad_parser_processes_folder_in_parallel(tmp_path):
+    """
+    Test that the SAD parser converts each cell and date with the signal event task runner
+    :param tmp_path: pytest temporary directory
+    :return: None
+    """
+    sad_folder = tmp_path / "sad"
+    sad_folder.mkdir()
+    events = [("08:00:00", ""), ("08:00:05", "G1"), ("08:00:20", ""), ("08:00:25", "G2"), ("08:00:40", "")]
+    for cell_name in ("CNTRA", "NORTB"):
+        (sad_folder / f"MAY102023_0800_{cell_name}.csv").write_text(
+            "\n".join(["header"] + [f"00/001,{event_time}, JUN,1,1,{stage}" for event_time, stage in events])
+        )
+    summaries = SADParser().process_zipped_sad_folder(sad_folder, tmp_path, processes=2)
+    assert [(summary.cell, summary.num_m37s) for summary in summaries] == [(Cell.CNTR, 2), (Cell.NORT, 2)]
+    assert filecmp.cmp(summaries[0].output_path, summaries[1].output_path, shallow=False)